@@ -1,11 +1,60 @@
+import asyncio
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from .database import run_db
+from .persistence import message_buffer
+from .utils import mark_read, with_unread_counts
+
+
+def load_history(room_name, limit, before_timestamp=None, before_id=None, after_id=None):
+    """
+    取房间中 (before_timestamp, before_id) 之前最近的 limit 条消息，按时间正序返回
+    使用 (room, timestamp) 索引，只读取一页，不随房间中的消息总数变慢
+    after_id 不为空时只取 id 大于 after_id 的消息（断线重连时客户端缺少的部分）
+    :return: (消息列表, 是否还有更早的消息)
+    """
+    from apps.chat.models import Message
+    messages = Message.objects.filter(room__room_name=room_name)
+    if after_id is not None:
+        messages = messages.filter(id__gt=after_id)
+    if before_id is not None:
+        if before_timestamp is None:
+            before_timestamp = Message.objects.filter(id=before_id).values_list('timestamp', flat=True).first()
+        if before_timestamp is not None:
+            messages = messages.filter(Q(timestamp__lt=before_timestamp) | Q(timestamp=before_timestamp, id__lt=before_id))
+    # 多取一条判断是否还有更早的消息
+    page = list(messages.order_by('-timestamp', '-id').values('id', 'content', 'timestamp', 'sender_id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    # 将 datetime 转换为字符串
+    for message in page:
+        message['timestamp'] = message['timestamp'].isoformat()
+    return page, has_more
+
+
+def read_state(room_name, user_id):
+    """:return: (已读位置, 未读数)"""
+    from apps.chat.models import ChatRoom
+    room = with_unread_counts(ChatRoom.objects.filter(room_name=room_name), user_id).values('last_read_id', 'unread_count').first()
+    if room is None:
+        return 0, 0
+    return room['last_read_id'], room['unread_count']
+
+
+def mark_room_read(room, user_id, message_id):
+    """:return: (已读位置, 未读数)"""
+    mark_read(room, user_id, message_id)
+    return read_state(room.room_name, user_id)
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        from apps.chat.models import ChatRoom, Message
+        from apps.chat.models import ChatRoom
         from apps.accounts.models import User
         from apps.sales.models import Item
         # 判断是买家和卖家的房间还是系统房间
@@ -16,11 +65,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.item_id = int(url_route['item_id'])
             buyer_email = url_route['buyer_email']
 
-            # 使用 sync_to_async 获取 seller_id 和 buyer_id
+            # 获取 seller_id 和 buyer_id
             try:
-                item = await sync_to_async(Item.objects.get)(id=self.item_id)
-                self.seller_id = await sync_to_async(lambda: item.user.id)()
-                self.buyer = await sync_to_async(User.objects.get)(email=buyer_email)
+                item = await run_db(Item.objects.get, id=self.item_id)
+                self.seller_id = item.user_id
+                self.buyer = await run_db(User.objects.get, email=buyer_email)
                 self.buyer_id = self.buyer.id
                 self.room_group_name = f"room_{self.item_id}_{self.seller_id}_{self.buyer_id}"
             except Item.DoesNotExist:
@@ -52,19 +101,88 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
-        # 加载历史聊天记录
-        messages = await sync_to_async(list)(
-            Message.objects.filter(room__room_name=self.room_group_name)
-            .order_by('timestamp')
-            .values('content', 'timestamp', 'sender_id')
-        )
-        # 将 datetime 转换为字符串
-        for message in messages:
-            message['timestamp'] = message['timestamp'].isoformat()
+        # 房间和当前用户在连接时取一次并缓存，收到消息时不再查询
+        # 已登录用户（AuthMiddlewareStack）作为发送者并记录已读位置
+        self.room = await run_db(ChatRoom.objects.filter(room_name=self.room_group_name).first)
+        user = self.scope.get('user')
+        self.user = user if user is not None and user.is_authenticated else None
+        self.reader_id = self.user.id if self.user is not None else None
 
-        await self.send(text_data=json.dumps({
+        # 客户端重连时在 query string 中带上已收到的最后一条消息 id（?last_seen_id=123），只发送之后的新消息；
+        # 新消息超过一页时只发送最近的一页，has_more 表示中间还有缺失，可继续 load_more
+        # 否则只发送最近的一页历史聊天记录，更早的消息由客户端通过 load_more 按需加载
+        last_seen_id = self.last_seen_id()
+        # 本进程缓冲中尚未写入的消息先写入，历史记录才完整
+        await message_buffer.flush()
+        if last_seen_id is not None:
+            load = run_db(load_history, self.room_group_name, settings.CHAT_HISTORY_MAX_PAGE_SIZE, after_id=last_seen_id)
+        else:
+            load = run_db(load_history, self.room_group_name, settings.CHAT_HISTORY_PAGE_SIZE)
+        if self.reader_id is not None:
+            # 历史记录和已读状态在线程池中同时查询
+            (messages, has_more), (last_read_id, unread_count) = await asyncio.gather(
+                load, run_db(read_state, self.room_group_name, self.reader_id)
+            )
+        else:
+            messages, has_more = await load
+        history = {
             'type': 'history',
-            'messages': messages
+            'messages': messages,
+            'has_more': has_more,
+            'last_seen_id': last_seen_id,
+        }
+        if self.reader_id is not None:
+            history['last_read_id'], history['unread_count'] = last_read_id, unread_count
+        await self.send(text_data=json.dumps(history))
+
+    def last_seen_id(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return int(query['last_seen_id'][0])
+        except (KeyError, ValueError):
+            return None
+
+    async def mark_read(self, text_data_json):
+        """
+        将已读位置前移到 message_id，请求：{"command": "mark_read", "message_id": 123}
+        """
+        if self.reader_id is None:
+            await self.send(text_data=json.dumps({'type': 'error', 'message': 'User is not logged in'}))
+            return
+        try:
+            message_id = int(text_data_json['message_id'])
+        except (KeyError, TypeError, ValueError):
+            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Invalid mark_read request'}))
+            return
+        if self.room is None:
+            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Chat room does not exist'}))
+            return
+        last_read_id, unread_count = await run_db(mark_room_read, self.room, self.reader_id, message_id)
+        await self.send(text_data=json.dumps({
+            'type': 'read_cursor',
+            'last_read_id': last_read_id,
+            'unread_count': unread_count
+        }))
+
+    async def load_more(self, text_data_json):
+        """
+        加载更早的消息，游标为客户端已有的最早一条消息的 id（和 timestamp，可省略）
+        请求：{"command": "load_more", "before_id": 123, "before_timestamp": "...", "limit": 50}
+        """
+        try:
+            before_id = int(text_data_json['before_id'])
+            limit = int(text_data_json.get('limit') or settings.CHAT_HISTORY_PAGE_SIZE)
+        except (KeyError, TypeError, ValueError):
+            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Invalid load_more request'}))
+            return
+        limit = max(1, min(limit, settings.CHAT_HISTORY_MAX_PAGE_SIZE))
+        before_timestamp = text_data_json.get('before_timestamp')
+        before_timestamp = parse_datetime(before_timestamp) if isinstance(before_timestamp, str) else None
+        messages, has_more = await run_db(load_history, self.room_group_name, limit, before_timestamp, before_id)
+        await self.send(text_data=json.dumps({
+            'type': 'more_history',
+            'messages': messages,
+            'has_more': has_more
         }))
 
     async def disconnect(self, close_code):
@@ -73,37 +191,49 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        # 写入缓冲中的消息
+        await message_buffer.flush()
 
     async def receive(self, text_data):
         from apps.chat.models import ChatRoom, Message
-        from apps.accounts.models import User
-        from apps.sales.models import Item
         # 接收来自 WebSocket 的消息
         text_data_json = json.loads(text_data)
+        if text_data_json.get('command') == 'load_more':
+            await self.load_more(text_data_json)
+            return
+        if text_data_json.get('command') == 'mark_read':
+            await self.mark_read(text_data_json)
+            return
         message = text_data_json['message']
-        sender_id = text_data_json['sender_id']
         # print(f"[DEBUG] Received message: {message} from sender_id: {sender_id}")
-        # print(f"[DEBUG] Sender ID: {sender_id}")
         try:
-            # 获取发送者
-            # print(f"[DEBUG] Fetching sender with ID: {sender_id}")
-            try:
-                sender = await sync_to_async(User.objects.get)(id=sender_id)
-            except User.DoesNotExist:
-                # print(f"[ERROR] User with id {sender_id} does not exist")
+            if self.room is None:
+                # 连接时房间尚未创建
+                self.room = await run_db(ChatRoom.objects.get, room_name=self.room_group_name)
+            sender_id, error = self.sender_id()
+            if sender_id is None:
+                await self.send(text_data=json.dumps({'type': 'error', 'message': error}))
                 return
 
-            # print(f"[DEBUG] Sender found: {sender.email}")
-
-            # 获取房间
-            # print(f"[DEBUG] Fetching room with name: {self.room_group_name}")
-            room = await sync_to_async(ChatRoom.objects.get)(room_name=self.room_group_name)
-            # print(f"[DEBUG] Room found: {room.room_name}")
+            if settings.CHAT_PERSISTENCE_MODE == 'batched':
+                # 先广播，消息放入写缓冲后批量写入；写入前还没有 id
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    {
+                        'type': 'chat_message',
+                        'message': message,
+                        'sender_id': sender_id,
+                        'message_id': None
+                    }
+                )
+                await message_buffer.add(Message(room=self.room, sender_id=sender_id, content=message))
+                return
 
-            # 保存消息到数据库
-            saved_message = await sync_to_async(Message.objects.create)(
-                room=room,
-                sender=sender,
+            # 保存消息到数据库，房间和发送者都已缓存，只有一次插入
+            saved_message = await run_db(
+                Message.objects.create,
+                room=self.room,
+                sender_id=sender_id,
                 content=message
             )
             # print(f"[DEBUG] Message saved to database: {saved_message.content} in room: {room.room_name}")
@@ -114,20 +244,34 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 {
                     'type': 'chat_message',
                     'message': message,
-                    'sender_id': sender_id
+                    'sender_id': sender_id,
+                    'message_id': saved_message.id
                 }
             )
         except Exception as e:
             print(f"[ERROR] Failed to process message: {e}")
 
+    def sender_id(self):
+        """
+        以 scope['user'] 为发送者，忽略客户端传来的 sender_id；未登录或不是房间成员时不能发送
+        :return: (发送者 id, 错误信息)
+        """
+        if self.user is None:
+            return None, 'User is not logged in'
+        if self.user.id not in (self.room.seller_id, self.room.buyer_id):
+            return None, 'User is not a member of this chat room'
+        return self.user.id, None
+
     async def chat_message(self, event):
         # 接收来自房间组的消息
         message = event['message']
         sender_id = event.get('sender_id', None)
         # print(f"[DEBUG] Broadcasting message: {message} from sender_id: {sender_id} to WebSocket")
         # 将消息发送到 WebSocket
+        # message_id 用于客户端记录已收到的最后一条消息，重连时作为 last_seen_id
         await self.send(text_data=json.dumps({
             'type': 'message',
             'message': message,
-            'sender_id': sender_id
+            'sender_id': sender_id,
+            'message_id': event.get('message_id')
         }))
\ No newline at end of file
@@ -0,0 +1,44 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def get_executor(threads):
+    with _lock:
+        if threads not in _executors:
+            _executors[threads] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='chat-db')
+        return _executors[threads]
+
+
+def _call(func, args, kwargs):
+    # 与请求前后一样按 CONN_MAX_AGE 和 CONN_HEALTH_CHECKS 清理本线程的连接：
+    # 未超过 CONN_MAX_AGE 的连接保留复用，超过的关闭，避免连接超过 MySQL 的 wait_timeout 后调用失败
+    # CONN_MAX_AGE 为 0 时每次调用后都会关闭连接，部署时需配置持久连接（见 settings.DATABASES）
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    except DatabaseError:
+        # 连接可能已失效，关闭本线程的连接，下次调用时重新连接
+        connections.close_all()
+        raise
+    finally:
+        close_old_connections()
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    在异步代码中执行同步的 ORM 调用
+    sync_to_async 默认（thread_sensitive=True）以及 Django 的 aget、acreate 等异步方法都在同一个线程中执行，
+    一个进程内所有连接的数据库操作排队执行；CHAT_DB_THREADS 大于 0 时改为在大小固定的线程池中并发执行，
+    每个线程最多持有一个数据库连接，连接数不超过 CHAT_DB_THREADS
+    CHAT_DB_THREADS 为 0 时与 sync_to_async 相同（测试中数据在主线程的事务中，其他线程的连接看不到）
+    """
+    threads = settings.CHAT_DB_THREADS
+    if threads <= 0:
+        return await sync_to_async(func)(*args, **kwargs)
+    return await sync_to_async(_call, thread_sensitive=False, executor=get_executor(threads))(func, args, kwargs)
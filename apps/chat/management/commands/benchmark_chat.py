@@ -0,0 +1,117 @@
+import asyncio
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from apps.accounts.models import User
+from apps.chat.consumers import ChatConsumer
+from apps.chat.models import ChatRoom
+from apps.chat.persistence import message_buffer
+from apps.sales.models import Item
+
+
+class Command(BaseCommand):
+    help = (
+        "测量聊天消息吞吐量：每个连接发送消息并等待广播回来，统计单个进程每秒处理的消息数；"
+        "使用 InMemoryChannelLayer，只测 consumer 和数据库的开销，结束后删除测试数据"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500, help="每个连接发送的消息数")
+        parser.add_argument('--connections', type=int, default=1, help="并发连接数，每个连接一个房间")
+        parser.add_argument('--mode', choices=['strict', 'batched'], default=settings.CHAT_PERSISTENCE_MODE, help="消息写入方式")
+        parser.add_argument(
+            '--db-latency', type=float, default=0,
+            help="每次查询额外等待的毫秒数，模拟访问远程数据库（如 MySQL）的网络往返；本地 sqlite 几乎没有等待，体现不出线程池的作用",
+        )
+        parser.add_argument(
+            '--connect-latency', type=float, default=0,
+            help="每次建立数据库连接额外等待的毫秒数，模拟 MySQL 的连接握手和认证；用来检查连接是否被复用",
+        )
+        parser.add_argument('--db-threads', type=int, default=settings.CHAT_DB_THREADS, help="数据库线程池大小，0 为 sync_to_async 的单个线程")
+
+    def handle(self, *args, **options):
+        if options['db_latency'] > 0:
+            self.simulate_latency(options['db_latency'] / 1000)
+        connections_opened = []
+        connect_latency = options['connect_latency'] / 1000
+
+        def count_connection(connection, **kwargs):
+            connections_opened.append(connection)
+            if connect_latency > 0:
+                time.sleep(connect_latency)
+
+        connection_created.connect(count_connection, weak=False)
+        prefix = f"chat_benchmark_{uuid.uuid4().hex[:8]}"
+        seller = User.objects.create_user(email=f"{prefix}_seller@example.com", username=f"{prefix}_seller@example.com", password="benchmark")
+        buyers = [
+            User.objects.create_user(email=f"{prefix}_{i}@example.com", username=f"{prefix}_{i}@example.com", password="benchmark")
+            for i in range(options['connections'])
+        ]
+        try:
+            item = Item.objects.create(
+                title=prefix, username=seller.email, price_lower_bound=10, price_upper_bound=20, user=seller,
+            )
+            for buyer in buyers:
+                ChatRoom.objects.create(seller=seller, buyer=buyer, item=item, room_name=f"room_{item.id}_{seller.id}_{buyer.id}")
+            with override_settings(
+                CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                CHAT_PERSISTENCE_MODE=options['mode'],
+                CHAT_DB_THREADS=options['db_threads'],
+            ):
+                connect_elapsed, elapsed = async_to_sync(self.run)(item, buyers, options['messages'])
+        finally:
+            # 级联删除物品、房间和消息
+            User.objects.filter(email__startswith=prefix).delete()
+        total = options['messages'] * len(buyers)
+        self.stdout.write(
+            f"{options['mode']}, {options['db_threads']} db threads, {options['db_latency']}ms latency, {len(buyers)} connections: "
+            f"connect {connect_elapsed:.3f}s, {total} messages {elapsed:.3f}s, {total / elapsed:.0f} messages/s, "
+            f"{len(connections_opened)} db connections opened"
+        )
+
+    def simulate_latency(self, seconds):
+        def delay(execute, sql, params, many, context):
+            time.sleep(seconds)
+            return execute(sql, params, many, context)
+
+        def add_wrapper(connection, **kwargs):
+            connection.execute_wrappers.append(delay)
+
+        # 线程池中的线程各自建立连接
+        connection_created.connect(add_wrapper, weak=False)
+        connection.execute_wrappers.append(delay)
+
+    async def run(self, item, buyers, count):
+        async def connect(buyer):
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), path=f"/ws/chat/{item.id}/{buyer.email}/")
+            communicator.scope['url_route'] = {'kwargs': {'item_id': item.id, 'buyer_email': buyer.email}}
+            communicator.scope['user'] = buyer
+            connected, _ = await communicator.connect(timeout=30)
+            assert connected
+            await communicator.receive_json_from(timeout=30)  # 历史消息
+            return communicator, buyer
+
+        # 所有连接同时建立
+        start = time.perf_counter()
+        communicators = await asyncio.gather(*[connect(buyer) for buyer in buyers])
+        connect_elapsed = time.perf_counter() - start
+
+        async def chat(communicator, buyer):
+            for i in range(count):
+                await communicator.send_json_to({'message': f"message {i}", 'sender_id': buyer.id})
+                await communicator.receive_json_from(timeout=30)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[chat(communicator, buyer) for communicator, buyer in communicators])
+        # 计入缓冲中剩余消息的写入时间
+        await message_buffer.flush()
+        elapsed = time.perf_counter() - start
+        for communicator, _ in communicators:
+            await communicator.disconnect()
+        return connect_elapsed, elapsed
@@ -29,10 +29,31 @@ class Message(models.Model):
     """
     用于存储聊天记录
     """
+    class Meta:
+        indexes = [
+            # 按房间取最近的消息、按 (timestamp, id) 游标向前翻页
+            models.Index(fields=['room', 'timestamp'], name='chat_message_room_ts_idx'),
+        ]
     room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='messages')
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Message from {self.sender.email} in {self.room.room_name}"
\ No newline at end of file
+        return f"Message from {self.sender.email} in {self.room.room_name}"
+
+class ReadCursor(models.Model):
+    """
+    用户在聊天房间中已读到的最后一条消息，用于计算未读数
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'user'], name='chat_read_cursor_room_user'),
+        ]
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_cursors')
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='read_cursors')
+    last_read_id = models.PositiveBigIntegerField(default=0)  # 已读到的最后一条消息的 id
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} read {self.room.room_name} up to {self.last_read_id}"
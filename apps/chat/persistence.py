@@ -0,0 +1,90 @@
+import asyncio
+import atexit
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBuffer:
+    """
+    聊天消息的写缓冲（write-behind），CHAT_PERSISTENCE_MODE = 'batched' 时使用
+    consumer 先广播消息再放入缓冲，攒够 CHAT_BATCH_SIZE 条或等待 CHAT_BATCH_INTERVAL 秒后用一次 bulk_create 写入
+    - 所有批次都通过 sync_to_async（thread_sensitive）在同一个线程中按顺序写入，先收到的消息 id 更小
+    - 写入失败的批次放回缓冲，按指数退避（CHAT_BATCH_RETRY_DELAY 起，最长 CHAT_BATCH_RETRY_MAX_DELAY 秒）安排重试
+    - 连接断开、有新连接读取历史记录以及进程退出时都会写入缓冲中的消息
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []
+        self.scheduled = False
+        # 连续写入失败的次数，决定下次重试的等待时间
+        self.failures = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    async def add(self, message):
+        with self.lock:
+            self.pending.append(message)
+            full = len(self.pending) >= settings.CHAT_BATCH_SIZE
+            schedule = not full and not self.scheduled
+            if schedule:
+                self.scheduled = True
+        if full:
+            await self.flush()
+        elif schedule:
+            asyncio.get_running_loop().call_later(settings.CHAT_BATCH_INTERVAL, self.schedule_flush)
+
+    def schedule_flush(self):
+        asyncio.get_running_loop().create_task(self.flush())
+
+    def take(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+            self.scheduled = False
+        return batch
+
+    def restore(self, batch):
+        with self.lock:
+            self.pending[:0] = batch
+
+    async def flush(self):
+        batch = self.take()
+        if batch and not await sync_to_async(self.write)(batch):
+            self.schedule_retry()
+
+    def schedule_retry(self):
+        # take() 已清除 scheduled，不安排重试的话失败的消息要等到下一条消息或连接变化时才会写入
+        with self.lock:
+            self.failures += 1
+            delay = min(settings.CHAT_BATCH_RETRY_DELAY * 2 ** (self.failures - 1), settings.CHAT_BATCH_RETRY_MAX_DELAY)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        asyncio.get_running_loop().call_later(delay, self.schedule_flush)
+
+    def flush_sync(self):
+        """进程退出时写入，此时事件循环已经停止"""
+        batch = self.take()
+        if batch:
+            self.write(batch)
+
+    def write(self, batch):
+        """:return: 是否写入成功，失败时批次已放回缓冲"""
+        from apps.chat.models import Message
+        try:
+            Message.objects.bulk_create(batch)
+        except Exception:
+            logger.exception("failed to save %d chat messages, will retry", len(batch))
+            self.restore(batch)
+            return False
+        with self.lock:
+            self.failures = 0
+        return True
+
+
+message_buffer = MessageBuffer()
+atexit.register(message_buffer.flush_sync)
@@ -1,11 +1,19 @@
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
 from rest_framework.test import APITestCase
 from rest_framework import status
 from apps.accounts.models import User
 from apps.sales.models import Item
 from apps.chat.models import ChatRoom, Message
-from apps.chat.utils import send_system_notification
+from apps.chat.utils import _bulk_create_returns_ids, mark_read, send_system_notification, send_system_notifications
 from apps.chat.consumers import ChatConsumer
+from apps.chat.database import run_db
+from apps.chat.persistence import message_buffer
 from channels.testing import WebsocketCommunicator
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TransactionTestCase, override_settings
+from django.db import OperationalError, close_old_connections
 
 class ChatRoomTests(APITestCase):
     def setUp(self):
@@ -149,6 +157,42 @@ class SystemRoomTests(APITestCase):
         self.assertEqual(messages.room, room)
         self.assertEqual(messages.content, message)
 
+    def test_send_system_notifications_batch(self):
+        """
+        测试批量发送系统通知，查询次数不随通知数量增长
+        """
+        users = [self.user] + [
+            User.objects.create_user(email=f"user{i}@example.com", username=f"user{i}@example.com", password="password")
+            for i in range(20)
+        ]
+        # 删除一个系统房间，验证缺失的房间会被补建
+        ChatRoom.objects.filter(room_name=f"system_room_{users[1].id}").delete()
+        notifications = []
+        for user in users:
+            notifications.append((user, "匹配通知", 'chat_message'))
+            notifications.append((user, "42", 'item_id'))
+        if _bulk_create_returns_ids():
+            with self.assertNumQueries(4):
+                send_system_notifications(notifications)
+        else:
+            send_system_notifications(notifications)
+        for user in users:
+            room = ChatRoom.objects.get(room_name=f"system_room_{user.id}")
+            self.assertEqual(list(Message.objects.filter(room=room).order_by('id').values_list('content', flat=True)), ["匹配通知", "42"])
+
+    def test_system_notification_message_ids_without_bulk_returning(self):
+        """
+        测试数据库不支持 bulk_create 回填主键（如 MySQL）时，推送的 message_id 仍是实际的消息 id
+        """
+        channel_layer = MagicMock()
+        channel_layer.group_send = AsyncMock()
+        with patch('apps.chat.utils.get_channel_layer', return_value=channel_layer), \
+                patch('apps.chat.utils._bulk_create_returns_ids', return_value=False):
+            send_system_notifications([(self.user, "匹配通知", 'chat_message'), (self.user, "42", 'item_id')])
+        message_ids = [call.args[1]['message_id'] for call in channel_layer.group_send.call_args_list]
+        room = ChatRoom.objects.get(room_name=f"system_room_{self.user.id}")
+        self.assertEqual(message_ids, list(Message.objects.filter(room=room).order_by('id').values_list('id', flat=True)))
+
 
 class WebSocketTests(APITestCase):
     def setUp(self):
@@ -184,6 +228,8 @@ class WebSocketTests(APITestCase):
                 'buyer_email': self.buyer.email
             }
         }
+        # 只有已登录的房间成员可以发送消息
+        communicator.scope['user'] = self.buyer
 
         # Step 1: Connect to WebSocket
         connected, _ = await communicator.connect()
@@ -295,6 +341,352 @@ class ChatHistoryTests(APITestCase):
 
         await communicator.disconnect()
 
+    async def connect(self):
+        communicator = WebsocketCommunicator(
+            ChatConsumer.as_asgi(),
+            path=f"/ws/chat/{self.item.id}/{self.buyer.email}/"
+        )
+        communicator.scope['url_route'] = {
+            'kwargs': {
+                'item_id': self.item.id,
+                'buyer_email': self.buyer.email
+            }
+        }
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_history_paginated(self):
+        """
+        测试连接时只发送最近的一页消息，通过 load_more 按 (timestamp, id) 游标向前翻页
+        """
+        await sync_to_async(Message.objects.bulk_create)([
+            Message(room=self.room, sender=self.seller, content=f"message {i}") for i in range(5)
+        ])
+        with override_settings(CHAT_HISTORY_PAGE_SIZE=3):
+            communicator = await self.connect()
+            response = await communicator.receive_json_from()
+            self.assertEqual([m['content'] for m in response['messages']], ["message 2", "message 3", "message 4"])
+            self.assertTrue(response['has_more'])
+
+            contents = []
+            oldest = response['messages'][0]
+            while True:
+                await communicator.send_json_to({
+                    'command': 'load_more', 'before_id': oldest['id'], 'before_timestamp': oldest['timestamp'], 'limit': 2
+                })
+                response = await communicator.receive_json_from()
+                self.assertEqual(response['type'], 'more_history')
+                contents = [m['content'] for m in response['messages']] + contents
+                if not response['has_more']:
+                    break
+                oldest = response['messages'][0]
+            self.assertEqual(contents, ["Hello Buyer!", "Hello Seller!", "message 0", "message 1"])
+            await communicator.disconnect()
+
+    async def test_load_more_without_timestamp(self):
+        """
+        测试只传 id 游标，以及无效的 load_more 请求
+        """
+        communicator = await self.connect()
+        response = await communicator.receive_json_from()
+        await communicator.send_json_to({'command': 'load_more', 'before_id': response['messages'][1]['id']})
+        response = await communicator.receive_json_from()
+        self.assertEqual([m['content'] for m in response['messages']], ["Hello Buyer!"])
+        self.assertFalse(response['has_more'])
+        await communicator.send_json_to({'command': 'load_more'})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'error')
+        await communicator.disconnect()
+
+class ChatSyncTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(email="seller@example.com", username="seller@example.com", password="password")
+        self.buyer = User.objects.create_user(email="buyer@example.com", username="buyer@example.com", password="password")
+        self.item = Item.objects.create(
+            title="Test Item",
+            username=self.seller.email,
+            price_lower_bound=10.00,
+            price_upper_bound=20.00,
+            user=self.seller,
+        )
+        self.room, _ = ChatRoom.objects.get_or_create(
+            seller=self.seller,
+            buyer=self.buyer,
+            item=self.item,
+            defaults={'room_name': f"room_{self.item.id}_{self.seller.id}_{self.buyer.id}"}
+        )
+        self.first = Message.objects.create(room=self.room, sender=self.seller, content="Hello Buyer!")
+        self.second = Message.objects.create(room=self.room, sender=self.buyer, content="Hello Seller!")
+        self.third = Message.objects.create(room=self.room, sender=self.seller, content="Still available?")
+
+    async def connect(self, query="", user=None):
+        communicator = WebsocketCommunicator(
+            ChatConsumer.as_asgi(),
+            path=f"/ws/chat/{self.item.id}/{self.buyer.email}/{query}"
+        )
+        communicator.scope['url_route'] = {
+            'kwargs': {
+                'item_id': self.item.id,
+                'buyer_email': self.buyer.email
+            }
+        }
+        if user is not None:
+            communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_resume_from_last_seen(self):
+        """
+        测试重连时带上 last_seen_id 只收到之后的消息，实时消息带有 message_id
+        """
+        communicator = await self.connect(f"?last_seen_id={self.first.id}", user=self.seller)
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'history')
+        self.assertEqual(response['last_seen_id'], self.first.id)
+        self.assertEqual([m['id'] for m in response['messages']], [self.second.id, self.third.id])
+        self.assertFalse(response['has_more'])
+
+        await communicator.send_json_to({'message': "Yes", 'sender_id': self.seller.id})
+        response = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        # 已经是最新的，没有新消息
+        communicator = await self.connect(f"?last_seen_id={response['message_id']}")
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['messages'], [])
+        await communicator.disconnect()
+
+    async def test_read_cursor(self):
+        """
+        测试已读位置保存在服务端，未读数不计自己发送的消息
+        """
+        communicator = await self.connect(user=self.buyer)
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['last_read_id'], 0)
+        self.assertEqual(response['unread_count'], 2)
+
+        await communicator.send_json_to({'command': 'mark_read', 'message_id': self.first.id})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response, {'type': 'read_cursor', 'last_read_id': self.first.id, 'unread_count': 1})
+        # 已读位置不会后退
+        await communicator.send_json_to({'command': 'mark_read', 'message_id': self.first.id - 1})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['last_read_id'], self.first.id)
+        await communicator.disconnect()
+
+        communicator = await self.connect(user=self.buyer)
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['last_read_id'], self.first.id)
+        self.assertEqual(response['unread_count'], 1)
+        await communicator.disconnect()
+
+    async def test_mark_read_requires_login(self):
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+        await communicator.send_json_to({'command': 'mark_read', 'message_id': self.third.id})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'error')
+        await communicator.disconnect()
+
+    async def test_sender_from_scope(self):
+        """
+        测试已登录用户以 scope['user'] 为发送者
+        """
+        communicator = await self.connect(user=self.buyer)
+        await communicator.receive_json_from()
+        # 客户端传来的 sender_id 被忽略
+        await communicator.send_json_to({'message': "Deal", 'sender_id': self.seller.id})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['sender_id'], self.buyer.id)
+        saved = await Message.objects.aget(id=response['message_id'])
+        self.assertEqual(saved.sender_id, self.buyer.id)
+        await communicator.disconnect()
+
+    async def test_reject_anonymous_sender(self):
+        """
+        测试未登录时不能发送消息，即使 sender_id 是房间成员
+        """
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+        await communicator.send_json_to({'message': "Spoofed", 'sender_id': self.seller.id})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response, {'type': 'error', 'message': 'User is not logged in'})
+        self.assertFalse(await Message.objects.filter(content="Spoofed").aexists())
+        await communicator.disconnect()
+
+    async def test_reject_non_member_sender(self):
+        """
+        测试已登录但不是房间成员的用户不能发送消息
+        """
+        other = await sync_to_async(User.objects.create_user)(email="other@example.com", username="other@example.com", password="password")
+        communicator = await self.connect(user=other)
+        await communicator.receive_json_from()
+        await communicator.send_json_to({'message': "Spam"})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'error')
+        self.assertFalse(await Message.objects.filter(content="Spam").aexists())
+        await communicator.disconnect()
+
+    def test_unread_count_in_room_list(self):
+        """
+        测试房间列表中的未读数
+        """
+        mark_read(self.room, self.buyer.id, self.first.id)
+        send_system_notification(self.buyer, "匹配通知", 'chat_message')
+        self.client.login(email=self.buyer.email, password="password")
+        response = self.client.get('/chat/check-rooms', {'email': self.buyer.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        unread = {room['room_name']: room['unread_count'] for room in response.data}
+        self.assertEqual(unread, {self.room.room_name: 1, f"system_room_{self.buyer.id}": 1})
+
+@override_settings(CHAT_PERSISTENCE_MODE='batched', CHAT_BATCH_SIZE=3, CHAT_BATCH_INTERVAL=60)
+class BatchedPersistenceTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(email="seller@example.com", username="seller@example.com", password="password")
+        self.buyer = User.objects.create_user(email="buyer@example.com", username="buyer@example.com", password="password")
+        self.item = Item.objects.create(
+            title="Test Item",
+            username=self.seller.email,
+            price_lower_bound=10.00,
+            price_upper_bound=20.00,
+            user=self.seller,
+        )
+        self.room = ChatRoom.objects.create(
+            seller=self.seller, buyer=self.buyer, item=self.item,
+            room_name=f"room_{self.item.id}_{self.seller.id}_{self.buyer.id}",
+        )
+
+    def tearDown(self):
+        message_buffer.take()
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), path=f"/ws/chat/{self.item.id}/{self.buyer.email}/")
+        communicator.scope['url_route'] = {'kwargs': {'item_id': self.item.id, 'buyer_email': self.buyer.email}}
+        communicator.scope['user'] = self.buyer
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()
+        return communicator
+
+    async def contents(self):
+        return [content async for content in Message.objects.filter(room=self.room).order_by('id').values_list('content', flat=True)]
+
+    async def test_flush_when_batch_full(self):
+        """
+        测试先广播、攒够一批后按顺序批量写入
+        """
+        communicator = await self.connect()
+        for i in range(2):
+            await communicator.send_json_to({'message': f"message {i}"})
+            response = await communicator.receive_json_from()
+            self.assertEqual(response['message'], f"message {i}")
+            self.assertIsNone(response['message_id'])
+        self.assertEqual(await self.contents(), [])
+        await communicator.send_json_to({'message': "message 2"})
+        await communicator.receive_json_from()
+        self.assertEqual(await self.contents(), ["message 0", "message 1", "message 2"])
+        await communicator.disconnect()
+
+    async def test_flush_on_disconnect_and_connect(self):
+        """
+        测试连接断开时写入缓冲；新连接读取的历史记录包含缓冲中的消息
+        """
+        communicator = await self.connect()
+        await communicator.send_json_to({'message': "first"})
+        await communicator.receive_json_from()
+
+        other = WebsocketCommunicator(ChatConsumer.as_asgi(), path=f"/ws/chat/{self.item.id}/{self.buyer.email}/")
+        other.scope['url_route'] = {'kwargs': {'item_id': self.item.id, 'buyer_email': self.buyer.email}}
+        await other.connect()
+        history = await other.receive_json_from()
+        self.assertEqual([m['content'] for m in history['messages']], ["first"])
+        await other.disconnect()
+
+        await communicator.send_json_to({'message': "second"})
+        await communicator.receive_json_from()
+        await communicator.disconnect()
+        self.assertEqual(await self.contents(), ["first", "second"])
+
+    @override_settings(CHAT_BATCH_RETRY_DELAY=0.01)
+    async def test_retry_failed_batch(self):
+        """
+        测试写入失败的批次放回缓冲，并在退避后自动重试
+        """
+        bulk_create = Message.objects.bulk_create
+        calls = []
+
+        def flaky_bulk_create(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise OperationalError("MySQL server has gone away")
+            return bulk_create(batch)
+
+        with patch.object(Message.objects, 'bulk_create', side_effect=flaky_bulk_create):
+            await message_buffer.add(Message(room=self.room, sender=self.buyer, content="retry"))
+            await message_buffer.flush()
+            self.assertEqual(len(message_buffer), 1)
+            # take() 在写入前就清空了缓冲，等待重试的写入本身完成，而不是等缓冲变空
+            for _ in range(200):
+                if len(calls) == 2 and message_buffer.failures == 0:
+                    break
+                await asyncio.sleep(0.01)
+        self.assertEqual(calls, [1, 1])
+        self.assertEqual(await self.contents(), ["retry"])
+        self.assertEqual(message_buffer.failures, 0)
+
+    def test_flush_sync(self):
+        """
+        测试进程退出时同步写入
+        """
+        async_to_sync(message_buffer.add)(Message(room=self.room, sender=self.buyer, content="bye"))
+        self.assertEqual(len(message_buffer), 1)
+        message_buffer.flush_sync()
+        self.assertEqual(len(message_buffer), 0)
+        self.assertTrue(Message.objects.filter(room=self.room, content="bye").exists())
+
+class RunDbTests(APITestCase):
+    @override_settings(CHAT_DB_THREADS=2)
+    async def test_bounded_pool(self):
+        """
+        测试数据库操作在大小固定的线程池中并发执行
+        """
+        barrier = threading.Barrier(2, timeout=5)
+        threads = set()
+
+        def query():
+            threads.add(threading.current_thread().name)
+            # 两个调用同时在执行才能通过
+            barrier.wait()
+            return threading.current_thread().name
+
+        names = await asyncio.gather(*[run_db(query) for _ in range(6)])
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(name.startswith('chat-db') for name in names))
+
+    async def test_default_thread(self):
+        """
+        测试 CHAT_DB_THREADS 为 0 时与 sync_to_async 在同一线程执行
+        """
+        name = await run_db(lambda: threading.current_thread().name)
+        self.assertEqual(name, await sync_to_async(lambda: threading.current_thread().name)())
+
+class RunDbPoolTests(TransactionTestCase):
+    """
+    线程池中的连接看不到测试事务中的数据，使用 TransactionTestCase
+    """
+    @override_settings(CHAT_DB_THREADS=2)
+    async def test_pool_uses_committed_data_and_recycles_connections(self):
+        """
+        测试线程池中执行 ORM 调用，每次调用前后清理失效的连接
+        """
+        with patch('apps.chat.database.close_old_connections', wraps=close_old_connections) as close:
+            user = await run_db(User.objects.create_user, email="pool@example.com", username="pool@example.com", password="password")
+            self.assertEqual(await run_db(User.objects.filter(id=user.id).count), 1)
+        self.assertEqual(close.call_count, 4)
+        self.assertTrue(await User.objects.filter(email="pool@example.com").aexists())
+
 class ListChatRoomsTests(APITestCase):
     def setUp(self):
         # 创建测试用户
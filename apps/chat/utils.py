@@ -1,38 +1,140 @@
+import asyncio
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from django.db import connection, transaction
 
 
 def send_system_notification(user, message, message_type):
     """
     向用户的系统房间发送系统通知，并保存到数据库
     """
+    send_system_notifications([(user, message, message_type)])
+
+
+def send_system_notifications(notifications):
+    """
+    批量发送系统通知：一次查询取出所有系统房间，bulk_create 保存消息，
+    并在同一次事件循环中并发推送到各个房间组
+    :param notifications: [(user, message, message_type)]
+    """
     from apps.chat.models import ChatRoom, Message
+    if not notifications:
+        return
     channel_layer = get_channel_layer()
-    room_name = f"system_room_{user.id}"  # 用户的系统房间名
-    print(f"[DEBUG] Sending system notification to room: {room_name}, message: {message}")
+    users = {user.id: user for user, _, _ in notifications}
+    room_names = {user_id: f"system_room_{user_id}" for user_id in users}  # 用户的系统房间名
+    print(f"[DEBUG] Sending {len(notifications)} system notifications to {len(room_names)} rooms")
+
     # 确保房间存在
-    room, created = ChatRoom.objects.get_or_create(
-        room_name=room_name,
-        is_system_room=True,
-        buyer=user
-    )
-    # 如果是新创建的房间，确保设置了系统房间标志
-    if created:
-        print(f"[DEBUG] Created new system room for user: {user.email}")
-    
+    rooms = {room.room_name: room for room in ChatRoom.objects.filter(room_name__in=room_names.values())}
+    missing = [user_id for user_id, room_name in room_names.items() if room_name not in rooms]
+    if missing:
+        ChatRoom.objects.bulk_create([
+            ChatRoom(room_name=room_names[user_id], is_system_room=True, buyer=users[user_id])
+            for user_id in missing
+        ], ignore_conflicts=True)
+        # ignore_conflicts 时不会回填主键，重新查询一次
+        for room in ChatRoom.objects.filter(room_name__in=[room_names[user_id] for user_id in missing]):
+            rooms[room.room_name] = room
+        print(f"[DEBUG] Created {len(missing)} new system rooms")
+
     # 保存消息到数据库
-    Message.objects.create(
-        room=room,
-        sender=user,  # 系统消息可以用用户自己作为发送者
-        content=message
-    )
+    messages = [
+        Message(
+            room=rooms[room_names[user.id]],
+            sender=user,  # 系统消息可以用用户自己作为发送者
+            content=message,
+        )
+        for user, message, _ in notifications
+    ]
+    if _bulk_create_returns_ids():
+        saved_messages = Message.objects.bulk_create(messages)
+    else:
+        saved_messages = _bulk_create_fetch_ids(messages, rooms.values())
 
     # 通过 WebSocket 发送消息
-    async_to_sync(channel_layer.group_send)(
-        room_name,  # 房间组名
-        {
+    events = [
+        (room_names[user.id], {
             'type': message_type,  # 消息类型
             'message': message,      # 消息内容
-            'sender_id': user.id  
-        }
-    )
\ No newline at end of file
+            'sender_id': user.id,
+            'message_id': saved_message.pk
+        })
+        for (user, message, message_type), saved_message in zip(notifications, saved_messages)
+    ]
+    async_to_sync(_group_send_all)(channel_layer, events)
+
+
+def _bulk_create_returns_ids():
+    """数据库的 bulk_create 是否回填主键（MySQL 不回填）"""
+    return connection.features.can_return_rows_from_bulk_insert
+
+
+def _bulk_create_fetch_ids(messages, rooms):
+    """
+    bulk_create 不回填主键时，插入后再用一次查询取回新消息的 id，
+    推送的 message_id 要用于断线续传和已读位置，不能为空
+    锁住涉及的房间，插入期间这些房间不会有其他新消息，插入前的最大 id 之后的消息即为本次插入的消息
+    """
+    from apps.chat.models import ChatRoom, Message
+    room_ids = [room.pk for room in rooms]
+    with transaction.atomic():
+        list(ChatRoom.objects.select_for_update().filter(pk__in=room_ids).values_list('pk', flat=True))
+        last_id = Message.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        Message.objects.bulk_create(messages)
+        new_ids = {}
+        for message_id, room_id in Message.objects.filter(room_id__in=room_ids, id__gt=last_id).order_by('id').values_list('id', 'room_id'):
+            new_ids.setdefault(room_id, []).append(message_id)
+    # 同一房间内 id 按插入顺序递增
+    for message in messages:
+        message.pk = new_ids[message.room_id].pop(0)
+    return messages
+
+
+async def _group_send_all(channel_layer, events):
+    # 同一房间内按顺序发送（如先文字通知再发商品链接），不同房间之间并发
+    room_events = {}
+    for room_name, event in events:
+        room_events.setdefault(room_name, []).append(event)
+
+    async def send_room(room_name, room_event_list):
+        for event in room_event_list:
+            await channel_layer.group_send(room_name, event)
+
+    await asyncio.gather(*[
+        send_room(room_name, room_event_list) for room_name, room_event_list in room_events.items()
+    ])
+
+
+def with_unread_counts(rooms, user_id):
+    """
+    为聊天房间加上 user 的已读位置 last_read_id 和未读数 unread_count，一次查询完成
+    未读数为已读位置之后对方发送的消息数；系统房间的消息以用户自己为发送者，全部计入
+    """
+    from django.db.models import Count, OuterRef, Q, Subquery
+    from django.db.models.functions import Coalesce
+    from apps.chat.models import ReadCursor
+    last_read_id = Coalesce(
+        Subquery(ReadCursor.objects.filter(room=OuterRef('pk'), user_id=user_id).values('last_read_id')[:1]), 0
+    )
+    return rooms.annotate(last_read_id=last_read_id).annotate(unread_count=Count(
+        'messages',
+        filter=Q(messages__id__gt=last_read_id) & (Q(is_system_room=True) | ~Q(messages__sender_id=user_id)),
+    ))
+
+
+def mark_read(room, user_id, message_id):
+    """
+    将 user 在房间中的已读位置前移到 message_id，已读位置只前进不后退
+    :return: 更新后的已读位置
+    """
+    from apps.chat.models import ReadCursor
+    # 已读位置不超过房间中实际存在的最后一条消息
+    message_id = room.messages.filter(id__lte=message_id).order_by('-id').values_list('id', flat=True).first()
+    if message_id is None:
+        return 0
+    cursor, created = ReadCursor.objects.get_or_create(room=room, user_id=user_id, defaults={'last_read_id': message_id})
+    if not created:
+        # 条件更新，并发的请求也不会让已读位置后退
+        ReadCursor.objects.filter(pk=cursor.pk, last_read_id__lt=message_id).update(last_read_id=message_id)
+    return max(cursor.last_read_id, message_id)
@@ -4,31 +4,49 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .utils import send_system_notification
+from .utils import send_system_notifications, with_unread_counts
 from apps.accounts.models import User
 from apps.chat.models import ChatRoom
 from apps.sales.models import Item
 from apps.chat.serializers import CreateChatRoomSerializer, ListUserChatRoomsSerializer
 
-def send_notification_when_need_match(item, need):
+def need_match_notifications(item, need):
     """
-    检查物品是否满足需求，并向买家和卖家发送系统通知
+    生成物品与需求匹配时要发给买家和卖家的系统通知
+    :return: [(user, message, message_type)]
     """
     buyer = need.user
     seller = item.user
     item_id = item.id
     # 向买家推送通知
     buyer_message = f"以为您的需求 '{need.title}' 匹配到新发布的商品！请点击下访链接跳转到商品页面并与卖家联系。"
-    send_system_notification(buyer, buyer_message, 'chat_message')
     buyer_link_message = f"{item_id}"
-    send_system_notification(buyer, buyer_link_message, 'item_id')
-
     # 向卖家推送通知
     seller_message = f"您的物品 '{item.title}' 与已有需求匹配！请查看您的聊天中是否有买家联系您。"
-    send_system_notification(seller, seller_message, 'chat_message')
+    return [
+        (buyer, buyer_message, 'chat_message'),
+        (buyer, buyer_link_message, 'item_id'),
+        (seller, seller_message, 'chat_message'),
+    ]
 
+def send_notification_when_need_match(item, need):
+    """
+    检查物品是否满足需求，并向买家和卖家发送系统通知
+    """
+    send_system_notifications(need_match_notifications(item, need))
     return True
 
+def send_notifications_for_matches(matches):
+    """
+    批量发送匹配通知，所有匹配共用一次房间查询、一次消息写入
+    :param matches: [(item, need)]
+    """
+    notifications = []
+    for item, need in matches:
+        notifications += need_match_notifications(item, need)
+    send_system_notifications(notifications)
+    return len(matches)
+
 class CreateChatRoomView(APIView):
     """
     API 用于创建或获取聊天房间
@@ -67,11 +85,14 @@ class ListUserChatRoomsView(APIView):
         if serializer.is_valid():
             user = serializer.validated_data['user']
             chat_rooms = ChatRoom.objects.filter(seller=user) | ChatRoom.objects.filter(buyer=user)
+            # 按已读位置一次查询算出每个房间的未读数
+            chat_rooms = with_unread_counts(chat_rooms, user.id).select_related('seller', 'buyer')
             chat_rooms_data = []
             for room in chat_rooms:
                 room_data = {
                     'room_name': room.room_name,
                     'is_system_room': room.is_system_room,
+                    'unread_count': room.unread_count,
                 }
                 if room.is_system_room:
                     # 系统房间只有 buyer 信息
@@ -0,0 +1,9 @@
+from django.contrib import admin
+from apps.sales.models import MatchJob
+
+
+@admin.register(MatchJob)
+class MatchJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'object_id', 'status', 'matches', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    ordering = ('-created_at',)
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class SalesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.sales"
+
+    def ready(self):
+        import apps.sales.signals
+        if getattr(settings, 'STARTUP_WARMUP', False):
+            from .warmup import warmup
+            warmup()
@@ -0,0 +1,61 @@
+import os
+import re
+import tempfile
+from collections import Counter
+from .tokenizer import build_tokenizer
+
+# 词典中的词不能包含空白（词典文件以空格分隔词、词频和词性）
+MAX_TERM_LENGTH = 30
+CJK_PATTERN = re.compile(r'[一-鿿]')
+
+
+def is_dictionary_term(term):
+    """只收录含有中文、不含空白、长度合适的词；纯英文和数字 jieba 本身就不会切开"""
+    return (
+        isinstance(term, str)
+        and 2 <= len(term) <= MAX_TERM_LENGTH
+        and not any(ch.isspace() for ch in term)
+        and CJK_PATTERN.search(term) is not None
+    )
+
+
+def harvest_terms(min_title_count=2):
+    """
+    从 Item、Need 和所有用户的课程表中收集课程名、教师名和书名
+    书名出现至少 min_title_count 次才收录，避免把个别物品的完整标题当作一个词，降低召回
+    :return: {term: 词性}，课程名为 nz，教师名为 nr，书名为 nz
+    """
+    from apps.accounts.models import User
+    from apps.sales.models import Item, Need
+    courses, teachers, titles = set(), set(), Counter()
+    for model in (Item, Need):
+        for title, course, teacher in model._default_manager.values_list('title', 'course', 'teacher').iterator():
+            titles[(title or '').strip()] += 1
+            courses.add((course or '').strip())
+            teachers.add((teacher or '').strip())
+    for class_schedule in User.objects.exclude(class_schedule=[]).values_list('class_schedule', flat=True).iterator():
+        for class_ in class_schedule or []:
+            if isinstance(class_, dict):
+                courses.add(str(class_.get('course') or '').strip())
+                teachers.add(str(class_.get('teacher') or '').strip())
+    terms = {title: 'nz' for title, count in titles.items() if count >= min_title_count}
+    terms.update((course, 'nz') for course in courses)
+    terms.update((teacher, 'nr') for teacher in teachers)
+    # 默认词典和领域词典中已有的词不必重复收录；
+    # 不能用当前的分词器比较，它已加载上次生成的词典，会把上次收录的词全部去掉
+    freq = build_tokenizer(include_catalog=False).FREQ
+    return {term: tag for term, tag in terms.items() if is_dictionary_term(term) and not freq.get(term)}
+
+
+def write_user_dict(path, terms):
+    """
+    写入 jieba 词典文件，不写词频，由 jieba 计算保证该词能被切出的词频
+    先写临时文件再替换，正在检查文件的 worker 不会读到写了一半的文件
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for term in sorted(terms):
+            f.write(f"{term} {terms[term]}\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,249 @@
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db import close_old_connections
+from pypinyin import Style, lazy_pinyin
+from .search import SEARCH_FIELDS
+from .tokenizer import tokenize
+
+logger = logging.getLogger(__name__)
+
+# 只为含有中文或字母的词建立模糊索引，纯数字、符号没有拼音也不适合按编辑距离匹配
+INDEXABLE_PATTERN = re.compile(r'[a-z一-鿿]')
+
+
+def edit_distance(a, b):
+    """Levenshtein 编辑距离"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ch_a in enumerate(a, 1):
+        current = [i]
+        for j, ch_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ch_a != ch_b)))
+        previous = current
+    return previous[-1]
+
+
+def max_distance(key):
+    """允许的编辑距离随长度增加：短的拼音差一个字母往往就是另一个字"""
+    if len(key) <= 3:
+        return 0
+    if len(key) <= 7:
+        return 1
+    return 2
+
+
+def pinyin_key(term):
+    """词的全拼（不带声调），非中文部分原样保留，如 微积分A -> weijifena"""
+    return ''.join(lazy_pinyin(term)).lower()
+
+
+def initials_key(term):
+    """词的拼音首字母，如 微积分 -> wjf"""
+    return ''.join(lazy_pinyin(term, style=Style.FIRST_LETTER)).lower()
+
+
+def bigrams(key):
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+class NgramIndex:
+    """
+    按二元组（bigram）建立的倒排索引，用于查找编辑距离不超过 limit 的键
+    一次编辑最多破坏两个二元组，因此距离不超过 limit 的键至少共有 len(bigrams(query)) - 2 * limit 个二元组；
+    先按共有二元组数量和长度差筛出少量候选，再逐个计算编辑距离，不必与所有键比较
+    """
+    def __init__(self):
+        self.keys = []
+        self.key_ids = {}
+        self.postings = defaultdict(list)  # {bigram: [key id]}
+
+    @property
+    def size(self):
+        return len(self.keys)
+
+    def add(self, key):
+        if key in self.key_ids:
+            return
+        key_id = len(self.keys)
+        self.keys.append(key)
+        self.key_ids[key] = key_id
+        for gram in bigrams(key):
+            self.postings[gram].append(key_id)
+
+    def search(self, key, limit):
+        """:return: [(key, distance)]，距离不超过 limit 的全部键"""
+        if limit == 0:
+            return [(key, 0)] if key in self.key_ids else []
+        grams = bigrams(key)
+        threshold = len(grams) - 2 * limit
+        if threshold <= 0:
+            # 查询太短，二元组筛选不起作用
+            candidates = range(len(self.keys))
+        else:
+            counts = defaultdict(int)
+            for gram in grams:
+                for key_id in self.postings.get(gram, ()):
+                    counts[key_id] += 1
+            candidates = [key_id for key_id, count in counts.items() if count >= threshold]
+        result = []
+        for key_id in candidates:
+            candidate = self.keys[key_id]
+            if abs(len(candidate) - len(key)) <= limit:
+                distance = edit_distance(key, candidate)
+                if distance <= limit:
+                    result.append((candidate, distance))
+        return result
+
+
+class FuzzyData:
+    """一份完整的模糊索引词表，全量重建时在新的实例上建立，建好后整体替换"""
+    def __init__(self):
+        self.ngrams = NgramIndex()
+        self.pinyin_terms = defaultdict(set)  # {全拼: {词}}
+        self.initials_terms = defaultdict(set)  # {首字母: {词}}
+
+    def add(self, term):
+        if not INDEXABLE_PATTERN.search(term):
+            return
+        key = pinyin_key(term)
+        if key not in self.pinyin_terms:
+            self.ngrams.add(key)
+        self.pinyin_terms[key].add(term)
+        initials = initials_key(term)
+        if initials != key:
+            self.initials_terms[initials].add(term)
+
+
+class FuzzyIndex:
+    """
+    进程内的拼音模糊索引，词表来自 ItemToken（所有物品的索引词）
+    - 每个词按全拼加入二元组索引，同音字、错别字（输入法选错字）的拼音相同，拼音拼错一两个字母也能在容许的编辑距离内找到
+    - 拼音首字母单独建表，支持 wjf 这样的缩写
+    只保存词表，不保存 posting；查到候选词后再通过 ItemToken 查出物品
+    新词随物品保存增量加入；每隔 SEARCH_INDEX_REBUILD_INTERVAL 秒全量重建，去掉已不存在的词。
+    重建在后台线程中进行，期间查询和物品保存继续使用旧索引
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 同一时间只进行一次全量重建
+        self.build_lock = threading.RLock()
+        self.data = None
+        self.built_at = 0
+        self.rebuilding = False
+        # 重建期间增量加入的词，重建完成后加入新索引
+        self.pending_terms = None
+
+    def load(self):
+        from apps.sales.models import ItemToken
+        data = FuzzyData()
+        for term in ItemToken.objects.filter(field__in=SEARCH_FIELDS).values_list('term', flat=True).distinct().iterator():
+            data.add(term)
+        return data
+
+    def build(self):
+        with self.build_lock:
+            with self.lock:
+                self.pending_terms = []
+            try:
+                data = self.load()
+                with self.lock:
+                    for term in self.pending_terms:
+                        data.add(term)
+                    self.data = data
+                    self.built_at = time.monotonic()
+            finally:
+                with self.lock:
+                    self.pending_terms = None
+                    self.rebuilding = False
+
+    def ensure_built(self):
+        """第一次查询时同步建立；之后过期时在后台重建，查询继续使用旧索引，不被阻塞"""
+        if self.data is None:
+            with self.build_lock:
+                if self.data is None:
+                    self.build()
+            return
+        interval = getattr(settings, 'SEARCH_INDEX_REBUILD_INTERVAL', 600)
+        with self.lock:
+            if self.rebuilding or time.monotonic() - self.built_at <= interval:
+                return
+            self.rebuilding = True
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            self.build()
+        else:
+            threading.Thread(target=self.background_build, name='fuzzy-rebuild', daemon=True).start()
+
+    def background_build(self):
+        # 后台线程使用独立的数据库连接，前后都要清理
+        close_old_connections()
+        try:
+            self.build()
+        except Exception:
+            logger.exception("fuzzy search index rebuild failed")
+        finally:
+            close_old_connections()
+
+    def invalidate(self):
+        with self.lock:
+            self.data = None
+
+    def add_terms(self, terms):
+        terms = list(terms)
+        with self.lock:
+            if self.pending_terms is not None:
+                self.pending_terms.extend(terms)
+            if self.data is None:
+                # 尚未建立，下次查询时全量建立
+                return
+            for term in terms:
+                self.data.add(term)
+
+    def match(self, word):
+        """
+        与查询词模糊匹配的索引词
+        :return: {term: distance}，首字母匹配记为距离 1
+        """
+        key = pinyin_key(word)
+        matches = {}
+        self.ensure_built()
+        with self.lock:
+            data = self.data
+            if data is None:
+                return matches
+            for node_key, distance in data.ngrams.search(key, max_distance(key)):
+                for term in data.pinyin_terms[node_key]:
+                    matches[term] = min(distance, matches.get(term, distance))
+            if word.isascii() and word.isalpha():
+                for term in data.initials_terms.get(word, ()):
+                    matches.setdefault(term, 1)
+        return matches
+
+    def scores(self, field_boosts, keyword):
+        """
+        计算模糊匹配的物品分数：每个查询词取该物品匹配得最好的词，权重为 boost / (1 + 编辑距离)，各查询词相加
+        :return: {item_id: score}
+        """
+        from apps.sales.models import ItemToken
+        word_matches = [self.match(word) for word in dict.fromkeys(tokenize(keyword))]
+        terms = set().union(*word_matches)
+        if not terms:
+            return {}
+        best = defaultdict(float)  # {(item_id, 查询词序号): 最高权重}
+        rows = ItemToken.objects.filter(field__in=list(field_boosts), term__in=terms).values_list('item_id', 'field', 'term')
+        for item_id, field, term in rows.iterator():
+            for position, matches in enumerate(word_matches):
+                if term in matches:
+                    weight = field_boosts[field] / (1 + matches[term])
+                    best[item_id, position] = max(best[item_id, position], weight)
+        result = defaultdict(float)
+        for (item_id, _), weight in best.items():
+            result[item_id] += weight
+        return dict(result)
+
+
+fuzzy_index = FuzzyIndex()
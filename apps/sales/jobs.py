@@ -0,0 +1,185 @@
+import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Avg, Count, ExpressionWrapper, F, DurationField, Min
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 进程内的后台线程池，负责执行匹配任务
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'MATCH_JOB_WORKERS', 2),
+            thread_name_prefix='match-job',
+        )
+    return _executor
+
+
+def enqueue_match_job(kind, obj):
+    """
+    记录一个匹配任务，并在事务提交后交给后台线程执行
+    BACKGROUND_TASKS_EAGER 为 True 时（如测试环境）直接在当前线程执行
+    :param kind: MatchJob.KIND_ITEM 或 MatchJob.KIND_NEED
+    :param obj: 对应的 Item 或 Need
+    """
+    from apps.sales.models import MatchJob
+    job = MatchJob.objects.create(kind=kind, object_id=obj.id)
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        run_match_job(job.id)
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run_in_thread, job.id))
+    return job
+
+
+def _run_in_thread(job_id):
+    # 后台线程使用独立的数据库连接，前后都要清理
+    close_old_connections()
+    try:
+        run_match_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def run_match_job(job_id):
+    """
+    执行一个匹配任务：查找匹配并向双方发送系统通知
+    通过状态的条件更新来认领任务，保证同一任务只被执行一次
+    """
+    from apps.sales.models import MatchJob, Item, Need
+    from apps.chat.views import send_notifications_for_matches
+    claimed = MatchJob.objects.filter(id=job_id, status=MatchJob.STATUS_PENDING).update(
+        status=MatchJob.STATUS_RUNNING, started_at=timezone.now()
+    )
+    if not claimed:
+        return
+    job = MatchJob.objects.get(id=job_id)
+    try:
+        matches = []
+        if job.kind == MatchJob.KIND_ITEM:
+            item = Item._default_manager.select_related('user').filter(id=job.object_id).first()
+            # 任务执行前物品可能已被删除或售出
+            if item and not item.sold:
+                matches = [(item, need) for need in Need.objects.find_matching_needs(item)]
+        elif job.kind == MatchJob.KIND_NEED:
+            need = Need._default_manager.select_related('user').filter(id=job.object_id).first()
+            if need and not need.is_fulfilled:
+                matches = [(item, need) for item in Item.objects.find_matching_items(need)]
+        else:
+            raise ValueError(f"Unknown match job kind: {job.kind}")
+        # 所有匹配的通知一次性批量发送
+        send_notifications_for_matches(matches)
+        job.matches = len(matches)
+        job.status = MatchJob.STATUS_DONE
+    except DatabaseError:
+        # 数据库暂时不可用（连接断开、迁移未完成等），放回待处理，由下一次补跑重试
+        logger.warning("match job %s hit a database error, will retry", job.id, exc_info=True)
+        try:
+            MatchJob.objects.filter(id=job.id).update(status=MatchJob.STATUS_PENDING, started_at=None)
+        except DatabaseError:
+            # 仍处于 running，超过 MATCH_JOB_TIMEOUT 后由 reclaim_stale_jobs 收回
+            logger.exception("failed to requeue match job %s", job.id)
+        return None
+    except Exception as e:
+        job.status = MatchJob.STATUS_FAILED
+        job.error = str(e)
+        logger.exception("match job %s failed", job.id)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'matches', 'error', 'finished_at'])
+    return job
+
+
+def reclaim_stale_jobs(timeout=None):
+    """
+    将开始执行超过 timeout 秒仍处于 running 的任务（执行中进程崩溃或重启）重新置为 pending
+    :param timeout: 默认为 MATCH_JOB_TIMEOUT，应大于任务正常执行的时间，否则任务可能被重复执行
+    :return: 重新置为 pending 的任务数
+    """
+    from apps.sales.models import MatchJob
+    if timeout is None:
+        timeout = getattr(settings, 'MATCH_JOB_TIMEOUT', 600)
+    return MatchJob.objects.filter(
+        status=MatchJob.STATUS_RUNNING, started_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status=MatchJob.STATUS_PENDING, started_at=None)
+
+
+def process_pending_jobs(limit=None):
+    """
+    依次执行所有待处理的任务（包括超时被收回的任务），用于进程重启后补跑积压任务
+    :return: 执行的任务数
+    """
+    from apps.sales.models import MatchJob
+    reclaimed = reclaim_stale_jobs()
+    if reclaimed:
+        logger.warning("reclaimed %d stale match jobs", reclaimed)
+    job_ids = MatchJob.objects.filter(status=MatchJob.STATUS_PENDING).order_by('created_at').values_list('id', flat=True)
+    if limit:
+        job_ids = job_ids[:limit]
+    count = 0
+    for job_id in list(job_ids):
+        run_match_job(job_id)
+        count += 1
+    return count
+
+
+def resume_on_startup():
+    """
+    服务进程（asgi.py / wsgi.py）启动时调用
+    不放在 AppConfig.ready 中，否则 migrate 等管理命令也会在迁移完成前执行任务
+    """
+    if getattr(settings, 'MATCH_JOBS_RESUME_ON_STARTUP', False) and not getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        resume_pending_jobs()
+
+
+def resume_pending_jobs():
+    """
+    进程启动时在后台线程中补跑积压的任务（见 resume_on_startup），不阻塞启动
+    多个 worker 同时补跑时，run_match_job 的条件更新保证每个任务只执行一次
+    """
+    get_executor().submit(_resume_in_thread)
+
+
+def _resume_in_thread():
+    close_old_connections()
+    try:
+        count = process_pending_jobs()
+        if count:
+            logger.info("resumed %d pending match jobs", count)
+    except DatabaseError:
+        # 如在 migrate 之前启动，表尚不存在
+        logger.exception("failed to resume pending match jobs")
+    finally:
+        close_old_connections()
+
+
+def job_stats(recent=100):
+    """
+    统计任务积压和延迟
+    :param recent: 计算平均延迟时使用的最近完成任务数
+    """
+    from apps.sales.models import MatchJob
+    now = timezone.now()
+    counts = dict(MatchJob.objects.values_list('status').annotate(n=Count('id')).order_by())
+    oldest_pending = MatchJob.objects.filter(status=MatchJob.STATUS_PENDING).aggregate(t=Min('created_at'))['t']
+    # MySQL 不支持在 IN 子查询中使用 LIMIT，先取出 id 列表
+    recent_ids = list(MatchJob.objects.filter(
+        status__in=[MatchJob.STATUS_DONE, MatchJob.STATUS_FAILED]
+    ).order_by('-finished_at').values_list('id', flat=True)[:recent])
+    # 延迟：从创建到开始执行的等待时间
+    avg_lag = MatchJob.objects.filter(id__in=recent_ids).aggregate(
+        lag=Avg(ExpressionWrapper(F('started_at') - F('created_at'), output_field=DurationField()))
+    )['lag']
+    return {
+        'pending': counts.get(MatchJob.STATUS_PENDING, 0),
+        'running': counts.get(MatchJob.STATUS_RUNNING, 0),
+        'done': counts.get(MatchJob.STATUS_DONE, 0),
+        'failed': counts.get(MatchJob.STATUS_FAILED, 0),
+        'oldest_pending_seconds': (now - oldest_pending).total_seconds() if oldest_pending else 0,
+        'avg_lag_seconds': avg_lag.total_seconds() if avg_lag else 0,
+    }
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from apps.sales.models import Item, Need
+
+
+class Command(BaseCommand):
+    help = "为已有的 Item 和 Need 计算并保存 title_tokens/course_tokens"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='重新计算所有行，而不仅是尚未分词的行')
+
+    def handle(self, *args, **options):
+        for model in (Item, Need):
+            rows = model._default_manager.all()
+            if not options['all']:
+                rows = rows.filter(title_tokens__isnull=True)
+            count = 0
+            for row in rows.iterator():
+                row.refresh_tokens()
+                row.save(update_fields=['title_tokens', 'course_tokens'])
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f"Backfilled tokens for {count} {model.__name__} rows"))
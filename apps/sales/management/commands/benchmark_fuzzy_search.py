@@ -0,0 +1,110 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from apps.accounts.models import User
+from apps.sales.models import Item, ItemToken
+from apps.sales.fuzzy import FuzzyIndex, edit_distance, max_distance, pinyin_key
+from apps.sales.search import item_search_terms
+
+COURSES = [
+    "微积分", "线性代数", "大学物理", "概率论与数理统计", "数据结构", "操作系统", "计算机网络", "离散数学",
+    "程序设计基础", "模拟电子技术", "数字电子技术", "信号与系统", "电路原理", "复变函数", "数值分析", "编译原理",
+    "有机化学", "无机化学", "分析化学", "物理化学", "理论力学", "材料力学", "量子力学", "机器学习",
+]
+TEACHERS = ["王晓峰", "李明", "张伟", "刘洋", "陈静", "杨帆", "赵磊", "黄鹏", "周琳", "吴昊"]
+SUFFIXES = ["", "习题", "教程", "第二版", "笔记", "辅导", "上册", "下册"]
+# 随机组词作为 description，使词表规模随物品数增长
+CHARS = "一是在不有人这中大为上个国以要时来用生到作地于出就分对成会可主发年动同工能下过子说产种面方后多定行学法所民得经"
+
+
+def random_words(rng, count):
+    return ''.join(''.join(rng.choice(CHARS) for _ in range(rng.randint(2, 3))) + '，' for _ in range(count))
+
+
+class Command(BaseCommand):
+    help = "对比模糊搜索（拼音二元组索引）与 icontains 查询的耗时；在事务中生成测试数据，结束后回滚"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self.create_items(rng, options['items'])
+            queries = [self.typo(rng, pinyin_key(rng.choice(COURSES + TEACHERS))) for _ in range(options['queries'])]
+            self.run(queries)
+            transaction.set_rollback(True)
+
+    def create_items(self, rng, count):
+        user = User.objects.create_user(
+            email="benchmark@mails.tsinghua.edu.cn", username="benchmark@mails.tsinghua.edu.cn", password="benchmark",
+        )
+        items = []
+        for _ in range(count):
+            course = rng.choice(COURSES)
+            teacher = rng.choice(TEACHERS)
+            items.append(Item(
+                title=f"{course}{rng.choice(SUFFIXES)}", username=user.email, user=user,
+                price_lower_bound=10, price_upper_bound=20, course=course, teacher=teacher,
+                meta_info={"author": teacher, "course": course, "teacher": teacher, "description": random_words(rng, 3), "new": 9},
+            ))
+        # bulk_create 不触发 signals，直接写入倒排索引
+        items = Item.objects.bulk_create(items, batch_size=500)
+        ItemToken.objects.bulk_create(
+            [ItemToken(item_id=item.id, field=field, term=term) for item in items for field, term in item_search_terms(item)],
+            batch_size=2000,
+        )
+
+    def typo(self, rng, key):
+        """随机替换一个字母，模拟拼音输入错误"""
+        if len(key) <= 3:
+            return key
+        position = rng.randrange(len(key))
+        return key[:position] + rng.choice('aeioung') + key[position + 1:]
+
+    def run(self, queries):
+        field_boosts = {'title': 1.0, 'course': 1.0, 'teacher': 1.0}
+
+        # 当前的 icontains 查询：拼音查询在中文字段上没有结果，每次都要扫描全表
+        start = time.perf_counter()
+        found = 0
+        for query in queries:
+            condition = Q(title__icontains=query) | Q(course__icontains=query) | Q(teacher__icontains=query)
+            found += bool(Item.objects.filter(condition).exists())
+        self.report("icontains", start, queries, found)
+
+        index = FuzzyIndex()
+        start = time.perf_counter()
+        index.build()
+        self.stdout.write(f"fuzzy index build: {time.perf_counter() - start:.3f}s, {index.data.ngrams.size} pinyin keys")
+
+        # 不用索引：与词表中的每个拼音计算编辑距离
+        keys = list(index.data.pinyin_terms)
+        start = time.perf_counter()
+        found = 0
+        for query in queries:
+            limit = max_distance(query)
+            found += bool([key for key in keys if edit_distance(query, key) <= limit])
+        self.report("linear scan", start, queries, found)
+
+        start = time.perf_counter()
+        found = 0
+        for query in queries:
+            found += bool(index.data.ngrams.search(query, max_distance(query)))
+        self.report("bigram index lookup", start, queries, found)
+
+        start = time.perf_counter()
+        found = 0
+        for query in queries:
+            found += bool(index.scores(field_boosts, query))
+        self.report("fuzzy search (lookup + postings)", start, queries, found)
+
+    def report(self, name, start, queries, found):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{name}: {elapsed * 1000 / len(queries):.2f} ms/query, {found}/{len(queries)} queries with results"
+        )
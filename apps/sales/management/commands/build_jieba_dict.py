@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from apps.sales.dictionary import harvest_terms, write_user_dict
+from apps.sales.tokenizer import reload_dictionary
+
+
+class Command(BaseCommand):
+    help = "从物品、需求和课程表中收集课程名、教师名和书名，生成 jieba 词典；运行中的 worker 会自动重新加载"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='词典文件路径，默认为 settings.JIEBA_CATALOG_DICT')
+        parser.add_argument('--min-title-count', type=int, default=2, help='书名至少出现的次数')
+        parser.add_argument('--no-reindex', action='store_true', help='不按新词典重建搜索和匹配索引')
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'JIEBA_CATALOG_DICT', None)
+        if not path:
+            raise CommandError("JIEBA_CATALOG_DICT is not set, use --output")
+        terms = harvest_terms(min_title_count=options['min_title_count'])
+        write_user_dict(path, terms)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(terms)} terms to {path}"))
+        if options['no_reindex']:
+            return
+        # 索引中的分词需要与查询的分词一致，按新词典重建
+        # 同时重新计算保存的分词，匹配用的字符索引由保存的分词生成
+        reload_dictionary()
+        call_command('rebuild_search_index', tokens=True, stdout=self.stdout)
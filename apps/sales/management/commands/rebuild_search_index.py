@@ -0,0 +1,61 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.sales.models import Item, Need
+from apps.sales.search import rebuild_item_tokens
+from apps.sales.search_backends import get_search_backend
+from apps.sales.search_cache import search_result_cache
+from apps.sales.matching import rebuild_need_tokens
+from apps.sales.tokenizer import dictionary_fingerprint
+
+
+class Command(BaseCommand):
+    help = "重建物品搜索索引和需求匹配索引"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', action='store_true', help='同时按当前词典重新计算保存的 title_tokens/course_tokens')
+        parser.add_argument(
+            '--if-dictionary-changed', action='store_true',
+            help='只在词典与上次 --tokens 重建时不同时重建（用于启动脚本），隐含 --tokens',
+        )
+
+    def handle(self, *args, **options):
+        stamp_path = getattr(settings, 'SEARCH_INDEX_DICT_STAMP', None)
+        fingerprint = dictionary_fingerprint()
+        refresh_tokens = options['tokens'] or options['if_dictionary_changed']
+        if options['if_dictionary_changed'] and stamp_path and read_stamp(stamp_path) == fingerprint:
+            self.stdout.write("Dictionary unchanged, search index is up to date")
+            return
+        backend = get_search_backend()
+        count = 0
+        for item in Item._default_manager.all().iterator():
+            if refresh_tokens:
+                save_tokens(item)
+            rebuild_item_tokens(item)
+            backend.index_item(item)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index for {count} items"))
+        count = 0
+        for need in Need._default_manager.all().iterator():
+            if refresh_tokens:
+                save_tokens(need)
+            rebuild_need_tokens(need)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt match index for {count} needs"))
+        search_result_cache.invalidate()
+        if refresh_tokens and stamp_path:
+            with open(stamp_path, 'w') as f:
+                f.write(fingerprint)
+
+
+def save_tokens(obj):
+    # 直接更新分词列，不触发 post_save，索引由调用方重建
+    obj.refresh_tokens()
+    type(obj)._default_manager.filter(pk=obj.pk).update(title_tokens=obj.title_tokens, course_tokens=obj.course_tokens)
+
+
+def read_stamp(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip()
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.sales.jobs import process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "执行积压的匹配任务，--loop 时作为常驻 worker 持续轮询"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='持续轮询待处理任务')
+        parser.add_argument('--interval', type=float, default=1.0, help='轮询间隔（秒）')
+
+    def handle(self, *args, **options):
+        while True:
+            count = process_pending_jobs()
+            if count:
+                self.stdout.write(self.style.SUCCESS(f"Processed {count} match jobs"))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,172 @@
+from django.db.models import Q
+from .search import item_field_texts, MAX_TERM_LENGTH
+from .tokenizer import tokenize_for_index, tokens_overlap
+
+# 匹配规则用到的字段
+MATCH_FIELDS = ('title', 'course', 'teacher', 'author')
+
+# title/course 的软匹配规则为两个词互为子串（tokens_overlap），只按整词建索引会漏掉 python3编程 与 python 这样的匹配
+# 因此另按字符建索引：较短的词是较长的词的子串时，长度 >= 2 则它的每个二元组都是较长的词的二元组，单字则是较长的词中的一个字
+# 索引端存每个词的二元组（b:）、每个字（c:）和单字词（s:）；查询端查二元组、单字词对应的 c:、每个字对应的 s:
+GRAM_FIELDS = {'title': 'title_gram', 'course': 'course_gram'}
+
+
+def index_grams(words):
+    grams = set()
+    for word in words:
+        grams.update(f"b:{word[i:i + 2]}" for i in range(len(word) - 1))
+        grams.update(f"c:{ch}" for ch in word)
+        if len(word) == 1:
+            grams.add(f"s:{word}")
+    return grams
+
+
+def query_grams(words):
+    grams = set()
+    for word in words:
+        grams.update(f"b:{word[i:i + 2]}" for i in range(len(word) - 1))
+        grams.update(f"s:{ch}" for ch in word)
+        if len(word) == 1:
+            grams.add(f"c:{word}")
+    return grams
+
+
+def rule_tokens(obj):
+    """匹配规则使用的分词：{field: [词]}"""
+    return {'title': obj.get_title_tokens(), 'course': obj.get_course_tokens()}
+
+
+def match_gram_terms(obj):
+    """
+    计算 Item/Need 的字符索引词，与匹配规则使用同一份分词
+    :return: [(field, term)]
+    """
+    return [
+        (GRAM_FIELDS[field], gram)
+        for field, words in rule_tokens(obj).items()
+        for gram in index_grams(words)
+    ]
+
+
+def match_terms(obj):
+    """
+    计算 Item/Need 在匹配字段上的索引词
+    :return: {field: set(term)}
+    """
+    texts = item_field_texts(obj)
+    return {
+        field: {term[:MAX_TERM_LENGTH] for term in tokenize_for_index(texts[field])}
+        for field in MATCH_FIELDS
+    }
+
+
+def rebuild_need_tokens(need):
+    """重建单个需求的匹配索引"""
+    from apps.sales.models import NeedToken
+    NeedToken.objects.filter(need_id=need.id).delete()
+    terms = [(field, term) for field, field_terms in match_terms(need).items() for term in field_terms]
+    NeedToken.objects.bulk_create([
+        NeedToken(need_id=need.id, field=field, term=term)
+        for field, term in terms + match_gram_terms(need)
+    ])
+
+
+def candidate_filter(obj, token_queryset, owner_field):
+    """
+    通过索引缩小候选范围：标题有共同的字符索引词，且 teacher 相同、author 相同或 course 有共同的字符索引词
+    teacher/author 为精确匹配，直接查带索引的列；title/course 为软匹配，查字符索引
+    候选是匹配规则所接受的结果的超集，不会漏掉匹配
+    :param obj: 匹配发起方（Item 或 Need）
+    :param token_queryset: 对方的 ItemToken 或 NeedToken 的 QuerySet
+    :param owner_field: 'item_id' 或 'need_id'
+    :return: 候选的 Q 条件，没有可能的候选时返回 None
+    """
+    tokens = rule_tokens(obj)
+    title_grams = query_grams(tokens['title'])
+    if not title_grams:
+        return None
+    meta_query = Q()
+    for field in ('teacher', 'author'):
+        value = getattr(obj, field)
+        if value is not None:
+            meta_query |= Q(**{field: value})
+    course_grams = query_grams(tokens['course'])
+    if course_grams:
+        course_ids = token_queryset.filter(field=GRAM_FIELDS['course'], term__in=course_grams).values(owner_field)
+        meta_query |= Q(id__in=course_ids)
+    if not meta_query:
+        return None
+    title_ids = token_queryset.filter(field=GRAM_FIELDS['title'], term__in=title_grams).values(owner_field)
+    return Q(id__in=title_ids) & meta_query
+
+
+def find_matching_needs(item):
+    """
+    根据 item 查找匹配的需求：先用索引取候选，再对候选逐一应用匹配规则
+    """
+    from apps.sales.models import Need, NeedToken
+    candidates = candidate_filter(item, NeedToken.objects.all(), 'need_id')
+    if candidates is None:
+        return []
+    # 初步筛选价格匹配的需求,要保证不是自己的需求
+    potential_needs = Need._default_manager.filter(
+        candidates,
+        price_lower_bound__lte=item.price_upper_bound,
+        price_upper_bound__gte=item.price_lower_bound,
+        is_fulfilled=False,  # 只考虑未满足的需求
+    ).exclude(user=item.user).select_related('user')
+    return [need for need in potential_needs if is_item_need_match(item, need)]
+
+
+def find_matching_items(need):
+    """
+    根据需求查找匹配的物品：先用索引取候选，再对候选逐一应用匹配规则
+    """
+    from apps.sales.models import Item, ItemToken
+    candidates = candidate_filter(need, ItemToken.objects.all(), 'item_id')
+    if candidates is None:
+        return []
+    # 初步筛选价格匹配的物品
+    potential_items = Item._default_manager.filter(
+        candidates,
+        price_lower_bound__lte=need.price_upper_bound,
+        price_upper_bound__gte=need.price_lower_bound,
+        sold=False,  # 只考虑未售出的物品
+    ).exclude(user=need.user).select_related('user')
+    return [item for item in potential_items if is_item_need_match(item, need)]
+
+
+def is_item_need_match(item, need):
+    """
+    判断物品与需求是否匹配：标题匹配 且 元数据匹配
+    分词结果直接读取保存在行上的 title_tokens/course_tokens，不再重复调用 jieba
+    """
+    # 标题匹配检查（使用分词软匹配）
+    title_match = False
+    if item.title and need.title:
+        title_match = tokens_overlap(item.get_title_tokens(), need.get_title_tokens())
+
+    # 元数据匹配检查
+    meta_match = False
+    if item.meta_info and need.meta_info:
+        # teacher硬匹配
+        teacher_match = False
+        if 'teacher' in item.meta_info and 'teacher' in need.meta_info:
+            if item.meta_info['teacher'] == need.meta_info['teacher']:
+                teacher_match = True
+
+        # author硬匹配
+        author_match = False
+        if 'author' in item.meta_info and 'author' in need.meta_info:
+            if item.meta_info['author'] == need.meta_info['author']:
+                author_match = True
+
+        # course软匹配
+        course_match = False
+        if 'course' in item.meta_info and 'course' in need.meta_info:
+            course_match = tokens_overlap(item.get_course_tokens(), need.get_course_tokens())
+
+        # 元数据匹配成功条件：teacher硬匹配 或 author硬匹配 或 course软匹配
+        meta_match = teacher_match or author_match or course_match
+    # 最终匹配条件：标题匹配 且 元数据匹配
+    return title_match and meta_match
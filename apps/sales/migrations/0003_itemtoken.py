@@ -0,0 +1,65 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:15
+
+import unicodedata
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# 迁移中的分词规则固定为编写时的版本，不引用应用代码，之后修改分词不会改变这个迁移的行为
+# 启动脚本中的 rebuild_search_index --if-dictionary-changed 会按当前规则和词典重新建立索引
+STOP_WORDS = {"的", "了", "和", "是", "在", "有", "我", "也", "教材", "教程", "入门", "书籍", "课程", "导论"}
+SEARCH_FIELDS = ('title', 'course', 'teacher', 'author', 'description', 'username')
+META_SEARCH_FIELDS = ('course', 'teacher', 'author', 'description')
+MAX_TERM_LENGTH = 100
+
+
+def index_words(text):
+    import jieba
+    if not text:
+        return set()
+    text = unicodedata.normalize('NFKC', str(text)).strip()
+    words = (word.strip().lower() for word in jieba.lcut_for_search(text))
+    return {word for word in words if word and word not in STOP_WORDS}
+
+
+def item_search_terms(item):
+    texts = {'title': item.title, 'username': item.username}
+    meta_info = item.meta_info or {}
+    for field in META_SEARCH_FIELDS:
+        value = meta_info.get(field)
+        texts[field] = value if isinstance(value, str) else None
+    return sorted({(field, term[:MAX_TERM_LENGTH]) for field, text in texts.items() for term in index_words(text)})
+
+
+def build_item_tokens(apps, schema_editor):
+    Item = apps.get_model('sales', 'Item')
+    ItemToken = apps.get_model('sales', 'ItemToken')
+    for item in Item.objects.all().iterator():
+        ItemToken.objects.bulk_create([
+            ItemToken(item_id=item.id, field=field, term=term)
+            for field, term in item_search_terms(item)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0002_alter_item_price_lower_bound_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=20)),
+                ('term', models.CharField(max_length=100)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='sales.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['field', 'term'], name='sales_itemt_field_244a97_idx')],
+                'unique_together': {('item', 'field', 'term')},
+            },
+        ),
+        migrations.RunPython(build_item_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0003_itemtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='course_tokens',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='title_tokens',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='need',
+            name='course_tokens',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='need',
+            name='title_tokens',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
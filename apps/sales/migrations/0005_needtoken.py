@@ -0,0 +1,64 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:21
+
+import unicodedata
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# 迁移中的分词规则固定为编写时的版本，不引用应用代码，之后修改分词不会改变这个迁移的行为
+STOP_WORDS = {"的", "了", "和", "是", "在", "有", "我", "也", "教材", "教程", "入门", "书籍", "课程", "导论"}
+MATCH_FIELDS = ('title', 'course', 'teacher', 'author')
+MAX_TERM_LENGTH = 100
+
+
+def index_words(text):
+    import jieba
+    if not text:
+        return set()
+    text = unicodedata.normalize('NFKC', str(text)).strip()
+    words = (word.strip().lower() for word in jieba.lcut_for_search(text))
+    return {word for word in words if word and word not in STOP_WORDS}
+
+
+def match_terms(need):
+    meta_info = need.meta_info or {}
+    texts = {'title': need.title}
+    for field in MATCH_FIELDS[1:]:
+        value = meta_info.get(field)
+        texts[field] = value if isinstance(value, str) else None
+    return {field: {term[:MAX_TERM_LENGTH] for term in index_words(texts[field])} for field in MATCH_FIELDS}
+
+
+def build_need_tokens(apps, schema_editor):
+    Need = apps.get_model('sales', 'Need')
+    NeedToken = apps.get_model('sales', 'NeedToken')
+    for need in Need.objects.all().iterator():
+        NeedToken.objects.bulk_create([
+            NeedToken(need_id=need.id, field=field, term=term)
+            for field, terms in match_terms(need).items()
+            for term in terms
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_item_need_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NeedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=20)),
+                ('term', models.CharField(max_length=100)),
+                ('need', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_tokens', to='sales.need')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['field', 'term'], name='sales_needt_field_8a459c_idx')],
+                'unique_together': {('need', 'field', 'term')},
+            },
+        ),
+        migrations.RunPython(build_need_tokens, migrations.RunPython.noop),
+    ]
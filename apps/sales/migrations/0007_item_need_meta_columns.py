@@ -0,0 +1,81 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+# 与编写时 MetaColumnsMixin.sync_meta_columns 的规则相同，固定在迁移中，不引用应用代码
+META_COLUMNS = ('course', 'teacher', 'author')
+
+
+def sync_meta_columns(row):
+    meta_info = row.meta_info or {}
+    for field in META_COLUMNS:
+        value = meta_info.get(field)
+        setattr(row, field, value[:255] if isinstance(value, str) else None)
+    new = meta_info.get('new')
+    row.condition = new if isinstance(new, int) and not isinstance(new, bool) and 0 <= new <= 32767 else None
+
+
+def fill_meta_columns(apps, schema_editor):
+    for model_name in ('Item', 'Need'):
+        model = apps.get_model('sales', model_name)
+        fields = list(META_COLUMNS) + ['condition']
+        rows = []
+        for row in model.objects.all().iterator():
+            sync_meta_columns(row)
+            rows.append(row)
+            if len(rows) >= 500:
+                model.objects.bulk_update(rows, fields)
+                rows = []
+        model.objects.bulk_update(rows, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_matchjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='author',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='condition',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='course',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='teacher',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='need',
+            name='author',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='need',
+            name='condition',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='need',
+            name='course',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='need',
+            name='teacher',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(fill_meta_columns, migrations.RunPython.noop),
+    ]
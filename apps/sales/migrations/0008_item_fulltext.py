@@ -0,0 +1,83 @@
+import unicodedata
+from django.db import migrations
+
+# 建表语句和写入规则固定为编写时 search_backends 中的版本，不引用应用代码
+# 之后修改分词或后端不会改变这个迁移的行为；启动脚本中的 rebuild_search_index 会按当前规则重新写入
+STOP_WORDS = {"的", "了", "和", "是", "在", "有", "我", "也", "教材", "教程", "入门", "书籍", "课程", "导论"}
+SEARCH_FIELDS = ('title', 'course', 'teacher', 'author', 'description', 'username')
+META_SEARCH_FIELDS = ('course', 'teacher', 'author', 'description')
+FTS5_TABLE = 'sales_item_fts'
+FTS5_ROWS_PER_ITEM = 8
+MYSQL_TABLE = 'sales_item_fulltext'
+
+
+def index_words(text):
+    import jieba
+    if not text:
+        return set()
+    text = unicodedata.normalize('NFKC', str(text)).strip()
+    words = (word.strip().lower() for word in jieba.lcut_for_search(text))
+    return {word for word in words if word and word not in STOP_WORDS}
+
+
+def item_field_texts(item):
+    texts = {'title': item.title, 'username': item.username}
+    meta_info = item.meta_info or {}
+    for field in META_SEARCH_FIELDS:
+        value = meta_info.get(field)
+        texts[field] = value if isinstance(value, str) else None
+    return texts
+
+
+def create_fulltext_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in ('sqlite', 'mysql'):
+        # 其他数据库使用 bm25 后端，没有全文索引表
+        return
+    Item = apps.get_model('sales', 'Item')
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS5_TABLE} USING fts5(body)")
+            for item in Item.objects.all().iterator():
+                texts = item_field_texts(item)
+                for position, field in enumerate(SEARCH_FIELDS):
+                    body = ' '.join(sorted(index_words(texts[field])))
+                    if body:
+                        cursor.execute(
+                            f"INSERT INTO {FTS5_TABLE} (rowid, body) VALUES (%s, %s)",
+                            [item.id * FTS5_ROWS_PER_ITEM + position, body],
+                        )
+        else:
+            columns = ', '.join(f"{field} LONGTEXT" for field in SEARCH_FIELDS)
+            indexes = ', '.join(f"FULLTEXT KEY ft_{field} ({field}) WITH PARSER ngram" for field in SEARCH_FIELDS)
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {MYSQL_TABLE} ("
+                f"item_id INT NOT NULL PRIMARY KEY, {columns}, {indexes}"
+                f") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+            )
+            placeholders = ', '.join(['%s'] * (len(SEARCH_FIELDS) + 1))
+            for item in Item.objects.all().iterator():
+                texts = item_field_texts(item)
+                cursor.execute(
+                    f"REPLACE INTO {MYSQL_TABLE} (item_id, {', '.join(SEARCH_FIELDS)}) VALUES ({placeholders})",
+                    [item.id, *(texts[field] for field in SEARCH_FIELDS)],
+                )
+
+
+def drop_fulltext_table(apps, schema_editor):
+    table = {'sqlite': FTS5_TABLE, 'mysql': MYSQL_TABLE}.get(schema_editor.connection.vendor)
+    if table is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_item_need_meta_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_table, drop_fulltext_table),
+    ]
@@ -0,0 +1,55 @@
+import unicodedata
+from django.db import migrations
+
+# 分词和字符索引词的规则固定为编写时的版本，不引用应用代码，之后修改规则不会改变这个迁移的行为
+STOP_WORDS = {"的", "了", "和", "是", "在", "有", "我", "也", "教材", "教程", "入门", "书籍", "课程", "导论"}
+GRAM_FIELDS = {'title': 'title_gram', 'course': 'course_gram'}
+
+
+def unique_tokens(text):
+    import jieba
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', str(text)).strip()
+    words = (word.strip().lower() for word in jieba.lcut(text))
+    return list(dict.fromkeys(word for word in words if word and word not in STOP_WORDS))
+
+
+def index_grams(words):
+    grams = set()
+    for word in words:
+        grams.update(f"b:{word[i:i + 2]}" for i in range(len(word) - 1))
+        grams.update(f"c:{ch}" for ch in word)
+        if len(word) == 1:
+            grams.add(f"s:{word}")
+    return grams
+
+
+def build_gram_tokens(apps, schema_editor):
+    for model_name, token_model_name, owner_field in (('Item', 'ItemToken', 'item_id'), ('Need', 'NeedToken', 'need_id')):
+        model = apps.get_model('sales', model_name)
+        token_model = apps.get_model('sales', token_model_name)
+        token_model.objects.filter(field__in=GRAM_FIELDS.values()).delete()
+        for obj in model.objects.all().iterator():
+            # 历史模型没有 get_title_tokens 等方法，按相同规则计算
+            course = (obj.meta_info or {}).get('course')
+            tokens = {
+                'title': obj.title_tokens if obj.title_tokens is not None else unique_tokens(obj.title),
+                'course': obj.course_tokens if obj.course_tokens is not None else (unique_tokens(course) if isinstance(course, str) else []),
+            }
+            token_model.objects.bulk_create([
+                token_model(**{owner_field: obj.id, 'field': GRAM_FIELDS[field], 'term': gram})
+                for field, words in tokens.items()
+                for gram in index_grams(words)
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_item_fulltext'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_gram_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0009_match_gram_tokens'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchase',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=8),
+        ),
+    ]
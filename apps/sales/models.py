@@ -1,43 +1,25 @@
-import jieba
 from django.db import models
-from django.db.models import Q
 import os
+from .search import search_field_boosts
+from .search_backends import get_search_backend
+from .matching import find_matching_items, find_matching_needs
+from .tokenizer import unique_tokens
 
 class ItemManager(models.Manager):
     def filter(self, *args, **kwargs):
         # 提取自定义过滤参数
         content_type = kwargs.pop('content_type', None)
         search_keyword = kwargs.pop('search_keyword', None)
+        field_boosts = kwargs.pop('field_boosts', None)
         print("Custom filter called with args:", args, "kwargs:", kwargs)
         # 初步过滤
         query = super().filter(*args, **kwargs)
 
         # 根据 content_type 和 search_keyword 动态构建查询条件
         if search_keyword:
-            words = jieba.lcut(search_keyword)  # 使用 jieba 分词
-            stop_words = {"的", "了", "和", "是", "在", "有", "我", "也", "教材", "教程", "入门", "书籍", "课程", "导论"}
-            words = [word for word in words if word not in stop_words]  # 去除停用词
-            if words:
-                search_query = Q()
-                for word in words:
-                    # 根据 content_type 动态选择字段
-                    if content_type == "title":
-                        search_query |= Q(title__icontains=word)
-                    elif content_type == "course":
-                        search_query |= Q(meta_info__course__icontains=word)
-                    elif content_type == "teacher":
-                        search_query |= Q(meta_info__teacher__icontains=word)
-                    elif content_type == "author":
-                        search_query |= Q(meta_info__author__icontains=word)
-                    elif content_type == "username":
-                        search_query |= Q(username__icontains=word)
-                    elif content_type == "description":
-                        search_query |= Q(meta_info__description__icontains=word)
-                    else:
-                        # 如果 content_type 未指定或无效，默认搜索 title
-                        search_query |= Q(title__icontains=word)
-
-                query = query.filter(search_query)
+            # 由搜索后端（全文索引或倒排索引）筛选，全文索引后端同时按相关度排序
+            # 多个字段时匹配任一字段即可，相关度按字段权重相加
+            query = get_search_backend().filter(query, field_boosts or search_field_boosts(content_type), search_keyword)
         return query
     def find_matching_items(self, need):
         """
@@ -45,79 +27,65 @@ class ItemManager(models.Manager):
         :param need: Need实例
         :return: 匹配的Item列表
         """
-        # 初步筛选价格匹配的物品
-        potential_items = super().filter(
-            price_lower_bound__lte=need.price_upper_bound,
-            price_upper_bound__gte=need.price_lower_bound,
-            sold=False  # 只考虑未售出的物品
-        ).exclude(user=need.user)
-        
-        matching_items = []
-        
-        for item in potential_items:
-            # 标题匹配检查（使用分词软匹配）
-            title_match = False
-            if item.title and need.title:
-                # 使用jieba分词处理标题
-                item_words = jieba.lcut(item.title)
-                need_words = jieba.lcut(need.title)
-                
-                # 去除停用词
-                stop_words = {"的", "了", "和", "是", "在", "有", "我", "也", "教材", "教程", "入门", "书籍", "课程", "导论"}
-                item_words = [word.lower() for word in item_words if word not in stop_words]
-                need_words = [word.lower() for word in need_words if word not in stop_words]
-                
-                # 检查词语匹配
-                for item_word in item_words:
-                    if any(item_word in need_word or need_word in item_word for need_word in need_words):
-                        title_match = True
-                        break
-            
-            # 元数据匹配检查
-            meta_match = False
-            
-            if item.meta_info and need.meta_info:
-                # teacher硬匹配
-                teacher_match = False
-                if 'teacher' in item.meta_info and 'teacher' in need.meta_info:
-                    if item.meta_info['teacher'] == need.meta_info['teacher']:
-                        teacher_match = True
-                
-                # author硬匹配
-                author_match = False
-                if 'author' in item.meta_info and 'author' in need.meta_info:
-                    if item.meta_info['author'] == need.meta_info['author']:
-                        author_match = True
-                
-                # course软匹配
-                course_match = False
-                if 'course' in item.meta_info and 'course' in need.meta_info:
-                    item_course = item.meta_info['course']
-                    need_course = need.meta_info['course']
-                    
-                    # 使用jieba分词处理课程名
-                    item_course_words = jieba.lcut(item_course)
-                    need_course_words = jieba.lcut(need_course)
+        # 先通过索引缩小候选范围，再对候选应用匹配规则
+        return find_matching_items(need)
 
-                    # 去除停用词
-                    stop_words = {"的", "了", "和", "是", "在", "有", "我", "也", "教材", "教程", "入门", "书籍", "课程", "导论"}
-                    item_course_words = [word.lower() for word in item_course_words if word not in stop_words]
-                    need_course_words = [word.lower() for word in need_course_words if word not in stop_words]
-                    
-                    # 检查课程名词语匹配
-                    for item_word in item_course_words:
-                        if any(item_word in need_word or need_word in item_word for need_word in need_course_words):
-                            course_match = True
-                            break
-                
-                # 元数据匹配成功条件：teacher硬匹配 或 author硬匹配 或 course软匹配
-                meta_match = teacher_match or author_match or course_match
-            # 最终匹配条件：标题匹配 且 元数据匹配
-            if title_match and meta_match:
-                matching_items.append(item)
-        return matching_items
-    
-class Item(models.Model):
+# 从 meta_info 冗余出来的列，建有索引，用于等值查询
+META_COLUMNS = ('course', 'teacher', 'author')
+
+
+class MetaColumnsMixin:
+    """
+    Item 和 Need 共用：把 meta_info 中的 course/teacher/author/new 同步到独立的带索引列
+    meta_info 仍是原始数据，列只用于查询；每次保存时同步（序列化器、后台、ORM 都经过 save）
+    """
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'meta_info' in update_fields:
+            self.sync_meta_columns()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | set(META_COLUMNS) | {'condition'}
+        super().save(*args, **kwargs)
+
+    def sync_meta_columns(self):
+        meta_info = self.meta_info or {}
+        for field in META_COLUMNS:
+            value = meta_info.get(field)
+            setattr(self, field, value[:255] if isinstance(value, str) else None)
+        new = meta_info.get('new')
+        self.condition = new if isinstance(new, int) and not isinstance(new, bool) and 0 <= new <= 32767 else None
+
+class TokenizedMixin:
+    """
+    Item 和 Need 共用：title 与 meta_info['course'] 的预分词结果
+    与 MetaColumnsMixin 一样在每次写入 title 或 meta_info 的 save 时重新分词（序列化器、后台、ORM 都经过 save）
+    title_tokens/course_tokens 为 None 表示尚未计算（如加入分词列之前已有的行，见 backfill_tokens）
+    """
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'title', 'meta_info'} & set(update_fields):
+            self.refresh_tokens()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'title_tokens', 'course_tokens'}
+        super().save(*args, **kwargs)
+
+    def refresh_tokens(self):
+        self.title_tokens = unique_tokens(self.title)
+        course = (self.meta_info or {}).get('course')
+        self.course_tokens = unique_tokens(course) if isinstance(course, str) else []
+
+    def get_title_tokens(self):
+        if self.title_tokens is None:
+            return unique_tokens(self.title)
+        return self.title_tokens
+
+    def get_course_tokens(self):
+        if self.course_tokens is None:
+            course = (self.meta_info or {}).get('course')
+            return unique_tokens(course) if isinstance(course, str) else []
+        return self.course_tokens
+
+class Item(TokenizedMixin, MetaColumnsMixin, models.Model):
     class Meta:
         app_label = 'sales'
     title = models.CharField(max_length=255) # eg. the name of the product
@@ -130,6 +98,14 @@ class Item(models.Model):
     # meta_info include author, course, teacher, description, new
     # Image field for item picture
     picture = models.ImageField(upload_to='item_pictures/', null=True, blank=True)  
+    # 预分词结果（小写、去停用词），保存时计算一次，匹配时直接使用
+    title_tokens = models.JSONField(null=True, blank=True)
+    course_tokens = models.JSONField(null=True, blank=True)
+    # meta_info 中字段的冗余列，带索引，meta_info 中没有该字段时为 NULL
+    course = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    teacher = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    author = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    condition = models.PositiveSmallIntegerField(null=True, blank=True, db_index=True)  # meta_info['new']
     # Indicates if the item is sold
     sold = models.BooleanField(default=False)  
     id = models.AutoField(primary_key=True)  
@@ -145,6 +121,24 @@ class Item(models.Model):
     def __str__(self):
         return self.title
 
+class ItemToken(models.Model):
+    """
+    物品搜索倒排索引：每行是 (字段, 词) -> 物品 的一条 posting
+    在 Item 保存时由 signals 重建，Item 删除时级联删除
+    """
+    class Meta:
+        app_label = 'sales'
+        unique_together = ('item', 'field', 'term')
+        indexes = [
+            models.Index(fields=['field', 'term']),
+        ]
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='search_tokens')
+    field = models.CharField(max_length=20)  # title, course, teacher, author, description, username
+    term = models.CharField(max_length=100)  # 分词后的小写词
+
+    def __str__(self):
+        return f"{self.field}:{self.term} -> {self.item_id}"
+
 class NeedManager(models.Manager):
     def find_matching_needs(self, item):
         """
@@ -152,80 +146,10 @@ class NeedManager(models.Manager):
         :param item: Item实例
         :return: 匹配的Need列表
         """
-        # 初步筛选价格匹配的需求,要保证不是自己的需求
-        potential_needs = super().filter(
-            price_lower_bound__lte=item.price_upper_bound,
-            price_upper_bound__gte=item.price_lower_bound,
-            is_fulfilled=False  # 只考虑未满足的需求
-        ).exclude(user=item.user)
-        
-        matching_needs = []
-        
-        for need in potential_needs:
-            # 标题匹配检查（使用分词软匹配）
-            title_match = False
-            if item.title and need.title:
-                # 使用jieba分词处理标题
-                item_words = jieba.lcut(item.title)
-                need_words = jieba.lcut(need.title)
-                
-                # 去除停用词
-                stop_words = {"的", "了", "和", "是", "在", "有", "我", "也", "教材", "教程", "入门", "书籍", "课程", "导论"}
-                item_words = [word.lower() for word in item_words if word not in stop_words]
-                need_words = [word.lower() for word in need_words if word not in stop_words]
-                
-                # 检查词语匹配
-                for item_word in item_words:
-                    if any(item_word in need_word or need_word in item_word for need_word in need_words):
-                        title_match = True
-                        break
-            
-            # 元数据匹配检查
-            meta_match = False
-            
-            if item.meta_info and need.meta_info:
-                # teacher硬匹配
-                teacher_match = False
-                if 'teacher' in item.meta_info and 'teacher' in need.meta_info:
-                    if item.meta_info['teacher'] == need.meta_info['teacher']:
-                        teacher_match = True
-                
-                # author硬匹配
-                author_match = False
-                if 'author' in item.meta_info and 'author' in need.meta_info:
-                    if item.meta_info['author'] == need.meta_info['author']:
-                        author_match = True
-                
-                # course软匹配
-                course_match = False
-                if 'course' in item.meta_info and 'course' in need.meta_info:
-                    item_course = item.meta_info['course']
-                    need_course = need.meta_info['course']
-                    
-                    # 使用jieba分词处理课程名
-                    item_course_words = jieba.lcut(item_course)
-                    need_course_words = jieba.lcut(need_course)
-
-                    # 去除停用词
-                    item_course_words = [word.lower() for word in item_course_words if word not in stop_words]
-                    need_course_words = [word.lower() for word in need_course_words if word not in stop_words]
-                    
-                    # 检查课程名词语匹配
-                    for item_word in item_course_words:
-                        if any(item_word in need_word or need_word in item_word for need_word in need_course_words):
-                            course_match = True
-                            break
-                
-                # 元数据匹配成功条件：teacher硬匹配 或 author硬匹配 或 course软匹配
-                meta_match = teacher_match or author_match or course_match
-            
-            # 最终匹配条件：标题匹配 且 元数据匹配
-            if title_match and meta_match:
-                matching_needs.append(need)
-        
-        return matching_needs
+        # 先通过索引缩小候选范围，再对候选应用匹配规则
+        return find_matching_needs(item)
 
-class Need(models.Model):
+class Need(TokenizedMixin, MetaColumnsMixin, models.Model):
     class Meta:
         app_label = 'sales'
     title = models.CharField(max_length=255) # eg. the name of the item
@@ -235,6 +159,14 @@ class Need(models.Model):
     user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='needs')
     meta_info = models.JSONField(null=True, blank=True)  # Meta information include author, course, teacher, new
     is_fulfilled = models.BooleanField(default=False)  # Indicates if the need is fulfilled
+    # 预分词结果（小写、去停用词），保存时计算一次，匹配时直接使用
+    title_tokens = models.JSONField(null=True, blank=True)
+    course_tokens = models.JSONField(null=True, blank=True)
+    # meta_info 中字段的冗余列，带索引，meta_info 中没有该字段时为 NULL
+    course = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    teacher = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    author = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    condition = models.PositiveSmallIntegerField(null=True, blank=True, db_index=True)  # meta_info['new']
     id = models.AutoField(primary_key=True)
 
     objects = NeedManager()
@@ -242,6 +174,24 @@ class Need(models.Model):
     def __str__(self):
         return self.title
 
+class NeedToken(models.Model):
+    """
+    需求匹配倒排索引：每行是 (字段, 词) -> 需求 的一条 posting
+    字段为 title, course, teacher, author，在 Need 保存时由 signals 重建
+    """
+    class Meta:
+        app_label = 'sales'
+        unique_together = ('need', 'field', 'term')
+        indexes = [
+            models.Index(fields=['field', 'term']),
+        ]
+    need = models.ForeignKey(Need, on_delete=models.CASCADE, related_name='match_tokens')
+    field = models.CharField(max_length=20)
+    term = models.CharField(max_length=100)
+
+    def __str__(self):
+        return f"{self.field}:{self.term} -> {self.need_id}"
+
 class Purchase(models.Model):
     class Meta:
         app_label = 'sales'
@@ -262,3 +212,31 @@ class Purchase(models.Model):
 
     def __str__(self):
         return f"Purchase of {self.item.title} by {self.buyer.username} from {self.seller.username}"
+
+class MatchJob(models.Model):
+    """
+    后台匹配任务：物品/需求发布或修改后，在后台线程中查找匹配并发送通知
+    """
+    KIND_ITEM = 'item'  # object_id 为 Item.id，查找匹配的需求
+    KIND_NEED = 'need'  # object_id 为 Need.id，查找匹配的物品
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    class Meta:
+        app_label = 'sales'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    kind = models.CharField(max_length=10)
+    object_id = models.IntegerField()
+    status = models.CharField(max_length=10, default=STATUS_PENDING)
+    matches = models.IntegerField(default=0)  # 匹配到的数量
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"MatchJob {self.id}: {self.kind} {self.object_id} ({self.status})"
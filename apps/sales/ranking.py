@@ -0,0 +1,162 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db import close_old_connections
+from .search import SEARCH_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+
+class Bm25Data:
+    """一份完整的 BM25 索引数据，全量重建时在新的实例上建立，建好后整体替换"""
+    def __init__(self):
+        self.postings = defaultdict(lambda: defaultdict(set))  # {field: {term: set(item_id)}}
+        self.lengths = defaultdict(lambda: defaultdict(int))  # {field: {item_id: 词数}}
+        self.total_lengths = defaultdict(int)  # {field: 词数之和}，计算平均长度时不必遍历所有物品
+        self.item_terms = defaultdict(list)  # {item_id: [(field, term)]}，增量更新时用来删除旧的 posting
+
+    def add(self, item_id, field, term):
+        self.postings[field][term].add(item_id)
+        self.lengths[field][item_id] += 1
+        self.total_lengths[field] += 1
+        self.item_terms[item_id].append((field, term))
+
+    def discard(self, item_id):
+        for field, term in self.item_terms.pop(item_id, []):
+            self.postings[field][term].discard(item_id)
+            self.total_lengths[field] -= self.lengths[field].pop(item_id, 0)
+
+    def replace(self, item_id, terms):
+        self.discard(item_id)
+        for field, term in terms:
+            self.add(item_id, field, term)
+
+
+class Bm25Index:
+    """
+    进程内的 BM25 索引，数据来自 ItemToken（每个字段的去重分词）
+    ItemToken 不记录词频，tf 取 1，文档长度为该字段的词数；对标题这类短文本影响很小
+    物品变化时增量更新；每隔 SEARCH_INDEX_REBUILD_INTERVAL 秒从数据库全量重建，
+    以纳入其他进程写入的变化。重建在后台线程中进行，期间查询继续使用旧索引
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 同一时间只进行一次全量重建
+        self.build_lock = threading.RLock()
+        self.data = None
+        self.built_at = 0
+        self.rebuilding = False
+        # 重建期间的增量更新 [(item_id, terms)]，terms 为 None 表示删除；重建完成后重放到新索引上
+        self.pending_updates = None
+
+    def load(self):
+        from apps.sales.models import ItemToken
+        data = Bm25Data()
+        for field, term, item_id in ItemToken.objects.filter(field__in=SEARCH_FIELDS).values_list('field', 'term', 'item_id').iterator():
+            data.add(item_id, field, term)
+        return data
+
+    def build(self):
+        with self.build_lock:
+            with self.lock:
+                self.pending_updates = []
+            try:
+                data = self.load()
+                with self.lock:
+                    for item_id, terms in self.pending_updates:
+                        data.replace(item_id, terms or [])
+                    self.data = data
+                    self.built_at = time.monotonic()
+            finally:
+                with self.lock:
+                    self.pending_updates = None
+                    self.rebuilding = False
+
+    def ensure_built(self):
+        """第一次查询时同步建立；之后过期时在后台重建，查询继续使用旧索引，不被阻塞"""
+        if self.data is None:
+            with self.build_lock:
+                if self.data is None:
+                    self.build()
+            return
+        interval = getattr(settings, 'SEARCH_INDEX_REBUILD_INTERVAL', 600)
+        with self.lock:
+            if self.rebuilding or time.monotonic() - self.built_at <= interval:
+                return
+            self.rebuilding = True
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            self.build()
+        else:
+            threading.Thread(target=self.background_build, name='bm25-rebuild', daemon=True).start()
+
+    def background_build(self):
+        # 后台线程使用独立的数据库连接，前后都要清理
+        close_old_connections()
+        try:
+            self.build()
+        except Exception:
+            logger.exception("search ranking index rebuild failed")
+        finally:
+            close_old_connections()
+
+    def invalidate(self):
+        with self.lock:
+            self.data = None
+
+    def update_item(self, item_id, terms):
+        """
+        用新的索引词替换物品原有的索引词
+        :param terms: [(field, term)]，即 item_search_terms 的返回值
+        """
+        with self.lock:
+            if self.pending_updates is not None:
+                self.pending_updates.append((item_id, list(terms)))
+            if self.data is not None:
+                # 尚未建立时不需要处理，下次查询时全量建立
+                self.data.replace(item_id, terms)
+
+    def remove_item(self, item_id):
+        with self.lock:
+            if self.pending_updates is not None:
+                self.pending_updates.append((item_id, None))
+            if self.data is not None:
+                self.data.discard(item_id)
+
+    def scores(self, field_boosts, words):
+        """
+        计算包含任一查询词的物品的 BM25 分数，多个字段按权重相加
+        :param field_boosts: {field: boost}
+        :param words: 查询分词
+        :return: {item_id: score}
+        """
+        self.ensure_built()
+        with self.lock:
+            data = self.data
+            result = defaultdict(float)
+            if data is None:
+                return {}
+            for field, boost in field_boosts.items():
+                lengths = data.lengths.get(field)
+                if not lengths:
+                    continue
+                total = len(lengths)
+                avg_length = data.total_lengths[field] / total
+                for word in set(words):
+                    item_ids = data.postings[field].get(word)
+                    if not item_ids:
+                        continue
+                    idf = math.log(1 + (total - len(item_ids) + 0.5) / (len(item_ids) + 0.5))
+                    for item_id in item_ids:
+                        norm = 1 - B + B * lengths[item_id] / avg_length
+                        result[item_id] += boost * idf * (K1 + 1) / (1 + K1 * norm)
+            return dict(result)
+
+
+search_ranking = Bm25Index()
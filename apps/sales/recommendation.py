@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from .tokenizer import tokenize
+
+logger = logging.getLogger(__name__)
+
+# 参与推荐的文本特征
+FEATURE_FIELDS = ('title', 'author', 'course', 'teacher', 'description')
+
+# 增量变化超过基础模型物品数的该比例时全量重新拟合
+# 增量向量沿用旧词表和旧 IDF，新词不计入，变化越多偏差越大
+REFIT_CHANGE_RATIO = 0.1
+
+
+def analyze(text):
+    """TF-IDF 使用的中文分析器：jieba 分词，去掉停用词和纯标点"""
+    return [word for word in tokenize(text) if any(ch.isalnum() for ch in word)]
+
+
+def feature_text(title, meta_info):
+    """把 title 和 meta_info 中的特征拼成一段文本"""
+    texts = [title] if title else []
+    meta_info = meta_info or {}
+    for field in FEATURE_FIELDS[1:]:
+        value = meta_info.get(field)
+        if value is not None:
+            texts.append(str(value))
+    return " ".join(texts)
+
+
+class RecommendationIndex:
+    """
+    全部未售出物品上的 TF-IDF 模型
+    物品向量以稀疏矩阵保存，计算用户需求与所有物品的相似度只需一次稀疏矩阵乘法
+
+    物品新增、修改、售出、删除时不重新拟合，而是用现有词表增量更新：
+    - delta 保存新增或修改后的物品向量
+    - removed 记录基础矩阵中已失效（删除、售出或被 delta 覆盖）的物品
+    变化累积到一定比例，或每隔 RECOMMENDATION_REFIT_INTERVAL 秒，在后台全量重新拟合
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        # (vectorizer, 物品矩阵, item_ids, {item_id: 行号}) 整体替换，读取时不会看到不一致的中间状态
+        # 物品矩阵为 (物品数, 词表大小) 的稀疏矩阵，行已 L2 归一化
+        self.model = (None, None, [], {})
+        self.delta = {}
+        self.removed = set()
+        self.dirty = True
+        # 每次全量拟合后加一，推荐结果缓存据此判断物品池是否有较大变化
+        self.generation = 0
+        self.refitting = False
+        # 单线程执行，保证增量更新和重新拟合按提交顺序应用
+        self.executor = None
+        self.refit_thread = None
+
+    def invalidate(self):
+        self.dirty = True
+
+    def fit(self):
+        from apps.sales.models import Item
+        # scikit-learn 导入较慢，第一次拟合时才导入（LAZY_LOAD_SKLEARN 为 False 时在启动预热中导入）
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        rows = list(Item._default_manager.filter(sold=False).values_list('id', 'title', 'meta_info'))
+        texts = [feature_text(title, meta_info) for _, title, meta_info in rows]
+        vectorizer = TfidfVectorizer(tokenizer=analyze, lowercase=False, token_pattern=None)
+        try:
+            matrix = vectorizer.fit_transform(texts)
+        except ValueError:
+            # 没有物品或词表为空
+            vectorizer, matrix = None, None
+        item_ids = [item_id for item_id, _, _ in rows]
+        with self.lock:
+            self.model = (vectorizer, matrix, item_ids, {item_id: i for i, item_id in enumerate(item_ids)})
+            self.delta = {}
+            self.removed = set()
+            self.generation += 1
+
+    def ensure_fitted(self):
+        with self.lock:
+            if self.dirty:
+                # 先清除标记，拟合期间发生的变化会再次标记
+                self.dirty = False
+                try:
+                    self.fit()
+                except Exception:
+                    self.dirty = True
+                    raise
+        self.start_periodic_refit()
+
+    def update_item(self, item_id, text, sold=False):
+        """物品新增或修改：用现有词表计算向量；已售出的物品移出推荐"""
+        if sold:
+            self.drop_item(item_id)
+            return
+        with self.lock:
+            vectorizer, _, _, positions = self.model
+            if vectorizer is None:
+                # 还没有词表，只能全量拟合
+                self.dirty = True
+                return
+            self.delta[item_id] = vectorizer.transform([text])
+            if item_id in positions:
+                self.removed.add(item_id)
+            self.check_refit()
+
+    def drop_item(self, item_id):
+        """物品删除或售出"""
+        with self.lock:
+            self.delta.pop(item_id, None)
+            if item_id in self.model[3]:
+                self.removed.add(item_id)
+            self.check_refit()
+
+    def check_refit(self):
+        if len(self.delta) + len(self.removed) > len(self.model[2]) * REFIT_CHANGE_RATIO:
+            self.schedule_refit()
+
+    def candidates(self, texts):
+        """
+        :return: (物品 id 数组, 相似度数组)，包括增量更新的物品，不含已失效的物品
+        """
+        import numpy as np
+        import scipy.sparse as sp
+        self.ensure_fitted()
+        with self.lock:
+            vectorizer, matrix, item_ids, _ = self.model
+            delta = dict(self.delta)
+            removed = set(self.removed)
+        base_ids = np.array(item_ids, dtype=np.int64)
+        delta_ids = np.array(list(delta), dtype=np.int64)
+        if vectorizer is None or not texts:
+            base_scores, delta_scores = np.zeros(len(base_ids)), np.zeros(len(delta_ids))
+        else:
+            need_vector = np.asarray(vectorizer.transform(texts).sum(axis=0)).ravel()
+            base_scores = matrix @ need_vector
+            delta_scores = sp.vstack(list(delta.values())) @ need_vector if delta else np.zeros(0)
+        if removed:
+            # removed 只作用于基础矩阵，被修改的物品以 delta 中的新向量为准
+            keep = ~np.isin(base_ids, np.fromiter(removed, dtype=np.int64, count=len(removed)))
+            base_ids, base_scores = base_ids[keep], base_scores[keep]
+        return np.concatenate([base_ids, delta_ids]), np.concatenate([base_scores, delta_scores])
+
+    def top_item_ids(self, texts, k):
+        """
+        与一组需求文本相似度之和最高的 k 个物品 id，从高到低，相同时按 id
+        用 partition 找出第 k 大的相似度，只对不低于它的物品排序，不对全部物品排序
+        """
+        import numpy as np
+        ids, scores = self.candidates(texts)
+        if k < len(ids):
+            # 与第 k 个相同的都保留，按 id 决定取舍，结果与完整排序一致
+            threshold = np.partition(-scores, k - 1)[k - 1]
+            top = -scores <= threshold
+            ids, scores = ids[top], scores[top]
+        order = np.lexsort((ids, -scores))
+        return ids[order][:k].tolist()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommendation')
+        return self.executor
+
+    def submit(self, func, *args):
+        """
+        在事务提交后交给后台线程执行
+        BACKGROUND_TASKS_EAGER 为 True 时（如测试环境）直接在当前线程执行
+        """
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            func(*args)
+        else:
+            transaction.on_commit(lambda: self.get_executor().submit(func, *args))
+
+    def schedule_refit(self):
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            # 同步模式下留给下一次请求拟合
+            self.dirty = True
+            return
+        with self.lock:
+            if self.refitting:
+                return
+            self.refitting = True
+        self.get_executor().submit(self.background_refit)
+
+    def background_refit(self):
+        # 后台线程使用独立的数据库连接，前后都要清理
+        close_old_connections()
+        try:
+            self.fit()
+            self.dirty = False
+        except Exception:
+            logger.exception("recommendation refit failed")
+        finally:
+            self.refitting = False
+            close_old_connections()
+
+    def start_periodic_refit(self):
+        """启动定期全量重新拟合的守护线程，每个进程一个"""
+        interval = getattr(settings, 'RECOMMENDATION_REFIT_INTERVAL', 0)
+        if self.refit_thread is not None or not interval or getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            return
+        with self.lock:
+            if self.refit_thread is None:
+                self.refit_thread = threading.Thread(
+                    target=self.periodic_refit, args=(interval,), name='recommendation-refit', daemon=True
+                )
+                self.refit_thread.start()
+
+    def periodic_refit(self, interval):
+        while True:
+            time.sleep(interval)
+            self.schedule_refit()
+
+
+class RecommendationCache:
+    """
+    按用户缓存首页推荐结果（排好序的物品 id 列表），翻页时直接切片
+    使用 settings.CACHES 中的 recommendation 缓存，过期时间和最大条目数在其中配置
+    以下情况缓存失效：
+    - 用户的需求或课程表变化（见 signals.py）
+    - 推荐模型全量重新拟合，即物品池有较大变化
+    """
+    alias = 'recommendation'
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, user_id):
+        return f'recommendation:{user_id}'
+
+    def get(self, user_id):
+        """:return: 物品 id 列表，未命中时返回 None"""
+        value = self.cache.get(self.key(user_id))
+        if value is None:
+            return None
+        generation, item_ids = value
+        # 模型待重新拟合或已重新拟合，都视为未命中
+        if recommendation_index.dirty or generation != recommendation_index.generation:
+            return None
+        return item_ids
+
+    def set(self, user_id, item_ids):
+        self.cache.set(self.key(user_id), (recommendation_index.generation, item_ids))
+
+    def invalidate(self, user_id):
+        self.cache.delete(self.key(user_id))
+
+
+recommendation_index = RecommendationIndex()
+recommendation_cache = RecommendationCache()
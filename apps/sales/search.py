@@ -0,0 +1,69 @@
+from .tokenizer import tokenize_for_index
+
+# 支持倒排索引的字段，title/username 来自 Item 本身，其余来自 meta_info
+SEARCH_FIELDS = ('title', 'course', 'teacher', 'author', 'description', 'username')
+META_SEARCH_FIELDS = ('course', 'teacher', 'author', 'description')
+
+# 与 ItemToken.term 的 max_length 保持一致
+MAX_TERM_LENGTH = 100
+
+
+# content_type=all 时搜索的字段及权重，各字段的相关度乘以权重后相加
+ALL_FIELD_BOOSTS = {'title': 3.0, 'course': 2.0, 'teacher': 1.5, 'author': 1.5, 'description': 0.5}
+
+
+def search_field_boosts(content_type, fields=None):
+    """
+    content_type 对应的搜索字段及权重
+    :param fields: content_type 为 all 时可指定字段及权重，覆盖 ALL_FIELD_BOOSTS
+    :return: {field: boost}，未指定或无效时默认搜索 title
+    """
+    if content_type == 'all':
+        return dict(fields or ALL_FIELD_BOOSTS)
+    return {content_type if content_type in SEARCH_FIELDS else 'title': 1.0}
+
+
+def item_field_texts(item):
+    """
+    取出 item 中各个可搜索字段的原始文本
+    :return: {field: text}
+    """
+    texts = {
+        'title': item.title,
+        'username': item.username,
+    }
+    meta_info = item.meta_info or {}
+    for field in META_SEARCH_FIELDS:
+        value = meta_info.get(field)
+        texts[field] = value if isinstance(value, str) else None
+    return texts
+
+
+def item_search_terms(item):
+    """
+    计算 item 的全部索引词
+    :return: [(field, term)]
+    """
+    terms = []
+    for field, text in item_field_texts(item).items():
+        for term in tokenize_for_index(text):
+            terms.append((field, term[:MAX_TERM_LENGTH]))
+    # 截断后可能出现重复
+    return sorted(set(terms))
+
+
+def rebuild_item_tokens(item):
+    """
+    重建单个 item 的倒排索引
+    :return: [(field, term)]，写入的搜索索引词（不含匹配用的字符索引词）
+    """
+    from apps.sales.models import ItemToken
+    from apps.sales.matching import match_gram_terms
+    terms = item_search_terms(item)
+    ItemToken.objects.filter(item_id=item.id).delete()
+    # 同时写入需求匹配用的字符索引词（title_gram/course_gram），搜索只查 SEARCH_FIELDS 中的字段
+    ItemToken.objects.bulk_create([
+        ItemToken(item_id=item.id, field=field, term=term)
+        for field, term in terms + match_gram_terms(item)
+    ])
+    return terms
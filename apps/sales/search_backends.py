@@ -0,0 +1,240 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from .search import SEARCH_FIELDS, item_field_texts, item_search_terms
+from .ranking import search_ranking
+from .tokenizer import tokenize, tokenize_for_index
+
+
+class TokenIndexBackend:
+    """
+    基于 ItemToken 倒排索引的搜索（jieba 分词后精确匹配），不做相关度排序
+    适用于不支持全文索引的数据库
+    """
+    name = 'token'
+
+    def create_table(self, cursor):
+        pass
+
+    def drop_table(self, cursor):
+        pass
+
+    def index_item(self, item):
+        # ItemToken 由 rebuild_item_tokens 维护（匹配也依赖它）
+        pass
+
+    def remove_item(self, item_id):
+        pass
+
+    def rank(self, field_boosts, keyword):
+        """
+        在进程内计算相关度，返回 {item_id: score}
+        返回 None 表示不需要（排序已在 SQL 中完成，或不排序）
+        """
+        return None
+
+    def filter(self, queryset, field_boosts, keyword):
+        """
+        :param field_boosts: {field: boost}，在这些字段中搜索 keyword
+        """
+        from apps.sales.models import ItemToken
+        words = tokenize(keyword)  # 使用 jieba 分词并去除停用词
+        if not words:
+            return queryset
+        # 通过倒排索引查出任一字段包含任一分词的物品，避免对 title/meta_info 做 LIKE 全表扫描
+        matched_ids = ItemToken.objects.filter(field__in=list(field_boosts), term__in=words).values('item_id')
+        return queryset.filter(id__in=matched_ids)
+
+
+class Bm25Backend(TokenIndexBackend):
+    """
+    ItemToken 倒排索引筛选，进程内 BM25 索引排序（见 ranking.py）
+    与 token 后端匹配语义相同（jieba 分词），适用于没有中文全文索引的数据库
+    """
+    name = 'bm25'
+
+    def index_item(self, item):
+        search_ranking.update_item(item.id, item_search_terms(item))
+
+    def remove_item(self, item_id):
+        search_ranking.remove_item(item_id)
+
+    def rank(self, field_boosts, keyword):
+        return search_ranking.scores(field_boosts, tokenize(keyword))
+
+
+class FullTextBackend(TokenIndexBackend):
+    """
+    全文索引后端的公共部分：filter 按相关度 search_score 降序排列
+    子类描述索引表的结构（item_id_sql/field_condition/row_condition）和单个字段的查询语句（match_sql）
+    搜索多个字段时，匹配任一字段的物品都会返回（UNION 去重），相关度为各字段相关度乘以权重之和
+    """
+    table = None
+    # 由索引表的行得到物品 id 的表达式
+    item_id_sql = None
+
+    def match_sql(self, field, keyword):
+        """
+        :return: (MATCH 条件, 条件参数, 相关度表达式, 相关度参数)，keyword 没有可搜索内容时返回 None
+        同一个 keyword 对每个字段都返回 None 或都不返回 None
+        """
+        raise NotImplementedError
+
+    def field_condition(self, field):
+        """只保留 field 字段所在行的条件"""
+        return "1 = 1"
+
+    def row_condition(self, field, item_id):
+        """指定物品 field 字段所在行的条件"""
+        raise NotImplementedError
+
+    def filter(self, queryset, field_boosts, keyword):
+        item_table = queryset.model._meta.db_table
+        matched_sql, matched_params = [], []
+        score_sql, score_params = [], []
+        for field, boost in field_boosts.items():
+            match = self.match_sql(field, keyword)
+            if match is None:
+                return queryset
+            condition, params, score, field_score_params = match
+            matched_sql.append(
+                f"SELECT {self.item_id_sql} FROM {self.table} WHERE {condition} AND {self.field_condition(field)}"
+            )
+            matched_params += params
+            # 物品在该字段没有匹配时相关度记为 0
+            score_sql.append(
+                f"COALESCE((SELECT {score} FROM {self.table} "
+                f"WHERE {condition} AND {self.row_condition(field, f'{item_table}.id')}), 0) * %s"
+            )
+            score_params += field_score_params + params + [boost]
+        matched_ids = RawSQL(' UNION '.join(matched_sql), matched_params)
+        search_score = RawSQL(' + '.join(score_sql), score_params)
+        return queryset.filter(id__in=matched_ids).annotate(search_score=search_score).order_by('-search_score', 'id')
+
+
+class SQLiteFTS5Backend(FullTextBackend):
+    """
+    SQLite FTS5 虚拟表，每个物品的每个字段一行，rowid = 物品 id * 8 + 字段序号
+    按字段分行是因为 bm25 按整行长度归一化，多个字段放在一行时较长的 description 会影响 title 的相关度
+    FTS5 不能切分中文，文本先用 jieba 分词再以空格连接存入，查询词同样先分词
+    """
+    name = 'fts5'
+    table = 'sales_item_fts'
+    ROWS_PER_ITEM = 8
+    item_id_sql = f"rowid / {ROWS_PER_ITEM}"
+
+    def create_table(self, cursor):
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5(body)")
+
+    def drop_table(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index_item(self, item):
+        texts = item_field_texts(item)
+        with connection.cursor() as cursor:
+            self.delete_rows(cursor, item.id)
+            for position, field in enumerate(SEARCH_FIELDS):
+                body = ' '.join(sorted(tokenize_for_index(texts[field])))
+                if body:
+                    cursor.execute(
+                        f"INSERT INTO {self.table} (rowid, body) VALUES (%s, %s)",
+                        [item.id * self.ROWS_PER_ITEM + position, body],
+                    )
+
+    def remove_item(self, item_id):
+        with connection.cursor() as cursor:
+            self.delete_rows(cursor, item_id)
+
+    def delete_rows(self, cursor, item_id):
+        first_row = item_id * self.ROWS_PER_ITEM
+        cursor.execute(
+            f"DELETE FROM {self.table} WHERE rowid BETWEEN %s AND %s",
+            [first_row, first_row + self.ROWS_PER_ITEM - 1],
+        )
+
+    def field_condition(self, field):
+        # % 需要转义，查询语句会经过参数格式化
+        return f"rowid %% {self.ROWS_PER_ITEM} = {SEARCH_FIELDS.index(field)}"
+
+    def row_condition(self, field, item_id):
+        return f"rowid = {item_id} * {self.ROWS_PER_ITEM} + {SEARCH_FIELDS.index(field)}"
+
+    def match_sql(self, field, keyword):
+        words = tokenize(keyword)
+        if not words:
+            return None
+        # 每个词作为一个短语（双引号转义），任一匹配即可
+        phrases = ' OR '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+        # bm25 越小越相关，取负数使相关度越大越好
+        return f"{self.table} MATCH %s", [phrases], f"-bm25({self.table})", []
+
+
+class MySQLFulltextBackend(FullTextBackend):
+    """
+    MySQL FULLTEXT 索引（ngram 分词器，适合中文），每个物品一行，每个字段一列并单独建索引
+    存原始文本，由 ngram 分词器切分
+    """
+    name = 'mysql_fulltext'
+    table = 'sales_item_fulltext'
+    item_id_sql = 'item_id'
+
+    def create_table(self, cursor):
+        columns = ', '.join(f"{field} LONGTEXT" for field in SEARCH_FIELDS)
+        indexes = ', '.join(f"FULLTEXT KEY ft_{field} ({field}) WITH PARSER ngram" for field in SEARCH_FIELDS)
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            f"item_id INT NOT NULL PRIMARY KEY, {columns}, {indexes}"
+            f") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+        )
+
+    def drop_table(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index_item(self, item):
+        texts = item_field_texts(item)
+        columns = ', '.join(SEARCH_FIELDS)
+        placeholders = ', '.join(['%s'] * (len(SEARCH_FIELDS) + 1))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"REPLACE INTO {self.table} (item_id, {columns}) VALUES ({placeholders})",
+                [item.id, *(texts[field] for field in SEARCH_FIELDS)],
+            )
+
+    def remove_item(self, item_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE item_id = %s", [item_id])
+
+    def row_condition(self, field, item_id):
+        return f"item_id = {item_id}"
+
+    def match_sql(self, field, keyword):
+        # 去掉停用词后交给 ngram 分词器
+        words = tokenize(keyword)
+        if not words:
+            return None
+        condition = f"MATCH({field}) AGAINST (%s IN NATURAL LANGUAGE MODE)"
+        params = [' '.join(words)]
+        return condition, params, condition, params
+
+
+SEARCH_BACKENDS = {
+    backend.name: backend for backend in (TokenIndexBackend, Bm25Backend, SQLiteFTS5Backend, MySQLFulltextBackend)
+}
+
+# SEARCH_BACKEND 为 auto 时按数据库选择
+DEFAULT_BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'mysql': MySQLFulltextBackend,
+}
+
+
+def backend_for_vendor(vendor):
+    return DEFAULT_BACKENDS.get(vendor, Bm25Backend)()
+
+
+def get_search_backend():
+    """根据 settings.SEARCH_BACKEND 选择搜索后端"""
+    name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        return backend_for_vendor(connection.vendor)
+    return SEARCH_BACKENDS[name]()
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from .tokenizer import tokenize
+
+
+class SearchResultCache:
+    """
+    缓存关键词搜索的结果（排好序的物品 id 列表），热门关键词（课程名等）不必每次查询数据库
+    键为规范化后的查询：搜索后端、搜索模式、搜索字段及权重、查询分词集合（与词序、停用词无关）、售出筛选、排除的用户
+    使用 settings.CACHES 中的 search 缓存（LRU 淘汰），过期时间和最大条目数在其中配置
+    物品新增、修改、删除或售出时整体失效（见 signals.py）：键中带有版本号，失效时版本号加一
+    """
+    alias = 'search'
+    generation_key = 'search:generation'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def generation(self):
+        # 版本号被淘汰后以当前时间重新开始，不会与旧条目的版本号重复
+        return self.cache.get_or_set(self.generation_key, lambda: time.time_ns(), timeout=None)
+
+    def key(self, field_boosts, keyword, sold_filter, excluded_user_id, search_mode='exact'):
+        query = repr((
+            getattr(settings, 'SEARCH_BACKEND', 'auto'),
+            search_mode,
+            sorted(field_boosts.items()),
+            sorted(set(tokenize(keyword))),
+            sorted(sold_filter.items()),
+            excluded_user_id,
+        ))
+        return hashlib.md5(query.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """:return: 物品 id 列表，未命中时返回 None"""
+        item_ids = self.cache.get(f'search:{self.generation()}:{key}')
+        with self.lock:
+            if item_ids is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return item_ids
+
+    def set(self, key, item_ids):
+        if len(item_ids) > getattr(settings, 'SEARCH_CACHE_MAX_RESULTS', 1000):
+            return
+        self.cache.set(f'search:{self.generation()}:{key}', item_ids)
+
+    def invalidate(self):
+        # 旧版本的条目不再被读取，由 LRU 淘汰或过期
+        try:
+            self.cache.incr(self.generation_key)
+        except ValueError:
+            self.cache.set(self.generation_key, time.time_ns(), timeout=None)
+
+    def stats(self):
+        """本进程的命中统计"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0,
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+
+search_result_cache = SearchResultCache()
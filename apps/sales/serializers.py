@@ -2,6 +2,7 @@ from rest_framework import serializers
 from apps.sales.models import Item, Need, Purchase
 from apps.accounts.models import User
 from .config import LocationOptions
+from .search import SEARCH_FIELDS, search_field_boosts
 
 def verify_user_exist(id):
     try:
@@ -93,10 +94,33 @@ class UploadItemsSerializer(serializers.ModelSerializer):
 class SearchItemsSerializer(serializers.Serializer):
     content_type = serializers.CharField(required=True)
     search_keyword = serializers.CharField(required=True, allow_blank=True)
+    # 分页方式：page 为页码分页（默认），cursor 为游标分页
+    pagination = serializers.ChoiceField(choices=['page', 'cursor'], required=False, default='page')
+    # 游标分页时是否返回总数
+    with_count = serializers.BooleanField(required=False, default=False)
+    # 搜索模式：exact 为分词精确匹配（默认），fuzzy 为拼音、首字母和编辑距离模糊匹配，auto 在精确匹配没有结果时使用模糊匹配
+    search_mode = serializers.ChoiceField(choices=['exact', 'fuzzy', 'auto'], required=False, default='exact')
+    # content_type=all 时搜索的字段及权重，如 "title^3,course^2,teacher"，未写权重时为 1
+    search_fields = serializers.CharField(required=False)
+
+    def validate_search_fields(self, value):
+        field_boosts = {}
+        for part in value.split(','):
+            field, _, boost = part.strip().partition('^')
+            if field not in SEARCH_FIELDS:
+                raise serializers.ValidationError(f'Invalid field {field}. Must be one of: {", ".join(SEARCH_FIELDS)}')
+            try:
+                field_boosts[field] = float(boost) if boost else 1.0
+            except ValueError:
+                raise serializers.ValidationError(f'Invalid boost for field {field}')
+            if not 0 < field_boosts[field] <= 100:
+                raise serializers.ValidationError(f'Boost for field {field} must be in (0, 100]')
+        return field_boosts
+
     def validate(self, data):
         content_type = data.get('content_type')
         search_keyword = data.get('search_keyword')
-        valid_content_types = ['title', 'course', 'teacher', 'author', 'username', 'description', 'id', 'user_items', 'homepage']
+        valid_content_types = ['title', 'course', 'teacher', 'author', 'username', 'description', 'all', 'id', 'user_items', 'homepage']
         if content_type not in valid_content_types:
             raise serializers.ValidationError(
                 {'content_type': f'Invalid content_type. Must be one of: {", ".join(valid_content_types)}'}
@@ -117,8 +141,13 @@ class SearchItemsSerializer(serializers.Serializer):
             data['user'] = None
         else:
             data['search_all'] = False  ## 其余不推荐
+            ## content_type=all 时一次搜索多个字段，按权重合并相关度
+            data['field_boosts'] = search_field_boosts(content_type, data.get('search_fields'))
         return data
 
+class ItemDetailSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=True)
+
 class ModifyItemsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Item
@@ -0,0 +1,70 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from apps.accounts.models import User
+from apps.sales.models import Item, Need
+from apps.sales.search import rebuild_item_tokens
+from apps.sales.search_backends import get_search_backend
+from apps.sales.search_cache import search_result_cache
+from apps.sales.fuzzy import fuzzy_index
+from apps.sales.matching import rebuild_need_tokens
+from apps.sales.recommendation import recommendation_index, recommendation_cache, feature_text
+
+# 影响索引的字段，只更新其他字段（如 sold, is_fulfilled）时不必重建
+# 匹配用的字符索引词由 title_tokens/course_tokens 生成，只更新分词（如 backfill_tokens）时也要重建
+INDEXED_ITEM_FIELDS = {'title', 'username', 'meta_info', 'title_tokens', 'course_tokens'}
+INDEXED_NEED_FIELDS = {'title', 'meta_info', 'title_tokens', 'course_tokens'}
+RECOMMENDATION_ITEM_FIELDS = {'title', 'meta_info', 'sold'}
+
+@receiver(post_save, sender=Item)
+def update_item_search_index(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_ITEM_FIELDS & set(update_fields):
+        return
+    terms = rebuild_item_tokens(instance)
+    get_search_backend().index_item(instance)
+    # 新词加入拼音模糊索引
+    fuzzy_index.add_terms(term for _, term in terms)
+
+@receiver(post_delete, sender=Item)
+def remove_from_search_index(sender, instance, **kwargs):
+    # ItemToken 随 Item 级联删除，全文索引表需要单独删除
+    get_search_backend().remove_item(instance.id)
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_search_results(sender, instance, **kwargs):
+    # 物品新增、修改、删除或售出后缓存的搜索结果失效
+    # 提交后再失效一次，避免提交前的并发搜索把旧结果写入新版本的缓存
+    search_result_cache.invalidate()
+    transaction.on_commit(search_result_cache.invalidate)
+
+@receiver(post_save, sender=Item)
+def update_recommendation_index(sender, instance, created, update_fields=None, **kwargs):
+    # 物品新增、修改或售出后增量更新推荐模型，不重新拟合
+    if update_fields is not None and not RECOMMENDATION_ITEM_FIELDS & set(update_fields):
+        return
+    text = feature_text(instance.title, instance.meta_info)
+    recommendation_index.submit(recommendation_index.update_item, instance.id, text, instance.sold)
+
+@receiver(post_delete, sender=Item)
+def remove_from_recommendation_index(sender, instance, **kwargs):
+    recommendation_index.submit(recommendation_index.drop_item, instance.id)
+
+@receiver(post_save, sender=Need)
+def update_need_match_index(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_NEED_FIELDS & set(update_fields):
+        return
+    rebuild_need_tokens(instance)
+
+@receiver(post_save, sender=Need)
+@receiver(post_delete, sender=Need)
+def invalidate_need_recommendations(sender, instance, **kwargs):
+    # 需求变化后该用户的推荐结果需要重新计算
+    recommendation_cache.invalidate(instance.user_id)
+
+@receiver(post_save, sender=User)
+def invalidate_schedule_recommendations(sender, instance, update_fields=None, **kwargs):
+    # 课程表变化后该用户的推荐结果需要重新计算（登录等只更新其他字段时不必）
+    if update_fields is not None and 'class_schedule' not in update_fields:
+        return
+    recommendation_cache.invalidate(instance.id)
@@ -0,0 +1,83 @@
+import os
+import tempfile
+from io import StringIO
+from rest_framework.test import APITestCase
+from django.core.management import call_command
+from django.test import override_settings
+from apps.accounts.models import User
+from apps.sales.models import Item, Need, ItemToken
+from apps.sales import tokenizer
+from apps.sales.dictionary import harvest_terms, is_dictionary_term
+from apps.sales.tokenizer import tokenize, reload_dictionary
+
+class JiebaDictionaryTests(APITestCase):
+    def setUp(self):
+        self.dict_path = os.path.join(tempfile.mkdtemp(), 'catalog_dict.txt')
+        self.user = User.objects.create_user(
+            email="dict_user@mails.tsinghua.edu.cn",
+            username="dict_user@mails.tsinghua.edu.cn",
+            password="testpassword123",
+        )
+        self.user.class_schedule = [{"course": "数字逻辑与数字集成电路", "teacher": "罗嵘", "time": "周一第二节"}]
+        self.user.save()
+        for title in ("计算机系统设计实验", "计算机系统设计实验"):
+            Item.objects.create(
+                title=title, username=self.user.email, price_lower_bound=10, price_upper_bound=20, user=self.user,
+                meta_info={"author": "翟季冬", "course": "计算机系统设计", "teacher": "翟季冬", "description": "", "new": 9},
+            )
+        Need.objects.create(
+            title="模电习题解答", username=self.user.email, price_lower_bound=10, price_upper_bound=20, user=self.user,
+            meta_info={"author": "华成英", "course": "模拟电子技术基础", "teacher": "华成英"},
+        )
+
+    def tearDown(self):
+        if os.path.exists(self.dict_path):
+            os.remove(self.dict_path)
+        # 恢复默认词典，避免影响其他测试的分词结果
+        reload_dictionary()
+
+    def test_is_dictionary_term(self):
+        """测试只收录含中文、无空白的词"""
+        self.assertTrue(is_dictionary_term("微积分A"))
+        self.assertFalse(is_dictionary_term("Python"))
+        self.assertFalse(is_dictionary_term("线性 代数"))
+        self.assertFalse(is_dictionary_term("书"))
+
+    def test_harvest_terms(self):
+        """测试从物品、需求和课程表收集课程名和教师名，书名重复出现才收录"""
+        terms = harvest_terms()
+        self.assertEqual(terms["数字逻辑与数字集成电路"], 'nz')
+        self.assertEqual(terms["罗嵘"], 'nr')
+        self.assertEqual(terms["翟季冬"], 'nr')
+        self.assertEqual(terms["模拟电子技术基础"], 'nz')
+        self.assertIn("计算机系统设计实验", terms)
+        self.assertNotIn("模电习题解答", terms)
+
+    def test_build_command_reindexes(self):
+        """测试生成词典后按新词典重建索引，课程名作为一个词检索"""
+        with override_settings(JIEBA_CATALOG_DICT=self.dict_path):
+            call_command('build_jieba_dict', stdout=StringIO())
+            self.assertEqual(tokenize("数字逻辑与数字集成电路"), ["数字逻辑与数字集成电路"])
+            self.assertEqual(tokenize("翟季冬"), ["翟季冬"])
+            self.assertTrue(ItemToken.objects.filter(field='teacher', term="翟季冬").exists())
+            self.assertEqual(Need.objects.get().course_tokens, ["模拟电子技术基础"])
+
+    def test_build_command_twice(self):
+        """测试再次生成词典时保留上次收录的词"""
+        with override_settings(JIEBA_CATALOG_DICT=self.dict_path):
+            call_command('build_jieba_dict', stdout=StringIO())
+            with open(self.dict_path, encoding='utf-8') as f:
+                first = f.read()
+            self.assertIn("翟季冬 nr", first)
+            call_command('build_jieba_dict', stdout=StringIO())
+            with open(self.dict_path, encoding='utf-8') as f:
+                self.assertEqual(f.read(), first)
+
+    def test_hot_reload(self):
+        """测试词典文件变化后自动在后台重新加载"""
+        self.assertNotEqual(tokenize("华成英"), ["华成英"])
+        with override_settings(JIEBA_CATALOG_DICT=self.dict_path, JIEBA_DICT_CHECK_INTERVAL=0):
+            call_command('build_jieba_dict', '--no-reindex', stdout=StringIO())
+            tokenize("华成英")
+            tokenizer.reload_thread.join()
+            self.assertEqual(tokenize("华成英"), ["华成英"])
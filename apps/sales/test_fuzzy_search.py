@@ -0,0 +1,84 @@
+import random
+from unittest.mock import patch
+from rest_framework.test import APITestCase
+from apps.sales.fuzzy import NgramIndex, edit_distance, fuzzy_index, initials_key, pinyin_key
+from apps.sales.testing import SearchTestMixin
+
+class NgramIndexTests(APITestCase):
+    def test_search_same_as_scan(self):
+        """测试二元组索引的查询结果与逐个比较一致"""
+        rng = random.Random(0)
+        keys = {''.join(rng.choice('abcdefgh') for _ in range(rng.randint(2, 8))) for _ in range(300)}
+        index = NgramIndex()
+        for key in keys:
+            index.add(key)
+        self.assertEqual(index.size, len(keys))
+        for query in ('abc', 'defgh', 'hhhh', 'abcdefgh', 'abcd'):
+            for limit in (0, 1, 2):
+                expected = {key for key in keys if edit_distance(query, key) <= limit}
+                self.assertEqual({key for key, _ in index.search(query, limit)}, expected)
+
+    def test_pinyin_keys(self):
+        """测试全拼和首字母"""
+        self.assertEqual(pinyin_key("微积分A"), "weijifena")
+        self.assertEqual(initials_key("线性代数"), "xxds")
+
+
+class FuzzySearchTests(SearchTestMixin, APITestCase):
+    user_email = "fuzzy_user@mails.tsinghua.edu.cn"
+    search_params = {"search_mode": "fuzzy"}
+
+    def setUp(self):
+        fuzzy_index.invalidate()
+        super().setUp()
+        self.calculus = self.create_item("微积分", course="微积分A", teacher="崔建莲", author="崔建莲")
+        self.algebra = self.create_item("线性代数", course="线性代数", teacher="王晓峰", author="王晓峰")
+
+    def tearDown(self):
+        fuzzy_index.invalidate()
+
+    def test_pinyin_and_initials(self):
+        """测试全拼、拼错的拼音和首字母"""
+        self.assertEqual(self.search_ids("weijifen"), [self.calculus.id])
+        self.assertEqual(self.search_ids("weijifeng"), [self.calculus.id])
+        self.assertEqual(self.search_ids("xxds"), [self.algebra.id])
+        self.assertEqual(self.search_ids("wangxiaofeng", content_type="teacher"), [self.algebra.id])
+
+    def test_homophone_typo(self):
+        """测试同音错别字"""
+        self.assertEqual(self.search_ids("微积份"), [self.calculus.id])
+        self.assertEqual(self.search_ids("微积份", search_mode="exact"), [])
+
+    def test_ranked_by_distance(self):
+        """测试匹配得更准确的物品排在前面"""
+        # 拼错一个字母的词权重较低
+        self.assertEqual(self.search_ids("xianxingdaishu weijifeng", content_type="all"), [self.algebra.id, self.calculus.id])
+        # 都完全匹配时分数相同，按 id 排序
+        self.assertEqual(self.search_ids("xianxingdaishu weijifen", content_type="all"), [self.calculus.id, self.algebra.id])
+
+    def test_auto_mode_falls_back(self):
+        """测试 auto 模式只在精确搜索没有结果时使用模糊搜索"""
+        self.assertEqual(self.search_ids("xianxingdaishu", search_mode="auto"), [self.algebra.id])
+        self.assertEqual(self.search_ids("xianxingdaishu", search_mode="exact"), [])
+        self.assertEqual(self.search_ids("线性代数", search_mode="auto"), [self.algebra.id])
+
+    def test_new_items_indexed(self):
+        """测试新物品的词增量加入模糊索引"""
+        self.search_ids("weijifen")
+        physics = self.create_item("大学物理", course="大学物理B", teacher="魏洋", author="魏洋")
+        self.assertEqual(self.search_ids("daxuewuli"), [physics.id])
+
+    def test_terms_added_during_rebuild_are_kept(self):
+        """测试全量重建期间增量加入的词在新索引上重放，不会丢失"""
+        self.search_ids("weijifen")
+        load = fuzzy_index.load
+
+        def load_then_add():
+            # 重建读取数据库之后、替换索引之前，有新词加入
+            data = load()
+            fuzzy_index.add_terms(["大学物理"])
+            return data
+
+        with patch.object(fuzzy_index, 'load', side_effect=load_then_add):
+            fuzzy_index.build()
+        self.assertIn("大学物理", fuzzy_index.match("daxuewuli"))
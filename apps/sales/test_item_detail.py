@@ -0,0 +1,47 @@
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from rest_framework import status
+from apps.accounts.models import User
+from apps.sales.models import Item
+from apps.sales.views import DESCRIPTION_PREVIEW_LENGTH
+
+class ItemDetailTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="detail_user@mails.tsinghua.edu.cn",
+            username="detail_user@mails.tsinghua.edu.cn",
+            password="testpassword123",
+        )
+        self.description = "几乎全新，" * 30
+        self.item = Item.objects.create(
+            title="微积分教程", username=self.user.email, price_lower_bound=10, price_upper_bound=20, user=self.user,
+            meta_info={"author": "崔建莲", "course": "微积分A", "teacher": "崔建莲", "description": self.description,
+                       "new": 9, "isbn": "9787302"},
+        )
+        self.search_url = reverse('search-items')
+        self.detail_url = reverse('item-detail')
+
+    def test_search_returns_compact_meta_info(self):
+        """测试列表只返回展示用的字段和截断后的 description"""
+        response = self.client.get(self.search_url, {"content_type": "title", "search_keyword": "微积分"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        meta_info = response.data['results'][0]['meta_info']
+        self.assertEqual(meta_info['author'], "崔建莲")
+        self.assertEqual(meta_info['new'], 9)
+        self.assertEqual(meta_info['description'], self.description[:DESCRIPTION_PREVIEW_LENGTH])
+        self.assertNotIn('isbn', meta_info)
+
+    def test_item_detail(self):
+        """测试详情接口返回完整记录"""
+        response = self.client.get(self.detail_url, {"id": self.item.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['meta_info']['description'], self.description)
+        self.assertEqual(response.data['meta_info']['isbn'], "9787302")
+        self.assertFalse(response.data['sold'])
+
+    def test_item_detail_not_found(self):
+        """测试详情接口查询不存在的物品"""
+        response = self.client.get(self.detail_url, {"id": self.item.id + 100})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
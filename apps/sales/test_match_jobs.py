@@ -0,0 +1,133 @@
+from unittest.mock import patch
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from django.test import override_settings
+from django.db import OperationalError
+from rest_framework import status
+from apps.accounts.models import User
+from apps.chat.models import Message
+from apps.sales.models import Item, Need, MatchJob
+from datetime import timedelta
+from django.utils import timezone
+from apps.sales.jobs import run_match_job, process_pending_jobs, reclaim_stale_jobs, _resume_in_thread
+
+class MatchJobTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(
+            email="job_seller@mails.tsinghua.edu.cn",
+            username="job_seller@mails.tsinghua.edu.cn",
+            password="password123",
+        )
+        self.buyer = User.objects.create_user(
+            email="job_buyer@mails.tsinghua.edu.cn",
+            username="job_buyer@mails.tsinghua.edu.cn",
+            password="password123",
+        )
+        self.need = Need.objects.create(
+            title="微积分教材",
+            username=self.buyer.email,
+            price_lower_bound=10.00,
+            price_upper_bound=30.00,
+            user=self.buyer,
+            meta_info={"author": "崔建莲", "course": "微积分", "teacher": "崔建莲"},
+        )
+        self.upload_data = {
+            "title": "微积分入门",
+            "username": self.seller.email,
+            "price_lower_bound": 15.00,
+            "price_upper_bound": 25.00,
+            "picture": None,
+            "meta_info": {"author": "崔建莲", "course": "微积分基础", "teacher": "崔建莲", "description": "几乎全新", "new": 9},
+        }
+        self.upload_url = reverse('upload-items')
+        self.match_jobs_url = reverse('match-jobs')
+        self.client.login(email=self.seller.email, password="password123")
+
+    def test_upload_records_finished_job(self):
+        """测试上传物品后记录匹配任务（测试环境中同步执行）"""
+        response = self.client.post(self.upload_url, self.upload_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = MatchJob.objects.get()
+        self.assertEqual(job.kind, MatchJob.KIND_ITEM)
+        self.assertEqual(job.status, MatchJob.STATUS_DONE)
+        self.assertEqual(job.matches, 1)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_upload_returns_before_matching(self):
+        """测试非同步模式下请求直接返回，任务在事务提交后才执行"""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post(self.upload_url, self.upload_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(callbacks)
+        job = MatchJob.objects.get()
+        self.assertEqual(job.status, MatchJob.STATUS_PENDING)
+        self.assertFalse(Message.objects.filter(sender=self.buyer).exists())
+
+        # 模拟后台 worker 补跑积压任务
+        self.assertEqual(process_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, MatchJob.STATUS_DONE)
+        self.assertTrue(Message.objects.filter(sender=self.buyer).exists())
+
+    def test_job_runs_only_once(self):
+        """测试已执行的任务不会被重复执行"""
+        item = Item.objects.create(
+            title="微积分", username=self.seller.email, price_lower_bound=15, price_upper_bound=25,
+            user=self.seller, meta_info={"author": "崔建莲", "course": "微积分", "teacher": "崔建莲"},
+        )
+        job = MatchJob.objects.create(kind=MatchJob.KIND_ITEM, object_id=item.id)
+        run_match_job(job.id)
+        self.assertIsNone(run_match_job(job.id))
+        self.assertEqual(Message.objects.filter(sender=self.buyer).count(), 2)
+
+    def test_reclaim_stale_running_jobs(self):
+        """测试执行中断（长时间处于 running）的任务被收回并重新执行"""
+        stale = MatchJob.objects.create(
+            kind=MatchJob.KIND_NEED, object_id=self.need.id, status=MatchJob.STATUS_RUNNING,
+            started_at=timezone.now() - timedelta(hours=1),
+        )
+        recent = MatchJob.objects.create(
+            kind=MatchJob.KIND_NEED, object_id=self.need.id, status=MatchJob.STATUS_RUNNING, started_at=timezone.now(),
+        )
+        with override_settings(MATCH_JOB_TIMEOUT=600):
+            self.assertEqual(process_pending_jobs(), 1)
+            self.assertEqual(reclaim_stale_jobs(), 0)
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual(stale.status, MatchJob.STATUS_DONE)
+        self.assertEqual(recent.status, MatchJob.STATUS_RUNNING)
+
+    def test_database_error_requeues_job(self):
+        """测试数据库错误时任务放回待处理，之后可以重试"""
+        job = MatchJob.objects.create(kind=MatchJob.KIND_NEED, object_id=self.need.id)
+        with patch('apps.sales.models.find_matching_items', side_effect=OperationalError("no such table")):
+            self.assertIsNone(run_match_job(job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, MatchJob.STATUS_PENDING)
+        self.assertIsNone(job.started_at)
+        run_match_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, MatchJob.STATUS_DONE)
+
+    def test_resume_on_startup(self):
+        """测试启动时补跑积压的任务"""
+        job = MatchJob.objects.create(kind=MatchJob.KIND_NEED, object_id=self.need.id)
+        _resume_in_thread()
+        job.refresh_from_db()
+        self.assertEqual(job.status, MatchJob.STATUS_DONE)
+
+    def test_match_jobs_status_requires_staff(self):
+        """测试任务状态接口只对管理员开放"""
+        response = self.client.get(self.match_jobs_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_match_jobs_status(self):
+        """测试任务状态接口返回积压数量和延迟"""
+        MatchJob.objects.create(kind=MatchJob.KIND_NEED, object_id=self.need.id)
+        self.seller.is_staff = True
+        self.seller.save()
+        response = self.client.get(self.match_jobs_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['pending'], 1)
+        self.assertIn('oldest_pending_seconds', response.data)
+        self.assertIn('avg_lag_seconds', response.data)
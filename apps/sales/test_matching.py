@@ -0,0 +1,216 @@
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from django.core.management import call_command
+from rest_framework import status
+from apps.accounts.models import User
+from apps.sales.models import Item, Need
+from apps.sales.matching import GRAM_FIELDS, is_item_need_match, match_gram_terms
+from apps.sales.tokenizer import unique_tokens
+
+class ItemNeedMatchingTests(APITestCase):
+    def setUp(self):
+        # 创建测试用户
+        self.seller = User.objects.create_user(
+            email="match_seller@mails.tsinghua.edu.cn",
+            username="match_seller@mails.tsinghua.edu.cn",
+            password="password123",
+        )
+        self.buyer = User.objects.create_user(
+            email="match_buyer@mails.tsinghua.edu.cn",
+            username="match_buyer@mails.tsinghua.edu.cn",
+            password="password123",
+        )
+        self.item = Item.objects.create(
+            title="微积分教材详解",
+            username=self.seller.email,
+            price_lower_bound=15.00,
+            price_upper_bound=25.00,
+            user=self.seller,
+            meta_info={"author": "崔建莲", "course": "微积分A", "teacher": "崔建莲", "description": "几乎全新", "new": 9},
+        )
+        self.raise_need_url = reverse('raise-need')
+        self.client.login(email=self.buyer.email, password="password123")
+
+    def test_raise_need_stores_tokens(self):
+        """测试发布需求时保存预分词结果"""
+        data = {
+            "title": "微积分教程",
+            "username": self.buyer.email,
+            "price_lower_bound": 10.00,
+            "price_upper_bound": 30.00,
+            "meta_info": {"author": "崔建莲", "course": "微积分A", "teacher": "崔建莲"},
+        }
+        response = self.client.post(self.raise_need_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        need = Need.objects.latest('id')
+        # 小写且去除停用词
+        self.assertEqual(need.title_tokens, ["微积分"])
+        self.assertEqual(need.course_tokens, ["微积分", "a"])
+
+    def clear_stored_tokens(self, *objs):
+        # 模拟加入分词列之前已有的行：直接更新，不经过 save
+        for obj in objs:
+            type(obj)._default_manager.filter(pk=obj.pk).update(title_tokens=None, course_tokens=None)
+            obj.refresh_from_db()
+
+    def test_tokens_refreshed_on_orm_save(self):
+        """测试通过 ORM 修改 title 或 meta_info 后保存的分词随之更新"""
+        self.assertEqual(self.item.title_tokens, ["微积分", "详解"])
+        self.item.title = "线性代数"
+        self.item.save()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.title_tokens, unique_tokens("线性代数"))
+        self.item.meta_info = {**self.item.meta_info, "course": "线性代数"}
+        self.item.save(update_fields=['meta_info'])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.course_tokens, unique_tokens("线性代数"))
+
+    def test_backfill_tokens_command(self):
+        """测试为已有数据补全分词"""
+        self.clear_stored_tokens(self.item)
+        self.assertIsNone(self.item.title_tokens)
+        call_command('backfill_tokens', verbosity=0)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.title_tokens, ["微积分", "详解"])
+
+    def test_backfill_tokens_rebuilds_gram_index(self):
+        """测试补全分词后匹配用的字符索引词随之重建，与匹配规则使用同一份分词"""
+        need = Need.objects.create(
+            title="微积分", username=self.buyer.email, price_lower_bound=10.00, price_upper_bound=30.00,
+            user=self.buyer, meta_info={"author": "未知", "course": "微积分", "teacher": "未知"},
+        )
+        self.clear_stored_tokens(self.item, need)
+        call_command('backfill_tokens', verbosity=0)
+        for obj, tokens in ((self.item, self.item.search_tokens), (need, need.match_tokens)):
+            obj.refresh_from_db()
+            gram_rows = set(tokens.filter(field__in=GRAM_FIELDS.values()).values_list('field', 'term'))
+            self.assertEqual(gram_rows, set(match_gram_terms(obj)))
+
+    def test_match_with_and_without_stored_tokens(self):
+        """测试有无预分词结果时匹配结果一致"""
+        need = Need.objects.create(
+            title="微积分",
+            username=self.buyer.email,
+            price_lower_bound=10.00,
+            price_upper_bound=30.00,
+            user=self.buyer,
+            meta_info={"author": "未知", "course": "微积分", "teacher": "未知"},
+        )
+        self.clear_stored_tokens(self.item, need)
+        self.assertEqual(Item.objects.find_matching_items(need), [self.item])
+        call_command('backfill_tokens', verbosity=0)
+        need.refresh_from_db()
+        self.assertEqual(Item.objects.find_matching_items(need), [self.item])
+        self.assertEqual(Need.objects.find_matching_needs(self.item), [need])
+
+    def test_need_tokens_created_on_save(self):
+        """测试需求保存时建立匹配索引"""
+        need = Need.objects.create(
+            title="线性代数",
+            username=self.buyer.email,
+            price_lower_bound=10.00,
+            price_upper_bound=30.00,
+            user=self.buyer,
+            meta_info={"author": "梁鑫", "course": "线性代数", "teacher": "史灵生"},
+        )
+        terms = set(need.match_tokens.values_list('field', 'term'))
+        self.assertIn(('title', '线性代数'), terms)
+        self.assertIn(('teacher', '史灵生'), terms)
+
+    def test_matching_query_count_independent_of_needs(self):
+        """测试匹配只取索引候选，查询次数不随需求数量增长"""
+        for i in range(20):
+            Need.objects.create(
+                title=f"大学物理{i}",
+                username=self.buyer.email,
+                price_lower_bound=10.00,
+                price_upper_bound=30.00,
+                user=self.buyer,
+                meta_info={"author": "张三慧", "course": "大学物理B", "teacher": "魏洋"},
+            )
+        need = Need.objects.create(
+            title="微积分",
+            username=self.buyer.email,
+            price_lower_bound=10.00,
+            price_upper_bound=30.00,
+            user=self.buyer,
+            meta_info={"author": "未知", "course": "其他", "teacher": "崔建莲"},
+        )
+        with self.assertNumQueries(1):
+            matching_needs = Need.objects.find_matching_needs(self.item)
+        self.assertEqual(matching_needs, [need])
+
+    def test_meta_columns_synced_with_meta_info(self):
+        """测试 course/teacher/author/condition 列随 meta_info 同步"""
+        self.assertEqual((self.item.course, self.item.teacher, self.item.author, self.item.condition),
+                         ("微积分A", "崔建莲", "崔建莲", 9))
+        self.item.meta_info = {"author": "梁鑫", "course": "线性代数", "teacher": "史灵生"}
+        self.item.save(update_fields=['meta_info'])
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.course, self.item.teacher, self.item.author, self.item.condition),
+                         ("线性代数", "史灵生", "梁鑫", None))
+        self.assertTrue(Item.objects.filter(teacher="史灵生").exists())
+
+    def test_match_by_teacher_column(self):
+        """测试仅 teacher 相同（course 无共同词）时通过列匹配"""
+        need = Need.objects.create(
+            title="微积分",
+            username=self.buyer.email,
+            price_lower_bound=10.00,
+            price_upper_bound=30.00,
+            user=self.buyer,
+            meta_info={"author": "未知", "course": "其他", "teacher": "崔建莲"},
+        )
+        self.assertEqual(Item.objects.find_matching_items(need), [self.item])
+        need.meta_info = {"author": "未知", "course": "其他", "teacher": "未知"}
+        need.save()
+        self.assertEqual(Item.objects.find_matching_items(need), [])
+
+    def test_substring_match_not_lost(self):
+        """测试候选筛选不漏掉标题互为子串的匹配（中英文混合的书名）"""
+        item = Item.objects.create(
+            title="python3编程",
+            username=self.seller.email,
+            price_lower_bound=15.00,
+            price_upper_bound=25.00,
+            user=self.seller,
+            meta_info={"author": "甲", "course": "程序设计基础", "teacher": "乙"},
+        )
+        need = Need.objects.create(
+            title="python",
+            username=self.buyer.email,
+            price_lower_bound=10.00,
+            price_upper_bound=30.00,
+            user=self.buyer,
+            meta_info={"author": "丙", "course": "程序设计基础", "teacher": "丁"},
+        )
+        self.assertTrue(is_item_need_match(item, need))
+        self.assertEqual(Need.objects.find_matching_needs(item), [need])
+        self.assertEqual(Item.objects.find_matching_items(need), [item])
+
+        item.title = "JavaScript高级程序设计"
+        item.save()
+        need.title = "java"
+        need.save()
+        self.assertTrue(is_item_need_match(item, need))
+        self.assertEqual(Need.objects.find_matching_needs(item), [need])
+        self.assertEqual(Item.objects.find_matching_items(need), [item])
+
+    def test_substring_candidates_superset_of_rule(self):
+        """测试单字词、中文词互为子串时候选包含所有规则接受的需求"""
+        titles = ["微", "积分", "微积分A", "高等微积分", "线性代数", "数"]
+        needs = [
+            Need.objects.create(
+                title=title,
+                username=self.buyer.email,
+                price_lower_bound=10.00,
+                price_upper_bound=30.00,
+                user=self.buyer,
+                meta_info={"author": "未知", "course": "微积分", "teacher": "未知"},
+            )
+            for title in titles
+        ]
+        expected = [need for need in needs if is_item_need_match(self.item, need)]
+        self.assertTrue(expected)
+        self.assertEqual(sorted(Need.objects.find_matching_needs(self.item), key=lambda need: need.id), expected)
+
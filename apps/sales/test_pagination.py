@@ -0,0 +1,58 @@
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework import status
+from apps.accounts.models import User
+from apps.sales.models import Item
+
+class SearchPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="page_user@mails.tsinghua.edu.cn",
+            username="page_user@mails.tsinghua.edu.cn",
+            password="testpassword123",
+        )
+        self.items = Item.objects.bulk_create([
+            Item(title=f"二手书{i}", username=self.user.email, price_lower_bound=10, price_upper_bound=20,
+                 user=self.user, meta_info={"course": "微积分"})
+            for i in range(5)
+        ])
+        self.item_ids = sorted(item.id for item in Item.objects.all())
+        self.search_url = reverse('search-items')
+
+    def test_page_number_mode_unchanged(self):
+        """测试默认仍为页码分页，返回总数"""
+        response = self.client.get(self.search_url, {"content_type": "title", "search_keyword": "", "page_size": 2, "page": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([item['id'] for item in response.data['results']], self.item_ids[2:4])
+
+    def test_cursor_mode_walks_all_pages(self):
+        """测试游标分页可以依次取完所有物品"""
+        params = {"content_type": "title", "search_keyword": "", "page_size": 2, "pagination": "cursor"}
+        response = self.client.get(self.search_url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        ids = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [item['id'] for item in response.data['results']]
+        self.assertEqual(ids, self.item_ids)
+
+    def test_cursor_mode_skips_count_unless_requested(self):
+        """测试游标分页默认不执行 COUNT，with_count=true 时返回总数"""
+        params = {"content_type": "title", "search_keyword": "", "pagination": "cursor"}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.search_url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+
+        response = self.client.get(self.search_url, {**params, "with_count": "true"})
+        self.assertEqual(response.data['count'], 5)
+
+    def test_invalid_pagination_mode(self):
+        """测试无效的分页方式"""
+        response = self.client.get(self.search_url, {"content_type": "title", "search_keyword": "", "pagination": "offset"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+from rest_framework.test import APITestCase
+from django.test import override_settings
+from apps.sales.ranking import search_ranking
+from apps.sales.search import item_search_terms
+from apps.sales.testing import SearchTestMixin
+
+@override_settings(SEARCH_BACKEND='bm25')
+class Bm25RankingTests(SearchTestMixin, APITestCase):
+    user_email = "ranking_user@mails.tsinghua.edu.cn"
+    default_meta_info = {**SearchTestMixin.default_meta_info, "new": 6}
+
+    def setUp(self):
+        search_ranking.invalidate()
+        super().setUp()
+        self.calculus = self.create_item("微积分", description="有笔记")
+        self.exercises = self.create_item("微积分习题", description="有笔记")
+        self.physics = self.create_item("大学物理学", description="习题有笔记")
+
+    def tearDown(self):
+        search_ranking.invalidate()
+
+    def test_results_ordered_by_bm25(self):
+        """测试按 BM25 相关度排序，包含更多查询词的物品在前"""
+        self.assertEqual(self.search_ids("微积分习题"), [self.exercises.id, self.calculus.id])
+        scores = search_ranking.scores({'title': 1.0}, ["微积分", "习题"])
+        self.assertGreater(scores[self.exercises.id], scores[self.calculus.id])
+        self.assertNotIn(self.physics.id, scores)
+
+    def test_rare_term_ranks_higher(self):
+        """测试出现次数少的词权重更高"""
+        self.create_item("线性代数", description="有笔记")
+        rare = self.create_item("线性代数习题", description="有笔记")
+        common = self.create_item("微积分教程", description="有笔记")
+        scores = search_ranking.scores({'title': 1.0}, ["习题", "微积分"])
+        # 微积分出现在 3 个标题中，习题只出现在 2 个标题中
+        self.assertGreater(scores[rare.id], scores[common.id])
+
+    def test_index_follows_item_changes(self):
+        """测试物品修改和删除后排序索引增量更新"""
+        self.assertEqual(self.search_ids("微积分习题"), [self.exercises.id, self.calculus.id])
+        self.physics.title = "微积分习题答案"
+        self.physics.save()
+        self.assertIn(self.physics.id, search_ranking.scores({'title': 1.0}, ["答案"]))
+        self.assertEqual(self.search_ids("习题答案")[0], self.physics.id)
+        physics_id = self.physics.id
+        self.physics.delete()
+        self.assertNotIn(physics_id, search_ranking.scores({'title': 1.0}, ["答案"]))
+        self.assertEqual(self.search_ids("习题答案"), [self.exercises.id])
+
+    def test_sold_items_excluded(self):
+        """测试已售出的物品不出现在排序结果中"""
+        self.exercises.sold = True
+        self.exercises.save()
+        self.assertEqual(self.search_ids("微积分习题"), [self.calculus.id])
+
+    def test_all_fields_ranked(self):
+        """测试多字段搜索时按字段权重合并 BM25 分数"""
+        ids = self.search_ids("习题", content_type="all")
+        self.assertEqual(ids, [self.exercises.id, self.physics.id])
+        response = self.client.get(self.search_url, {
+            "content_type": "all", "search_keyword": "习题", "search_fields": "title,description^10",
+        })
+        self.assertEqual([item['id'] for item in response.data['results']], [self.physics.id, self.exercises.id])
+
+    def test_length_totals_follow_item_changes(self):
+        """测试各字段的总词数随增量更新维护，与逐个物品相加一致"""
+        search_ranking.scores({'title': 1.0}, ["微积分"])
+        self.physics.title = "微积分习题答案详解"
+        self.physics.save()
+        self.calculus.delete()
+        data = search_ranking.data
+        for field, lengths in data.lengths.items():
+            self.assertEqual(data.total_lengths[field], sum(lengths.values()))
+
+    def test_updates_during_rebuild_are_kept(self):
+        """测试全量重建期间发生的增量更新在新索引上重放，不会丢失"""
+        search_ranking.scores({'title': 1.0}, ["微积分"])
+        load = search_ranking.load
+
+        def load_then_update():
+            # 重建读取数据库之后、替换索引之前，物品被修改
+            data = load()
+            self.physics.title = "微积分习题答案"
+            search_ranking.update_item(self.physics.id, item_search_terms(self.physics))
+            return data
+
+        with patch.object(search_ranking, 'load', side_effect=load_then_update):
+            search_ranking.build()
+        self.assertIn(self.physics.id, search_ranking.scores({'title': 1.0}, ["答案"]))
@@ -0,0 +1,184 @@
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework import status
+from apps.accounts.models import User
+from apps.sales.models import Item, Need
+from apps.sales.recommendation import recommendation_index, recommendation_cache, feature_text
+from apps.sales.search_cache import search_result_cache
+
+class RecommendationIndexTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(
+            email="rec_seller@mails.tsinghua.edu.cn",
+            username="rec_seller@mails.tsinghua.edu.cn",
+            password="password123",
+        )
+        self.buyer = User.objects.create_user(
+            email="rec_buyer@mails.tsinghua.edu.cn",
+            username="rec_buyer@mails.tsinghua.edu.cn",
+            password="password123",
+        )
+        self.calculus = Item.objects.create(
+            title="微积分教程", username=self.seller.email, price_lower_bound=10, price_upper_bound=20, user=self.seller,
+            meta_info={"author": "崔建莲", "course": "微积分A", "teacher": "崔建莲", "description": "几乎全新", "new": 9},
+        )
+        self.physics = Item.objects.create(
+            title="大学物理学", username=self.seller.email, price_lower_bound=10, price_upper_bound=20, user=self.seller,
+            meta_info={"author": "张三慧", "course": "大学物理B", "teacher": "魏洋", "description": "有笔记", "new": 6},
+        )
+        self.search_url = reverse('search-items')
+        recommendation_cache.cache.clear()
+
+    def candidate_scores(self, texts):
+        """:return: {item_id: 相似度}，即 top_item_ids 排序所用的候选"""
+        item_ids, scores = recommendation_index.candidates(texts)
+        return dict(zip(item_ids.tolist(), scores.tolist()))
+
+    def test_scores_rank_relevant_item_first(self):
+        """测试与需求相关的物品相似度更高"""
+        scores = self.candidate_scores([feature_text("微积分", {"course": "微积分A", "teacher": "崔建莲"})])
+        self.assertGreater(scores[self.calculus.id], scores[self.physics.id])
+
+    def test_index_refits_after_item_change(self):
+        """测试变化超过比例后模型重新拟合"""
+        recommendation_index.candidates([])
+        self.assertFalse(recommendation_index.dirty)
+        self.physics.sold = True
+        self.physics.save()
+        self.assertTrue(recommendation_index.dirty)
+        self.assertNotIn(self.physics.id, recommendation_index.top_item_ids(["大学物理"], 10))
+
+    def test_incremental_update_without_refit(self):
+        """测试少量物品变化以增量方式更新，不重新拟合"""
+        # bulk_create 不触发信号，用来构造足够大的基础模型
+        Item.objects.bulk_create([
+            Item(title=f"旧书{i}", username=self.seller.email, price_lower_bound=10, price_upper_bound=20,
+                 user=self.seller, meta_info={"course": "英语"})
+            for i in range(20)
+        ])
+        recommendation_index.invalidate()
+        recommendation_index.candidates([])
+        vectorizer = recommendation_index.model[0]
+
+        self.physics.title = "微积分习题"
+        self.physics.meta_info = {"course": "微积分A", "teacher": "崔建莲"}
+        self.physics.save()
+        self.assertFalse(recommendation_index.dirty)
+        self.assertIs(recommendation_index.model[0], vectorizer)
+        scores = self.candidate_scores(["微积分 崔建莲"])
+        self.assertGreater(scores[self.physics.id], 0)
+        # 修改后的物品以新向量参与 top-k，不因旧向量失效而被漏掉
+        self.assertIn(self.physics.id, recommendation_index.top_item_ids(["微积分 崔建莲"], 2))
+
+        self.physics.delete()
+        self.assertNotIn(self.physics.id, self.candidate_scores([]))
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_update_applied_after_commit(self):
+        """测试非同步模式下增量更新在事务提交后才执行"""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.calculus.title = "线性代数"
+            self.calculus.save(update_fields=['title'])
+        # 另一个回调是提交后使搜索结果缓存失效
+        callbacks = [callback for callback in callbacks if callback != search_result_cache.invalidate]
+        self.assertEqual(len(callbacks), 1)
+
+    def test_homepage_orders_by_need_similarity(self):
+        """测试首页推荐按需求相似度排序"""
+        Need.objects.create(
+            title="大学物理", username=self.buyer.email, price_lower_bound=10, price_upper_bound=20, user=self.buyer,
+            meta_info={"author": "张三慧", "course": "大学物理B", "teacher": "魏洋"},
+        )
+        self.client.login(email=self.buyer.email, password="password123")
+        response = self.client.get(self.search_url, {"content_type": "homepage", "search_keyword": self.buyer.email})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.physics.id, self.calculus.id])
+
+    def test_top_item_ids(self):
+        """测试只取相似度最高的 k 个物品，顺序与完整排序一致"""
+        Item.objects.bulk_create([
+            Item(title=f"物理习题{i}", username=self.seller.email, price_lower_bound=10, price_upper_bound=20,
+                 user=self.seller, meta_info={"course": "大学物理B" if i % 2 else "英语"})
+            for i in range(20)
+        ])
+        recommendation_index.invalidate()
+        texts = ["大学物理 魏洋"]
+        scores = self.candidate_scores(texts)
+        expected = sorted(scores, key=lambda item_id: (-scores[item_id], item_id))
+        self.assertEqual(recommendation_index.top_item_ids(texts, 5), expected[:5])
+        self.assertEqual(recommendation_index.top_item_ids(texts, 100), expected)
+
+    @override_settings(RECOMMENDATION_MAX_RESULTS=1)
+    def test_homepage_skips_own_items(self):
+        """测试相似度最高的是用户自己的物品时扩大范围，仍返回足够的推荐"""
+        Item.objects.create(
+            title="大学物理", username=self.buyer.email, price_lower_bound=10, price_upper_bound=20, user=self.buyer,
+            meta_info={"author": "张三慧", "course": "大学物理B", "teacher": "魏洋"},
+        )
+        Need.objects.create(
+            title="大学物理", username=self.buyer.email, price_lower_bound=10, price_upper_bound=20, user=self.buyer,
+            meta_info={"author": "张三慧", "course": "大学物理B", "teacher": "魏洋"},
+        )
+        self.client.login(email=self.buyer.email, password="password123")
+        response = self.client.get(self.search_url, {"content_type": "homepage", "search_keyword": self.buyer.email})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.physics.id])
+
+    def test_homepage_pages_served_from_cache(self):
+        """测试翻页时直接使用缓存的推荐结果"""
+        Need.objects.create(
+            title="大学物理", username=self.buyer.email, price_lower_bound=10, price_upper_bound=20, user=self.buyer,
+            meta_info={"author": "张三慧", "course": "大学物理B", "teacher": "魏洋"},
+        )
+        self.client.login(email=self.buyer.email, password="password123")
+        params = {"content_type": "homepage", "search_keyword": self.buyer.email, "page_size": 1}
+        response = self.client.get(self.search_url, params)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(recommendation_cache.get(self.buyer.id), [self.physics.id, self.calculus.id])
+
+        # 缓存中的顺序即分页结果的顺序
+        recommendation_cache.set(self.buyer.id, [self.calculus.id, self.physics.id])
+        response = self.client.get(self.search_url, {**params, "page": 2})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.physics.id])
+
+    def test_cache_invalidated_when_needs_or_schedule_change(self):
+        """测试需求或课程表变化后缓存失效"""
+        recommendation_index.candidates([])
+        recommendation_cache.set(self.buyer.id, [self.calculus.id])
+        Need.objects.create(
+            title="大学物理", username=self.buyer.email, price_lower_bound=10, price_upper_bound=20, user=self.buyer,
+        )
+        self.assertIsNone(recommendation_cache.get(self.buyer.id))
+
+        recommendation_cache.set(self.buyer.id, [self.calculus.id])
+        self.buyer.save(update_fields=['last_login'])
+        self.assertEqual(recommendation_cache.get(self.buyer.id), [self.calculus.id])
+        self.buyer.class_schedule = [{"course": "微积分A", "teacher": "崔建莲"}]
+        self.buyer.save()
+        self.assertIsNone(recommendation_cache.get(self.buyer.id))
+
+    def test_homepage_query_count_independent_of_candidates(self):
+        """测试首页推荐的查询数不随候选物品数增长"""
+        Need.objects.create(
+            title="大学物理", username=self.buyer.email, price_lower_bound=10, price_upper_bound=20, user=self.buyer,
+        )
+        self.client.login(email=self.buyer.email, password="password123")
+        params = {"content_type": "homepage", "search_keyword": self.buyer.email}
+
+        def count_queries():
+            recommendation_cache.cache.clear()
+            recommendation_index.invalidate()
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(self.search_url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context.captured_queries)
+
+        few = count_queries()
+        Item.objects.bulk_create([
+            Item(title=f"物理习题{i}", username=self.seller.email, price_lower_bound=10, price_upper_bound=20,
+                 user=self.seller, meta_info={"course": "大学物理B"})
+            for i in range(30)
+        ])
+        self.assertEqual(count_queries(), few)
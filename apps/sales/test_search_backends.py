@@ -0,0 +1,86 @@
+from rest_framework.test import APITestCase
+from django.db import connection
+from django.test import override_settings
+from rest_framework import status
+from apps.sales.models import Item
+from apps.sales.search_backends import get_search_backend, SQLiteFTS5Backend, TokenIndexBackend
+from apps.sales.testing import SearchTestMixin
+
+class SearchBackendTests(SearchTestMixin, APITestCase):
+    user_email = "backend_user@mails.tsinghua.edu.cn"
+
+    def setUp(self):
+        super().setUp()
+        self.calculus = self.create_item("微积分")
+        self.exercises = self.create_item("微积分习题", description="有笔记", new=6)
+        self.physics = self.create_item(
+            "大学物理学", author="张三慧", course="大学物理B", teacher="魏洋", description="习题有笔记", new=6,
+        )
+
+    def filter_ids(self, keyword, content_type="title"):
+        """直接通过 ItemManager.filter 搜索，不经过接口"""
+        return list(Item.objects.filter(content_type=content_type, search_keyword=keyword).values_list('id', flat=True))
+
+    def test_default_backend_for_sqlite(self):
+        """测试 SQLite 下默认使用 FTS5"""
+        self.assertIsInstance(get_search_backend(), SQLiteFTS5Backend)
+        with self.settings(SEARCH_BACKEND='token'):
+            self.assertIsInstance(get_search_backend(), TokenIndexBackend)
+
+    def test_results_ordered_by_relevance(self):
+        """测试同时包含多个查询词的物品排在前面"""
+        self.assertEqual(self.filter_ids("微积分习题"), [self.exercises.id, self.calculus.id])
+        self.assertEqual(self.search_ids("微积分习题"), [self.exercises.id, self.calculus.id])
+
+    def test_search_limited_to_field(self):
+        """测试只在指定字段中匹配"""
+        self.assertEqual(self.filter_ids("习题"), [self.exercises.id])
+        self.assertEqual(self.filter_ids("习题", content_type="description"), [self.physics.id])
+
+    @override_settings(SEARCH_BACKEND='token')
+    def test_token_backend_same_results(self):
+        """测试倒排索引后端与 FTS5 后端结果一致（不排序）"""
+        self.assertEqual(sorted(self.filter_ids("微积分习题")), sorted([self.exercises.id, self.calculus.id]))
+        self.assertEqual(self.filter_ids("魏洋", content_type="teacher"), [self.physics.id])
+
+    def test_index_follows_item_changes(self):
+        """测试物品修改和删除后全文索引同步更新"""
+        self.physics.title = "微积分答案"
+        self.physics.save()
+        self.assertIn(self.physics.id, self.filter_ids("微积分"))
+        physics_id = self.physics.id
+        self.physics.delete()
+        self.assertNotIn(physics_id, self.filter_ids("微积分"))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM sales_item_fts WHERE rowid / 8 = %s", [physics_id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_all_fields_merged(self):
+        """测试 content_type=all 一次搜索多个字段，结果去重"""
+        # 魏洋只出现在 teacher 中，习题出现在 title 和 description 中
+        self.assertEqual(self.search_ids("魏洋", content_type="all"), [self.physics.id])
+        self.assertEqual(sorted(self.search_ids("习题", content_type="all")), sorted([self.exercises.id, self.physics.id]))
+        # 崔建莲同时是两个物品的 author 和 teacher，每个物品只出现一次
+        self.assertEqual(sorted(self.search_ids("崔建莲", content_type="all")), sorted([self.calculus.id, self.exercises.id]))
+
+    def test_all_fields_boosts(self):
+        """测试字段权重决定排序"""
+        # 默认 title 权重高于 description
+        self.assertEqual(self.search_ids("习题", content_type="all"), [self.exercises.id, self.physics.id])
+        ids = self.search_ids("习题", content_type="all", search_fields="title^0.1,description^10")
+        self.assertEqual(ids, [self.physics.id, self.exercises.id])
+        # 只搜索指定的字段
+        self.assertEqual(self.search_ids("习题", content_type="all", search_fields="description"), [self.physics.id])
+
+    def test_all_fields_invalid(self):
+        """测试指定的字段或权重无效时返回 400"""
+        for search_fields in ("price", "title^abc", "title^0"):
+            response = self.client.get(
+                self.search_url, {"content_type": "all", "search_keyword": "习题", "search_fields": search_fields}
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(SEARCH_BACKEND='token')
+    def test_token_backend_all_fields(self):
+        """测试倒排索引后端的多字段搜索"""
+        self.assertEqual(sorted(self.search_ids("魏洋 习题", content_type="all")), sorted([self.exercises.id, self.physics.id]))
@@ -0,0 +1,75 @@
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from apps.sales.search_cache import search_result_cache
+from apps.sales.testing import SearchTestMixin
+
+class SearchResultCacheTests(SearchTestMixin, APITestCase):
+    user_email = "cache_user@mails.tsinghua.edu.cn"
+
+    def setUp(self):
+        search_result_cache.cache.clear()
+        search_result_cache.reset_stats()
+        super().setUp()
+        self.calculus = self.create_item("微积分", course="微积分")
+        self.algebra = self.create_item("线性代数", course="线性代数")
+        self.cache_status_url = reverse('search-cache')
+
+    def test_repeated_search_hits_cache(self):
+        """测试重复搜索命中缓存，只查询当前页的物品"""
+        self.assertEqual(self.search_ids("微积分"), [self.calculus.id])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search_ids("微积分"), [self.calculus.id])
+        # 只剩下取当前页物品的查询，不再执行全文搜索
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('sales_item_fts', queries[0]['sql'])
+        self.assertEqual(search_result_cache.stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_normalized_key(self):
+        """测试分词集合相同的查询共用缓存，不同字段不共用"""
+        self.search_ids("微积分 线性代数")
+        self.search_ids("线性代数  微积分")
+        self.assertEqual(search_result_cache.stats()['hits'], 1)
+        self.search_ids("微积分 线性代数", content_type="course")
+        self.assertEqual(search_result_cache.stats()['misses'], 2)
+
+    def test_invalidated_on_item_changes(self):
+        """测试物品新增、修改、售出、删除后缓存失效"""
+        self.assertEqual(self.search_ids("微积分"), [self.calculus.id])
+        exercises = self.create_item("微积分习题", course="微积分习题")
+        self.assertEqual(sorted(self.search_ids("微积分")), sorted([self.calculus.id, exercises.id]))
+        self.algebra.title = "微积分与线性代数"
+        self.algebra.save()
+        self.assertIn(self.algebra.id, self.search_ids("微积分"))
+        exercises.sold = True
+        exercises.save(update_fields=['sold'])
+        self.assertNotIn(exercises.id, self.search_ids("微积分"))
+        self.algebra.delete()
+        self.assertEqual(self.search_ids("微积分"), [self.calculus.id])
+        self.assertEqual(search_result_cache.stats()['hits'], 0)
+
+    def test_large_results_not_cached(self):
+        """测试结果数超过上限时不缓存"""
+        with self.settings(SEARCH_CACHE_MAX_RESULTS=1):
+            self.search_ids("崔建莲", content_type="author")
+            with CaptureQueriesContext(connection) as queries:
+                ids = self.search_ids("崔建莲", content_type="author")
+        self.assertEqual(search_result_cache.stats()['hits'], 0)
+        # 结果完整，由 SQL 分页；判断是否可缓存时最多只取出上限加一个 id
+        self.assertEqual(sorted(ids), sorted([self.calculus.id, self.algebra.id]))
+        self.assertTrue(any('LIMIT 2' in query['sql'] for query in queries))
+
+    def test_cache_status_requires_staff(self):
+        """测试命中率接口只对管理员开放"""
+        response = self.client.get(self.cache_status_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(email=self.user.email, password="testpassword123")
+        self.search_ids("微积分")
+        self.search_ids("微积分")
+        response = self.client.get(self.cache_status_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['hit_ratio'], 0.5)
@@ -0,0 +1,75 @@
+import os
+import tempfile
+from io import StringIO
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework import status
+from apps.accounts.models import User
+from apps.sales.models import Item, ItemToken
+
+class ItemSearchIndexTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="index_user@mails.tsinghua.edu.cn",
+            username="index_user@mails.tsinghua.edu.cn",
+            password="testpassword123",
+        )
+        self.item = Item.objects.create(
+            title="微积分教程",
+            username=self.user.email,
+            price_lower_bound=10,
+            price_upper_bound=20,
+            user=self.user,
+            meta_info={"author": "崔建莲", "course": "微积分A", "teacher": "崔建莲", "description": "几乎没有破损", "new": 9},
+        )
+        self.search_url = reverse('search-items')
+
+    def test_tokens_created_on_save(self):
+        """测试物品保存时建立倒排索引"""
+        terms = set(ItemToken.objects.filter(item=self.item).values_list('field', 'term'))
+        self.assertIn(('title', '微积分'), terms)
+        self.assertIn(('description', '破损'), terms)
+        # 停用词不进入索引
+        self.assertNotIn(('title', '教程'), terms)
+
+    def test_tokens_updated_on_modify(self):
+        """测试物品修改后索引同步更新"""
+        self.item.title = "线性代数"
+        self.item.save()
+        terms = set(ItemToken.objects.filter(item=self.item, field='title').values_list('term', flat=True))
+        self.assertIn('线性代数', terms)
+        self.assertNotIn('微积分', terms)
+
+    def test_tokens_deleted_with_item(self):
+        """测试物品删除后索引一并删除"""
+        item_id = self.item.id
+        self.item.delete()
+        self.assertFalse(ItemToken.objects.filter(item_id=item_id).exists())
+
+    def test_search_uses_index(self):
+        """测试搜索结果来自倒排索引"""
+        response = self.client.get(self.search_url, {"content_type": "description", "search_keyword": "破损"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.item.id])
+
+    def test_rebuild_search_index_command(self):
+        """测试重建索引命令"""
+        ItemToken.objects.all().delete()
+        call_command('rebuild_search_index', verbosity=0)
+        self.assertTrue(ItemToken.objects.filter(item=self.item, field='author', term='建莲').exists())
+
+    def test_rebuild_only_when_dictionary_changed(self):
+        """测试启动时只在词典变化后重新计算分词并重建索引"""
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                override_settings(SEARCH_INDEX_DICT_STAMP=os.path.join(tmp_dir, 'stamp')):
+            Item._default_manager.filter(pk=self.item.pk).update(title_tokens=["过期"])
+            call_command('rebuild_search_index', '--if-dictionary-changed', stdout=StringIO())
+            self.item.refresh_from_db()
+            self.assertEqual(self.item.title_tokens, ["微积分"])
+
+            ItemToken.objects.all().delete()
+            call_command('rebuild_search_index', '--if-dictionary-changed', stdout=StringIO())
+            # 词典未变化，跳过重建
+            self.assertFalse(ItemToken.objects.exists())
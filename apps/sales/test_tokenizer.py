@@ -0,0 +1,46 @@
+from rest_framework.test import APITestCase
+from django.test import override_settings
+from apps.sales.tokenizer import (
+    TokenCache, query_cache, index_cache, tokenize, tokenize_for_index, reload_dictionary, token_cache_stats,
+)
+
+class TokenizerCacheTests(APITestCase):
+    def setUp(self):
+        query_cache.clear()
+        index_cache.clear()
+
+    def test_repeated_text_hits_cache(self):
+        """测试同一文本只分词一次，返回的结果互不影响"""
+        hits = query_cache.hits
+        words = tokenize("微积分习题")
+        words.append("修改")
+        self.assertEqual(tokenize("微积分习题"), ["微积分", "习题"])
+        self.assertEqual(query_cache.hits, hits + 1)
+        hits = index_cache.hits
+        tokenize_for_index("线性代数")
+        tokenize_for_index("线性代数")
+        self.assertEqual(index_cache.hits, hits + 1)
+        self.assertIn('hit_ratio', token_cache_stats()['query'])
+
+    def test_normalized_text(self):
+        """测试全角字符和首尾空白规范化后共用缓存"""
+        self.assertEqual(tokenize("  ＰＹＴＨＯＮ教材 "), tokenize("python教材"))
+        self.assertEqual(tokenize("python教材"), ["python"])
+
+    @override_settings(TOKENIZER_CACHE_SIZE=2, TOKENIZER_CACHE_MAX_TEXT_LENGTH=10)
+    def test_size_limits(self):
+        """测试按最近使用淘汰，过长的文本不缓存"""
+        cache = TokenCache()
+        for text in ("a", "b", "a", "c"):
+            cache.get_or_compute(text, tuple)
+        # b 最久未使用，被淘汰
+        self.assertEqual(list(cache.entries), ["a", "c"])
+        cache.get_or_compute("x" * 11, tuple)
+        self.assertEqual(len(cache.entries), 2)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_cleared_on_reload(self):
+        """测试重新加载词典后缓存清空"""
+        tokenize("大学物理")
+        reload_dictionary()
+        self.assertEqual(query_cache.stats()['size'], 0)
@@ -0,0 +1,22 @@
+from rest_framework.test import APITestCase
+from django.test import override_settings
+from apps.sales.tokenizer import initialize, tokenize, tokenize_for_index
+from apps.sales.warmup import warmup
+
+class WarmupTests(APITestCase):
+    def test_domain_dictionary_loaded(self):
+        """测试分词使用领域词典，课程名不被切开"""
+        self.assertIn("数值分析", tokenize("数值分析习题"))
+        self.assertIn("信号与系统", tokenize_for_index("信号与系统"))
+
+    def test_initialize_once(self):
+        """测试词典只加载一次"""
+        initialize()
+        self.assertEqual(initialize(), 0)
+
+    def test_warmup_reports_timings(self):
+        """测试预热返回各步骤耗时，按设置决定是否导入 scikit-learn"""
+        self.assertEqual(list(warmup()), ['jieba'])
+        with override_settings(LAZY_LOAD_SKLEARN=False):
+            timings = warmup()
+        self.assertIn('sklearn', timings)
@@ -0,0 +1,35 @@
+from django.urls import reverse
+from rest_framework import status
+from apps.accounts.models import User
+from apps.sales.models import Item
+
+
+class SearchTestMixin:
+    """
+    搜索相关测试共用的用户、物品和搜索请求
+    子类通过 user_email 区分用户，search_params 为每次搜索默认附带的参数；setUp 中先调用 super().setUp()
+    """
+    user_email = "search_user@mails.tsinghua.edu.cn"
+    password = "testpassword123"
+    default_meta_info = {"author": "崔建莲", "course": "微积分A", "teacher": "崔建莲", "description": "几乎全新", "new": 9}
+    search_params = {}
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email=self.user_email, username=self.user_email, password=self.password)
+        self.search_url = reverse('search-items')
+
+    def create_item(self, title, **meta_info):
+        """以 self.user 发布物品，meta_info 中未指定的字段取 default_meta_info"""
+        return Item.objects.create(
+            title=title, username=self.user.email, price_lower_bound=10, price_upper_bound=20, user=self.user,
+            meta_info={**self.default_meta_info, **meta_info},
+        )
+
+    def search_ids(self, keyword, content_type="title", **params):
+        """通过 search-items 接口搜索，返回当前页的物品 id"""
+        response = self.client.get(self.search_url, {
+            "content_type": content_type, "search_keyword": keyword, **self.search_params, **params,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
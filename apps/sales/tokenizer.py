@@ -0,0 +1,237 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import jieba
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 搜索与匹配共用的停用词
+STOP_WORDS = {"的", "了", "和", "是", "在", "有", "我", "也", "教材", "教程", "入门", "书籍", "课程", "导论"}
+
+
+class TokenCache:
+    """
+    分词结果的 LRU 缓存（文本 -> 分词），同一进程中重复出现的书名、课程名只分词一次
+    最多缓存 TOKENIZER_CACHE_SIZE 条，长于 TOKENIZER_CACHE_MAX_TEXT_LENGTH 的文本（如较长的 description）不缓存
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, text, compute):
+        if len(text) > getattr(settings, 'TOKENIZER_CACHE_MAX_TEXT_LENGTH', 200):
+            return compute(text)
+        with self.lock:
+            words = self.entries.get(text)
+            if words is not None:
+                self.entries.move_to_end(text)
+                self.hits += 1
+                return words
+            self.misses += 1
+        words = compute(text)
+        with self.lock:
+            self.entries[text] = words
+            while len(self.entries) > getattr(settings, 'TOKENIZER_CACHE_SIZE', 10000):
+                self.entries.popitem(last=False)
+        return words
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0,
+            }
+
+
+# 查询分词（精确模式）和索引分词（搜索引擎模式）分别缓存
+query_cache = TokenCache()
+index_cache = TokenCache()
+
+_lock = threading.Lock()
+# 当前使用的 jieba 分词器，热加载时整体替换
+_tokenizer = None
+# 加载时各词典文件的修改时间，用于判断是否需要重新加载
+_dictionary_mtimes = None
+_checked_at = 0
+reload_thread = None
+
+
+def dictionary_paths(include_catalog=True):
+    """在默认词典之后加载的词典：领域词典（JIEBA_USER_DICT）和由数据生成的词典（JIEBA_CATALOG_DICT）"""
+    paths = [getattr(settings, 'JIEBA_USER_DICT', None)]
+    if include_catalog:
+        paths.append(getattr(settings, 'JIEBA_CATALOG_DICT', None))
+    return [path for path in paths if path]
+
+
+def dictionary_mtimes():
+    return {path: os.path.getmtime(path) if os.path.exists(path) else None for path in dictionary_paths()}
+
+
+def dictionary_fingerprint():
+    """词典文件内容的摘要，用于判断已有索引是否按当前词典分词（见 rebuild_search_index --if-dictionary-changed）"""
+    digest = hashlib.sha256()
+    for path in dictionary_paths():
+        digest.update(path.encode('utf-8') + b'\0')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def build_tokenizer(include_catalog=True):
+    """
+    新建 jieba 分词器：前缀词典从 JIEBA_CACHE_FILE 指定的序列化缓存读取（不存在时构建并写入），
+    再依次加载 dictionary_paths() 中存在的词典；include_catalog 为 False 时不加载 JIEBA_CATALOG_DICT
+    """
+    tokenizer = jieba.Tokenizer()
+    cache_file = getattr(settings, 'JIEBA_CACHE_FILE', None)
+    if cache_file:
+        tokenizer.tmp_dir = os.path.dirname(os.path.abspath(cache_file))
+        tokenizer.cache_file = os.path.basename(cache_file)
+        os.makedirs(tokenizer.tmp_dir, exist_ok=True)
+    tokenizer.initialize()
+    for path in dictionary_paths(include_catalog):
+        if os.path.exists(path):
+            tokenizer.load_userdict(path)
+    return tokenizer
+
+
+def initialize():
+    """
+    加载词典，只执行一次，返回耗时（秒）
+    启动预热时调用（见 apps.py），分词前也会调用，保证所有分词都使用同一份词典
+    """
+    global _tokenizer, _dictionary_mtimes, _checked_at
+    if _tokenizer is not None:
+        return 0
+    with _lock:
+        if _tokenizer is not None:
+            return 0
+        start = time.perf_counter()
+        # 先记录修改时间，加载期间词典被改写时下次检查会再加载一次
+        _dictionary_mtimes = dictionary_mtimes()
+        _tokenizer = build_tokenizer()
+        _checked_at = time.monotonic()
+        elapsed = time.perf_counter() - start
+        logger.info("jieba dictionary loaded in %.3fs", elapsed)
+        return elapsed
+
+
+def reload_dictionary():
+    """重新加载全部词典，完成后替换当前分词器；加载期间继续使用旧分词器"""
+    global _tokenizer, _dictionary_mtimes
+    mtimes = dictionary_mtimes()
+    tokenizer = build_tokenizer()
+    with _lock:
+        _tokenizer = tokenizer
+        _dictionary_mtimes = mtimes
+    # 词典变化后旧的分词结果失效
+    query_cache.clear()
+    index_cache.clear()
+    logger.info("jieba dictionary reloaded")
+
+
+def check_reload():
+    """
+    每隔 JIEBA_DICT_CHECK_INTERVAL 秒检查词典文件是否被改写（如 build_jieba_dict 命令），
+    有变化时在后台线程重新加载，多个 worker 各自检查，无需重启
+    """
+    global _checked_at, reload_thread
+    interval = getattr(settings, 'JIEBA_DICT_CHECK_INTERVAL', 30)
+    now = time.monotonic()
+    if now - _checked_at < interval:
+        return
+    with _lock:
+        if now - _checked_at < interval or (reload_thread is not None and reload_thread.is_alive()):
+            return
+        _checked_at = now
+        if dictionary_mtimes() == _dictionary_mtimes:
+            return
+        reload_thread = threading.Thread(target=reload_dictionary, daemon=True)
+        reload_thread.start()
+
+
+def get_tokenizer():
+    initialize()
+    check_reload()
+    return _tokenizer
+
+
+def normalize_text(text):
+    """分词前的规范化：全角字符转半角（NFKC），去掉首尾空白"""
+    return unicodedata.normalize('NFKC', str(text)).strip()
+
+
+def filter_words(words):
+    """去除停用词和空白，统一转为小写"""
+    result = []
+    for word in words:
+        word = word.strip().lower()
+        if word and word not in STOP_WORDS:
+            result.append(word)
+    return result
+
+
+def tokenize(text):
+    """
+    对查询文本分词：jieba 精确模式，去除停用词和空白，统一转为小写
+    """
+    if not text:
+        return []
+    tokenizer = get_tokenizer()
+    words = query_cache.get_or_compute(normalize_text(text), lambda text: tuple(filter_words(tokenizer.lcut(text))))
+    # 缓存的是不可变的 tuple，返回副本供调用方修改
+    return list(words)
+
+
+def tokenize_for_index(text):
+    """
+    对被索引的文本分词：jieba 搜索引擎模式，会额外切出长词中的短词，提高召回
+    返回去重后的词集合
+    """
+    if not text:
+        return set()
+    tokenizer = get_tokenizer()
+    words = index_cache.get_or_compute(normalize_text(text), lambda text: frozenset(filter_words(tokenizer.lcut_for_search(text))))
+    return set(words)
+
+
+def token_cache_stats():
+    """本进程分词缓存的命中统计"""
+    return {'query': query_cache.stats(), 'index': index_cache.stats()}
+
+
+def unique_tokens(text):
+    """tokenize 的去重版本，保持原有顺序，用于持久化到数据库"""
+    return list(dict.fromkeys(tokenize(text)))
+
+
+def tokens_overlap(words_a, words_b):
+    """
+    两组分词是否“软匹配”：任一词与另一组中的某个词互为子串
+    先用集合求交快速判断，求交为空时再做子串比较
+    """
+    if not words_a or not words_b:
+        return False
+    if set(words_a) & set(words_b):
+        return True
+    for word_a in words_a:
+        if any(word_a in word_b or word_b in word_a for word_b in words_b):
+            return True
+    return False
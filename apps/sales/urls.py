@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import UploadItems, SearchItems, RaiseNeed, ModifyItems, DeleteItems, CheckNeed, GetNeed, ModifyNeed, DeleteNeed, UploadClassSchedule, UploadClassScheduleDict, CheckClassSchedule, RecommendLocation, UpdatePurchase, LoadPurchase, ConfirmPurchase
+from .views import UploadItems, SearchItems, ItemDetail, RaiseNeed, ModifyItems, DeleteItems, CheckNeed, GetNeed, ModifyNeed, DeleteNeed, UploadClassSchedule, UploadClassScheduleDict, CheckClassSchedule, RecommendLocation, UpdatePurchase, LoadPurchase, ConfirmPurchase, MatchJobStatus, SearchCacheStatus
 
 urlpatterns = [
     path('upload-items', UploadItems.as_view(), name='upload-items'),
     path('search-items', SearchItems.as_view(), name='search-items'),
+    path('item-detail', ItemDetail.as_view(), name='item-detail'),
     path("modify-items", ModifyItems.as_view(), name="modify-items"),
     path("delete-items", DeleteItems.as_view(), name="delete-items"),
     path("upload-courses", UploadClassSchedule.as_view(), name="upload_class_schedule"),
@@ -18,4 +19,6 @@ urlpatterns = [
     path("update-purchase", UpdatePurchase.as_view(), name="update-purchase"),
     path("load-purchase", LoadPurchase.as_view(), name="load-purchase"),
     path("confirm-purchase", ConfirmPurchase.as_view(), name="confirm-purchase"),
+    path("match-jobs", MatchJobStatus.as_view(), name="match-jobs"),
+    path("search-cache", SearchCacheStatus.as_view(), name="search-cache"),
 ]
\ No newline at end of file
@@ -2,19 +2,26 @@ from rest_framework.views import APIView
 from .serializers import UploadItemsSerializer, SearchItemsSerializer, ModifyItemsSerializer, DeleteItemsSerializer, RaiseNeedSerializer, UploadClassScheduleSerializer, UploadClassScheduleDictSerializer, CheckClassScheduleSerializer
 from .serializers import UploadItemsSerializer, SearchItemsSerializer, ModifyItemsSerializer, DeleteItemsSerializer, RaiseNeedSerializer, CheckNeedSerializer, ModifyNeedSerializer, GetNeedSerializer, DeleteNeedSerializer, RecommendLocationSerializer
 from rest_framework.response import Response
-from .serializers import UpdatePurchaseSerializer, LoadPurchaseSerializer, ConfirmPurchaseSerializer
-from apps.chat.views import send_notification_when_need_match
+from .serializers import UpdatePurchaseSerializer, LoadPurchaseSerializer, ConfirmPurchaseSerializer, ItemDetailSerializer
 from rest_framework import status
 from apps.accounts.models import User
-from apps.sales.models import Item, Need, Purchase
+from apps.sales.models import Item, Need, Purchase, MatchJob
+from .jobs import enqueue_match_job, job_stats
 from django.conf import settings
 from django.utils import timezone
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from .config import day2num, section2num, nearby_time, num2day, num2section
 from collections import defaultdict
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from django.db.models import Case, When, Value, IntegerField
+import random
+from django.db.models import Q
+from django.db.models.functions import Substr
+from django.db.models.fields.json import KeyTransform, KeyTextTransform
+from .recommendation import recommendation_index, recommendation_cache, feature_text, FEATURE_FIELDS
+from .search import search_field_boosts
+from .search_backends import get_search_backend
+from .search_cache import search_result_cache
+from .fuzzy import fuzzy_index
+from .tokenizer import token_cache_stats
 
 class CustomPagination(PageNumberPagination):
     page_size = 12  # Default page size
@@ -22,6 +29,54 @@ class CustomPagination(PageNumberPagination):
     max_page_size = 100  # Maximum page size
 
 
+class ItemCursorPagination(CursorPagination):
+    """
+    游标分页：排序和 LIMIT 都在 SQL 中完成，游标为不透明的字符串
+    默认不统计总数，客户端传 with_count=true 时才执行 COUNT
+    """
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+
+    def __init__(self, with_count=False):
+        self.with_count = with_count
+        self.count = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.with_count:
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+        return response
+
+
+# 列表页展示的 meta_info 字段
+LIST_META_FIELDS = ('author', 'course', 'teacher', 'new')
+# 列表页 description 的截断长度，完整内容通过 item-detail 获取
+DESCRIPTION_PREVIEW_LENGTH = 50
+
+
+def item_list_values(queryset):
+    """列表页只取需要的列；meta_info 中的字段和截断后的 description 在数据库中提取，不读取整个 JSON"""
+    return queryset.values(
+        'id', 'title', 'username', 'price_lower_bound', 'price_upper_bound', 'picture',
+        meta_description=Substr(KeyTextTransform('description', 'meta_info'), 1, DESCRIPTION_PREVIEW_LENGTH),
+        **{f'meta_{field}': KeyTransform(field, 'meta_info') for field in LIST_META_FIELDS},
+    )
+
+
+def item_picture_url(request, picture):
+    if not picture:
+        return None
+    picture_url = request.build_absolute_uri(f"{settings.MEDIA_URL}{picture}")
+    return picture_url.replace("http://", "https://")
+
+
 class UploadItems(APIView):
     def post(self, request, *args, **kwargs):
         serializer = UploadItemsSerializer(data=request.data, context={'request': request})
@@ -38,34 +93,10 @@ class UploadItems(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     def check_item_need_relation(self, item):
         """检查是否有匹配的需求，并向需求发起者发送系统消息"""
-        # 使用NeedManager的find_matching_needs方法
-        matching_needs = Need.objects.find_matching_needs(item)
-        for need in matching_needs:
-            send_notification_when_need_match(item, need)
+        # 匹配和通知在后台任务中完成，不阻塞当前请求
+        enqueue_match_job(MatchJob.KIND_ITEM, item)
         
 class SearchItems(APIView):   
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer()
-
-    def calculate_similarity(self, item_feature: dict, user_need: dict):
-        item_texts = []
-        user_texts = []
-
-        for key in item_feature.keys():
-            if item_feature[key] is not None:
-                item_texts.append(str(item_feature[key]))
-        for key in user_need.keys():
-            if user_need[key] is not None:
-                user_texts.append(str(user_need[key]))
-
-        item_text = " ".join(item_texts)
-        user_text = " ".join(user_texts)
-
-        tfidf_matrix = self.vectorizer.fit_transform([item_text, user_text])
-        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-        return similarity
-
-
     def get(self, request, *args, **kwargs):
         serializer = SearchItemsSerializer(data=request.query_params, context={'request': request})
         if not serializer.is_valid():
@@ -74,8 +105,12 @@ class SearchItems(APIView):
         content_type = serializer.validated_data.get('content_type')
         search_keyword = serializer.validated_data.get('search_keyword')
         search_all = serializer.validated_data.get('search_all')
+        # 搜索的字段及权重，content_type=all 时为多个字段
+        field_boosts = serializer.validated_data.get('field_boosts') or search_field_boosts(content_type)
         # 默认只筛选未售出的物品
         sold_filter = {'sold': False}
+        # 首页推荐和关键词搜索时为排好序的物品 id 列表
+        ordered_ids = None
         if content_type == 'id':
             # If content_type is 'id', search by id
             item_id = int(search_keyword)
@@ -91,149 +126,184 @@ class SearchItems(APIView):
             # If search_all is True, return all items
             user = serializer.validated_data.get('user')
             if user:
-                # Exclude items published by the user themselves
-                items = Item.objects.filter(sold=False).exclude(user=user)
-                recommended_items = []
-                # extract 'title' and 'meta_info' from items
-                items_feature = []
-                for item in items:
-                    title = item.title
-                    if item.meta_info:
-                        author = item.meta_info.get('author', None)
-                        course = item.meta_info.get('course', None)
-                        teacher = item.meta_info.get('teacher', None)
-                        description = item.meta_info.get('description', None)
-                    else:
-                        author = None
-                        course = None
-                        teacher = None
-                        description = None
-                    items_feature.append({
-                        'title': title,
-                        'author': author,
-                        'course': course,
-                        'teacher': teacher,
-                        'description': description
-                    })
-                # recommend given the user's class schedule
-                if user.class_schedule:
-                    class_schedule = user.class_schedule
-                    # consider the course and teacher
-                    courses = [class_['course'] for class_ in class_schedule]  
-                    teachers = [class_['teacher'] for class_ in class_schedule]
-                    for item in items_feature:
-                        if item['course'] in courses or item['teacher'] in teachers or item['author'] in teachers:
-                            recommended_items.append(item)
-                # recommend given the user's needs
-                user_needs = Need.objects.filter(user=user)
-                if user_needs:
-                    user_needs_feature = []
-                    for need in user_needs:
-                        title = need.title
-                        if need.meta_info:
-                            author = need.meta_info.get('author', None)
-                            course = need.meta_info.get('course', None)
-                            teacher = need.meta_info.get('teacher', None)
-                            description = need.meta_info.get('description', None)
-                        else:
-                            author = None
-                            course = None
-                            teacher = None
-                            description = None
-                        user_needs_feature.append({
-                            'title': title,
-                            'author': author,
-                            'course': course,
-                            'teacher': teacher,
-                            'description': description
-                        })
-                    # recommend function
-                    for item in items_feature:
-                        for user_need in user_needs_feature:
-                            similarity = self.calculate_similarity(item, user_need)
-                            if 'similarity' in item:
-                                item['similarity'] += similarity
-                            else:
-                                item['similarity'] = similarity
-                    # Sort items by similarity
-                    sorted_items_feature = sorted(items_feature, key=lambda x: x['similarity'], reverse=True)
-                    # remove key 'similarity' from the items
-                    for item in sorted_items_feature:
-                        item.pop('similarity', None)
-                    recommended_items += sorted_items_feature
-                    # remove duplicates
-                    recommended_items = list({(item['title'], item['author'], item['course'], item['teacher'], item['description']): item for item in recommended_items}.values())
-                    # Convert to Item objects
-                    items = [Item.objects.filter(title=item['title']).first() for item in recommended_items]
-                    ordered_ids = [item.id for item in items]
-                    # need to be the format as queryset and need to maintain the order
-                    # eg. change format: [<Item: 数字逻辑与数字集成电路>, <Item: 线性代数入门>] -> <QuerySet [<Item: 数字逻辑与数字集成电路>, <Item: 线性代数入门>]>
-                    items = Item.objects.filter(id__in=ordered_ids).annotate(
-                        custom_order=Case(
-                            *[When(id=ordered_id, then=Value(index)) for index, ordered_id in enumerate(ordered_ids)],
-                            output_field=IntegerField()
-                        )
-                    ).order_by('custom_order')
-                else:
-                    if recommended_items:
-                        # have class schedule but no needs
-                        # Convert to Item objects
-                        items = [Item.objects.filter(title=item['title']).first() for item in recommended_items]
-                        # need to be the format as queryset and need to maintain the order
-                        ordered_ids = [item.id for item in items]
-                        items = Item.objects.filter(id__in=ordered_ids).annotate(
-                            custom_order=Case(
-                                *[When(id=ordered_id, then=Value(index)) for index, ordered_id in enumerate(ordered_ids)],
-                                output_field=IntegerField()
-                            )
-                        ).order_by('custom_order')                        
-                    else:
-                        # have no class schedule and no needs, so return random items
-                        items = Item.objects.filter(sold=False).exclude(user=user).order_by('?')
+                # 推荐结果（排好序的物品 id）按用户缓存，翻页时直接切片，不再重新计算
+                ordered_ids = recommendation_cache.get(user.id)
+                if ordered_ids is None:
+                    ordered_ids = self.recommend_item_ids(user)
+                    recommendation_cache.set(user.id, ordered_ids)
             else:
                 # 如果没有登录用户，返回所有商品
                 items = Item.objects.filter(sold=False)
             
         else:
             user = serializer.validated_data.get('user')
-            if user:
-                # Exclude items published by the user themselves
-                items = Item.objects.filter(
-                    content_type=content_type,
-                    search_keyword=search_keyword,
-                    sold=False
-                ).exclude(user=user)
-            else:
-                items = Item.objects.filter(
-                    content_type=content_type,
-                    search_keyword=search_keyword,
-                    **sold_filter
-                )
+            # 搜索结果（排好序的物品 id）按规范化后的查询缓存，物品变化时失效
+            # 游标模式用于翻阅大量结果，直接查询，不经过缓存
+            search_mode = serializer.validated_data.get('search_mode')
+            cache_key = None
+            if serializer.validated_data.get('pagination') != 'cursor':
+                cache_key = search_result_cache.key(field_boosts, search_keyword, sold_filter, user.id if user else None, search_mode)
+                ordered_ids = search_result_cache.get(cache_key)
+            if ordered_ids is None:
+                if search_mode != 'fuzzy':
+                    if user:
+                        # Exclude items published by the user themselves
+                        items = Item.objects.filter(
+                            content_type=content_type,
+                            search_keyword=search_keyword,
+                            field_boosts=field_boosts,
+                            sold=False
+                        ).exclude(user=user)
+                    else:
+                        items = Item.objects.filter(
+                            content_type=content_type,
+                            search_keyword=search_keyword,
+                            field_boosts=field_boosts,
+                            **sold_filter
+                        )
+                    # 相关度在进程内计算的搜索后端（bm25）：只取符合条件的物品 id，按相关度排序后分页
+                    scores = get_search_backend().rank(field_boosts, search_keyword)
+                    if scores is not None:
+                        ordered_ids = sorted(items.values_list('id', flat=True), key=lambda item_id: (-scores.get(item_id, 0.0), item_id))
+                    elif cache_key is not None:
+                        # 全文索引后端已按相关度排序，倒排索引后端按 id 排序
+                        # 最多取出可缓存的数量加一；结果更多时不缓存，直接在 SQL 中分页
+                        max_results = getattr(settings, 'SEARCH_CACHE_MAX_RESULTS', 1000)
+                        ordered_ids = list((items if items.ordered else items.order_by('id')).values_list('id', flat=True)[:max_results + 1])
+                        if len(ordered_ids) > max_results:
+                            ordered_ids = None
+                # 拼音/模糊搜索：fuzzy 模式直接使用，auto 模式在精确搜索没有结果时使用
+                if search_mode == 'fuzzy' or (
+                    search_mode == 'auto' and not (ordered_ids if ordered_ids is not None else items.exists())
+                ):
+                    ordered_ids = self.fuzzy_item_ids(field_boosts, search_keyword, user)
+                if cache_key is not None and ordered_ids is not None:
+                    search_result_cache.set(cache_key, ordered_ids)
         # 加入分页器之后的返回逻辑，不要改
-        # 先将 QuerySet 转换为字典 QuerySet, 方便后续使用 .values() 生成 list
-        items = list(items.values())
-        # 引入自定义分页器
-        paginator = CustomPagination()
-        paginated_items = paginator.paginate_queryset(items, request)
+        # 列表只取精简字段；按 id 查询时返回完整记录，兼容把它当作详情使用的客户端
+        project = (lambda queryset: queryset.values()) if content_type == 'id' else item_list_values
+        if ordered_ids is not None:
+            # 推荐或排好序的搜索结果：对 id 列表分页，只取当前页的物品，并按列表顺序排列
+            # 顺序不是 SQL 排序，游标模式下也使用页码分页
+            paginator = CustomPagination()
+            paginated_ids = paginator.paginate_queryset(ordered_ids, request)
+            page_items = {item['id']: item for item in project(Item._default_manager.filter(id__in=paginated_ids, sold=False))}
+            paginated_items = [page_items[item_id] for item_id in paginated_ids if item_id in page_items]
+        elif serializer.validated_data.get('pagination') == 'cursor':
+            # 游标模式：不执行 OFFSET，也不统计总数（除非客户端要求）
+            paginator = ItemCursorPagination(with_count=serializer.validated_data.get('with_count'))
+            paginated_items = paginator.paginate_queryset(project(items), request)
+        else:
+            # 引入自定义分页器
+            # 直接对 QuerySet 分页，只取出当前页的行，不再把全部结果读入内存
+            paginator = CustomPagination()
+            items = project(items)
+            if not items.ordered:
+                # 关键词搜索已按相关度排序，其余按 id 排序
+                items = items.order_by('id')
+            paginated_items = paginator.paginate_queryset(items, request)
         data = []
         for item in paginated_items:
-            picture_url = None
-            if item.get('picture'):
-                picture_url = request.build_absolute_uri(f"{settings.MEDIA_URL}{item['picture']}")
-                picture_url = picture_url.replace("http://", "https://")
+            if 'meta_info' in item:
+                meta_info = item['meta_info']
+            else:
+                # 精简的 meta_info：列表页展示的字段和截断后的 description
+                meta_info = {
+                    field: item[f'meta_{field}'] for field in LIST_META_FIELDS + ('description',)
+                    if item[f'meta_{field}'] is not None
+                }
             data.append({
                 'title': item['title'],
-                'picture': picture_url,
+                'picture': item_picture_url(request, item['picture']),
                 'username': item['username'],
                 'price_lower_bound': item['price_lower_bound'],
                 'price_upper_bound': item['price_upper_bound'],
-                'meta_info': item['meta_info'],
+                'meta_info': meta_info,
                 'id': item['id'],
             })
-            
+
         # 返回包含分页元数据的响应（count, next, previous, results）
         return paginator.get_paginated_response(data)
 
+    def fuzzy_item_ids(self, field_boosts, search_keyword, user):
+        """模糊搜索，返回按匹配程度排序的未售出物品 id"""
+        scores = fuzzy_index.scores(field_boosts, search_keyword)
+        items = Item._default_manager.filter(id__in=list(scores), sold=False)
+        if user:
+            items = items.exclude(user=user)
+        return sorted(items.values_list('id', flat=True), key=lambda item_id: (-scores[item_id], item_id))
+
+    def recommend_item_ids(self, user):
+        """
+        根据用户的课程表和需求计算推荐物品，返回排好序的物品 id 列表，最多 RECOMMENDATION_MAX_RESULTS 个
+        只取出排在前面的物品的特征，不读取整个物品表
+        """
+        limit = settings.RECOMMENDATION_MAX_RESULTS
+        # Exclude items published by the user themselves
+        items = Item.objects.filter(sold=False).exclude(user=user)
+        recommended_items = []
+        # recommend given the user's class schedule
+        if user.class_schedule:
+            class_schedule = user.class_schedule
+            # consider the course and teacher，直接查带索引的 course/teacher/author 列
+            courses = [class_['course'] for class_ in class_schedule]
+            teachers = [class_['teacher'] for class_ in class_schedule]
+            recommended_items += items.filter(
+                Q(course__in=courses) | Q(teacher__in=teachers) | Q(author__in=teachers)
+            ).order_by('id').values_list('id', 'title', 'meta_info')[:limit]
+        # recommend given the user's needs
+        user_needs = list(Need.objects.filter(user=user).values_list('title', 'meta_info'))
+        if user_needs:
+            # 用预先拟合好的 TF-IDF 模型取出相似度最高的物品；排在前面的可能是用户自己的物品，不够时扩大范围
+            texts = [feature_text(title, meta_info) for title, meta_info in user_needs]
+            k = limit
+            while True:
+                top_ids = recommendation_index.top_item_ids(texts, k)
+                rows = {row[0]: row for row in items.filter(id__in=top_ids).values_list('id', 'title', 'meta_info')}
+                if len(rows) >= limit or len(top_ids) < k:
+                    break
+                k *= 2
+            # Sort items by similarity
+            recommended_items += [rows[item_id] for item_id in top_ids if item_id in rows]
+            # remove duplicates: 特征完全相同的物品只保留一个
+            unique_items = {}
+            for item_id, title, meta_info in recommended_items:
+                meta_info = meta_info or {}
+                features = (title,) + tuple(meta_info.get(field) for field in FEATURE_FIELDS[1:])
+                unique_items.setdefault(features, item_id)
+            return list(unique_items.values())[:limit]
+        elif recommended_items:
+            # have class schedule but no needs
+            return [item_id for item_id, _, _ in recommended_items]
+        else:
+            # have no class schedule and no needs, so return random items
+            # 从推荐模型的物品中抽样，不扫描物品表
+            candidate_ids, _ = recommendation_index.candidates([])
+            sample = random.sample(candidate_ids.tolist(), min(limit, len(candidate_ids)))
+            available = set(items.filter(id__in=sample).values_list('id', flat=True))
+            return [item_id for item_id in sample if item_id in available]
+
+class ItemDetail(APIView):
+    def get(self, request, *args, **kwargs):
+        """物品详情：返回完整的 meta_info"""
+        serializer = ItemDetailSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        item = Item._default_manager.filter(id=serializer.validated_data['id']).first()
+        if not item:
+            return Response({"message": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
+        data = {
+            'title': item.title,
+            'picture': item_picture_url(request, item.picture.name),
+            'username': item.username,
+            'price_lower_bound': item.price_lower_bound,
+            'price_upper_bound': item.price_upper_bound,
+            'meta_info': item.meta_info,
+            'sold': item.sold,
+            'id': item.id,
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
 class ModifyItems(APIView):
     def post(self, request, *args, **kwargs):
         serializer = ModifyItemsSerializer(data=request.data, context={'request': request})
@@ -254,10 +324,8 @@ class ModifyItems(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     def check_item_need_relation(self, item):
         """检查是否有匹配的需求，并向需求发起者发送系统消息"""
-        # 使用NeedManager的find_matching_needs方法
-        matching_needs = Need.objects.find_matching_needs(item)
-        for need in matching_needs:
-            send_notification_when_need_match(item, need)
+        # 匹配和通知在后台任务中完成，不阻塞当前请求
+        enqueue_match_job(MatchJob.KIND_ITEM, item)
 
 class DeleteItems(APIView):
     def post(self, request, *args, **kwargs):
@@ -281,10 +349,8 @@ class RaiseNeed(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     def check_item_need_relation(self, need):
         """检查是否有匹配的商品，并向商品发布者发送系统消息"""
-        # 使用ItemManager的find_matching_items方法
-        matching_items = Item.objects.find_matching_items(need)
-        for item in matching_items:
-            send_notification_when_need_match(item, need)
+        # 匹配和通知在后台任务中完成，不阻塞当前请求
+        enqueue_match_job(MatchJob.KIND_NEED, need)
     
 class CheckNeed(APIView):
     def get(self, request, *args, **kwargs):
@@ -330,10 +396,8 @@ class ModifyNeed(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     def check_item_need_relation(self, need):
         """检查是否有匹配的商品，并向商品发布者发送系统消息"""
-        # 使用ItemManager的find_matching_items方法
-        matching_items = Item.objects.find_matching_items(need)
-        for item in matching_items:
-            send_notification_when_need_match(item, need)
+        # 匹配和通知在后台任务中完成，不阻塞当前请求
+        enqueue_match_job(MatchJob.KIND_NEED, need)
 
 class GetNeed(APIView):
     def get(self, request, *args, **kwargs):
@@ -641,4 +705,18 @@ class ConfirmPurchase(APIView):
                 purchase.results = 2
                 purchase.save()
             return Response({"message": "Purchase declined"}, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class MatchJobStatus(APIView):
+    def get(self, request, *args, **kwargs):
+        """查看后台匹配任务的积压和延迟，仅管理员可用"""
+        if not request.user.is_authenticated or not request.user.is_staff:
+            return Response({"message": "Permission denied"}, status=status.HTTP_403_FORBIDDEN)
+        return Response(job_stats(), status=status.HTTP_200_OK)
+
+class SearchCacheStatus(APIView):
+    def get(self, request, *args, **kwargs):
+        """查看本进程搜索结果缓存和分词缓存的命中率，仅管理员可用"""
+        if not request.user.is_authenticated or not request.user.is_staff:
+            return Response({"message": "Permission denied"}, status=status.HTTP_403_FORBIDDEN)
+        return Response({**search_result_cache.stats(), 'tokenizer': token_cache_stats()}, status=status.HTTP_200_OK)
@@ -0,0 +1,22 @@
+import logging
+import time
+from django.conf import settings
+from .tokenizer import initialize
+
+logger = logging.getLogger(__name__)
+
+
+def warmup():
+    """
+    启动预热：在 worker 启动时完成耗时的初始化，而不是由第一个请求承担
+    - 加载 jieba 词典（序列化缓存 + 领域词典）
+    - LAZY_LOAD_SKLEARN 为 False 时导入 scikit-learn
+    :return: {步骤: 耗时（秒）}
+    """
+    timings = {'jieba': initialize()}
+    if not getattr(settings, 'LAZY_LOAD_SKLEARN', True):
+        start = time.perf_counter()
+        import sklearn.feature_extraction.text  # noqa: F401
+        timings['sklearn'] = time.perf_counter() - start
+    logger.info("startup warmup: %s", ", ".join(f"{step} {elapsed:.3f}s" for step, elapsed in timings.items()))
+    return timings
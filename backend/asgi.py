@@ -23,3 +23,7 @@ application = ProtocolTypeRouter({
         )
     ),
 })
+
+# 后台线程池中的任务随进程退出丢失，服务进程启动时补跑积压和中断的任务
+from apps.sales.jobs import resume_on_startup
+resume_on_startup()
@@ -118,6 +118,10 @@ DATABASES = {
         'HOST': env['Database']['host'],
         'PORT': env['Database']['port'],
         'OPTIONS': {'charset': 'utf8mb4'},
+        # 持久连接：聊天线程池中的线程长期存在，每个线程复用自己的连接，不必每次查询重新连接
+        # 取值小于 MySQL 的 wait_timeout；复用前先检查连接是否可用
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     },
 } if os.getenv('DEPLOY')!=None else {
     'default': {
@@ -194,6 +198,88 @@ if os.getenv('DEPLOY')!=None and os.path.isfile('config/config.json'):
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/opt/tmp/media'  
 
+# 后台任务配置（匹配通知、推荐索引更新）
+# 测试中请求处在未提交的事务里，后台线程读不到数据，因此同步执行
+TESTING = 'test' in sys.argv or 'pytest' in sys.modules
+BACKGROUND_TASKS_EAGER = TESTING or os.getenv('BACKGROUND_TASKS_EAGER') is not None
+MATCH_JOB_WORKERS = int(os.getenv('MATCH_JOB_WORKERS', 2))
+# 执行超过该时间（秒）仍处于 running 的任务视为中断，重新执行
+MATCH_JOB_TIMEOUT = int(os.getenv('MATCH_JOB_TIMEOUT', 600))
+# 服务进程（asgi/wsgi）启动时在后台补跑积压的匹配任务，管理命令不补跑
+MATCH_JOBS_RESUME_ON_STARTUP = not TESTING and os.getenv('MATCH_JOBS_RESUME_ON_STARTUP', '1') != '0'
+# 推荐模型定期全量重新拟合的间隔（秒）
+RECOMMENDATION_REFIT_INTERVAL = int(os.getenv('RECOMMENDATION_REFIT_INTERVAL', 600))
+# 首页推荐最多返回的物品数，只取相似度最高的这些物品
+RECOMMENDATION_MAX_RESULTS = int(os.getenv('RECOMMENDATION_MAX_RESULTS', 500))
+
+# 搜索后端：auto 按数据库选择（SQLite 使用 FTS5，MySQL 使用 ngram 全文索引，其他数据库使用 bm25）
+# 也可指定 token（ItemToken 倒排索引，不排序）、bm25（倒排索引 + 进程内 BM25 排序）、fts5、mysql_fulltext
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+# bm25 后端的进程内索引从数据库全量重建的间隔（秒），期间只增量更新本进程内的变化
+SEARCH_INDEX_REBUILD_INTERVAL = int(os.getenv('SEARCH_INDEX_REBUILD_INTERVAL', 600))
+
+# jieba 前缀词典的序列化缓存文件，未设置时使用 jieba 默认位置（系统临时目录下的 jieba.cache）
+JIEBA_CACHE_FILE = os.getenv('JIEBA_CACHE_FILE')
+# 领域词典（课程名等），在默认词典之后加载
+JIEBA_USER_DICT = os.getenv('JIEBA_USER_DICT', os.path.join(BASE_DIR, 'apps', 'sales', 'jieba_dict.txt'))
+# 由 build_jieba_dict 命令从物品、需求和课程表生成的词典；测试中不加载，保证分词结果固定
+JIEBA_CATALOG_DICT = None if TESTING else os.getenv('JIEBA_CATALOG_DICT', os.path.join(BASE_DIR, 'jieba_catalog_dict.txt'))
+# 上次按词典重建索引时词典的摘要；start.sh 中 rebuild_search_index --if-dictionary-changed 据此判断是否需要重建
+SEARCH_INDEX_DICT_STAMP = None if TESTING else os.getenv('SEARCH_INDEX_DICT_STAMP', os.path.join(BASE_DIR, 'search_index_dict.stamp'))
+# 每隔多少秒检查词典文件是否变化，变化时重新加载
+JIEBA_DICT_CHECK_INTERVAL = int(os.getenv('JIEBA_DICT_CHECK_INTERVAL', 30))
+# 分词结果 LRU 缓存的最大条目数，以及参与缓存的最长文本
+TOKENIZER_CACHE_SIZE = int(os.getenv('TOKENIZER_CACHE_SIZE', 10000))
+TOKENIZER_CACHE_MAX_TEXT_LENGTH = int(os.getenv('TOKENIZER_CACHE_MAX_TEXT_LENGTH', 200))
+# 启动时预热（加载 jieba 词典等），避免第一个请求承担加载时间；测试中按需加载
+STARTUP_WARMUP = not TESTING and os.getenv('STARTUP_WARMUP', '1') != '0'
+# 为 True 时 scikit-learn 在第一次计算推荐时才导入，为 False 时在启动预热中导入
+LAZY_LOAD_SKLEARN = os.getenv('LAZY_LOAD_SKLEARN', '1') != '0'
+
+# 关键词搜索结果缓存：结果超过该数量的查询不缓存
+SEARCH_CACHE_MAX_RESULTS = int(os.getenv('SEARCH_CACHE_MAX_RESULTS', 1000))
+
+# 聊天连接时发送的最近消息数，以及 load_more 每次最多返回的消息数
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 50))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_MAX_PAGE_SIZE', 200))
+
+# 聊天消息的写入方式：strict 为每条消息先写入数据库再广播；
+# batched 为先广播，消息攒够 CHAT_BATCH_SIZE 条或等待 CHAT_BATCH_INTERVAL 秒后批量写入，
+# 广播的消息没有 message_id，进程异常退出（如 kill -9）时可能丢失最近 CHAT_BATCH_INTERVAL 秒内的消息
+CHAT_PERSISTENCE_MODE = os.getenv('CHAT_PERSISTENCE_MODE', 'strict')
+CHAT_BATCH_SIZE = int(os.getenv('CHAT_BATCH_SIZE', 100))
+CHAT_BATCH_INTERVAL = float(os.getenv('CHAT_BATCH_INTERVAL', 0.005))
+# 批量写入失败后重试的等待时间（秒），连续失败时加倍，不超过 CHAT_BATCH_RETRY_MAX_DELAY
+CHAT_BATCH_RETRY_DELAY = float(os.getenv('CHAT_BATCH_RETRY_DELAY', 0.5))
+CHAT_BATCH_RETRY_MAX_DELAY = float(os.getenv('CHAT_BATCH_RETRY_MAX_DELAY', 30))
+# 聊天 consumer 执行数据库操作的线程数，每个线程一个数据库连接；0 表示使用 sync_to_async 默认的单个线程
+# 测试中数据在主线程的事务中，必须为 0
+CHAT_DB_THREADS = 0 if TESTING else int(os.getenv('CHAT_DB_THREADS', 8))
+
+# 缓存配置，recommendation 用于按用户缓存首页推荐结果，search 用于缓存关键词搜索结果
+# LocMemCache 按最近使用淘汰（LRU）
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recommendation': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendation',
+        'TIMEOUT': int(os.getenv('RECOMMENDATION_CACHE_TTL', 300)),  # 过期时间（秒）
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RECOMMENDATION_CACHE_SIZE', 1000)),  # 最多缓存的用户数
+        },
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search',
+        'TIMEOUT': int(os.getenv('SEARCH_CACHE_TTL', 120)),  # 过期时间（秒）
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('SEARCH_CACHE_SIZE', 500)),  # 最多缓存的查询数
+        },
+    },
+}
+
 # settings.py
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
@@ -1,5 +1,7 @@
 #!/bin/sh
 python3 manage.py makemigrations backend, apps
 python3 manage.py migrate
+# 词典变化后已有的索引和保存的分词需要按新词典重新计算，词典未变化时跳过
+python3 manage.py rebuild_search_index --if-dictionary-changed
 
 daphne backend.asgi:application -b 0.0.0.0 -p 80
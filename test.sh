@@ -1,4 +1,4 @@
-coverage run --source backend,apps -m pytest apps/accounts/tests.py apps/sales/test_need.py apps/chat/tests.py apps/sales/test_purchase.py apps/sales/tests.py apps/sales/test_schedule.py apps/sales/test_location.py apps/sales/test_send_system_notification.py --junit-xml=xunit-reports/xunit-result.xml
+coverage run --source backend,apps -m pytest apps/accounts/tests.py apps/sales/test_need.py apps/chat/tests.py apps/sales/test_purchase.py apps/sales/tests.py apps/sales/test_schedule.py apps/sales/test_location.py apps/sales/test_send_system_notification.py apps/sales/test_search_index.py apps/sales/test_matching.py apps/sales/test_match_jobs.py apps/sales/test_recommendation.py apps/sales/test_pagination.py apps/sales/test_item_detail.py apps/sales/test_search_backends.py apps/sales/test_ranking.py apps/sales/test_search_cache.py apps/sales/test_warmup.py apps/sales/test_dictionary.py apps/sales/test_tokenizer.py apps/sales/test_fuzzy_search.py --junit-xml=xunit-reports/xunit-result.xml
 ret=$?
 coverage xml -o coverage-reports/coverage.xml
 coverage report